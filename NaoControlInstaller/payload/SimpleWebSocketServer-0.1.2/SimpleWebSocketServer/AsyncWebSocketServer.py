@@ -0,0 +1,272 @@
+'''
+The MIT License (MIT)
+Copyright (c) 2013 Dave P.
+
+asyncio engine for SimpleWebSocketServer (Python 3.7+ only).
+
+The same WebSocket subclasses run unchanged: the connections are driven by
+the asyncio event loop instead of serveforever() and the frame handling is
+shared with the select based server. Hooks may also be defined with
+async def, and call_later() and call_every() schedule their callbacks
+(coroutines included) on the asyncio loop.
+'''
+import asyncio
+import functools
+import inspect
+
+from .SimpleWebSocketServer import (SimpleWebSocketServer, EVENT_READ,
+                                    EVENT_WRITE, TIMER_TICK, _clock, _get_ident,
+                                    _monotonic)
+
+__all__ = ['AsyncWebSocketServer', 'AsyncioPoller']
+
+
+def _currentLoop():
+   try:
+      return asyncio.get_running_loop()
+   except RuntimeError:
+      loop = asyncio.new_event_loop()
+      asyncio.set_event_loop(loop)
+      return loop
+
+
+def _hookMethod(name, hook):
+   def method(self):
+      self.server._scheduleHook(self, name, hook)
+   method.__name__ = name
+   return method
+
+
+def _dispatchScheduled(self):
+   # handleMessage only schedules the coroutine, _runHook times the run
+   self.lastmessage = self.server.now
+   self.handleMessage()
+
+
+def _asyncClass(websocketclass):
+   # coroutine hooks are replaced in a derived class by methods that
+   # schedule them on the loop, which keeps a slotted class free of __dict__
+   namespace = {'__slots__': (), '__module__': websocketclass.__module__}
+   for name in ('handleConnected', 'handleMessage', 'handleClose'):
+      hook = getattr(websocketclass, name)
+      if asyncio.iscoroutinefunction(hook):
+         namespace[name] = _hookMethod(name, hook)
+         if name == 'handleMessage':
+            namespace['_dispatchMessage'] = _dispatchScheduled
+   if len(namespace) == 2:
+      return websocketclass
+   return type(websocketclass.__name__, (websocketclass,), namespace)
+
+
+class AsyncioPoller(object):
+   """
+       Poller interface on top of an asyncio loop: interest changes become
+       add_reader/add_writer calls and readiness is reported to dispatch.
+   """
+   edge = False
+
+   def __init__(self, loop, dispatch):
+      self.loop = loop
+      self.dispatch = dispatch
+      self.events = {}
+
+   def register(self, fd, events):
+      self.modify(fd, events)
+
+   def modify(self, fd, events):
+      old = self.events.get(fd, 0)
+      if events & EVENT_READ and not old & EVENT_READ:
+         self.loop.add_reader(fd, self.dispatch, fd, EVENT_READ)
+      elif old & EVENT_READ and not events & EVENT_READ:
+         self.loop.remove_reader(fd)
+      if events & EVENT_WRITE and not old & EVENT_WRITE:
+         self.loop.add_writer(fd, self.dispatch, fd, EVENT_WRITE)
+      elif old & EVENT_WRITE and not events & EVENT_WRITE:
+         self.loop.remove_writer(fd)
+      self.events[fd] = events
+
+   def unregister(self, fd):
+      self.modify(fd, 0)
+      del self.events[fd]
+
+   def close(self):
+      for fd in list(self.events):
+         self.unregister(fd)
+
+
+class AsyncWebSocketServer(SimpleWebSocketServer):
+   """
+       WebSocket server running on an asyncio event loop.
+
+       handleConnected, handleMessage and handleClose may be plain methods
+       or coroutines. Coroutine hooks of a connection run one after another
+       in arrival order; self.opcode and self.data hold their own message
+       until the first await, copy them if they are needed afterwards.
+   """
+   def __init__(self, host, port, websocketclass, loop = None, deflate = None,
+                webroot = None):
+      """
+          loop defaults to the running loop, or a new one when called
+          outside of a coroutine.
+      """
+      if loop is None:
+         loop = _currentLoop()
+      self.loop = loop
+      SimpleWebSocketServer.__init__(self, host, port, websocketclass,
+                                     poller = AsyncioPoller(loop, self._handleEvents),
+                                     deflate = deflate, webroot = webroot)
+      # client -> last scheduled coroutine hook
+      self.hooktasks = {}
+      # client -> futures waiting for its send queue to drain
+      self.drainers = {}
+      self.timers = set()
+      self.closed = loop.create_future()
+      # keepalive timer wheel, ticked from the loop
+      self.call_every(TIMER_TICK, self._advanceWheel)
+
+   def call_later(self, delay, callback, *args):
+      """
+          Run callback(*args) once after delay seconds. A coroutine
+          function is run as a task. Returns an asyncio.TimerHandle.
+      """
+      return self.loop.call_later(delay, self._invoke, callback, args,
+                                  self.loop.time() + delay)
+
+   def call_every(self, interval, callback, *args):
+      """
+          Run callback(*args) every interval seconds until the server is
+          closed or the returned task is cancelled. Coroutines are awaited
+          before the next run; ticks missed meanwhile are skipped.
+      """
+      task = self.loop.create_task(self._every(interval, callback, args))
+      self.timers.add(task)
+      task.add_done_callback(self.timers.discard)
+      return task
+
+   async def drain(self, client):
+      """
+          Wait until everything queued for client has been written.
+      """
+      if not client.sendq:
+         return
+      waiter = self.loop.create_future()
+      self.drainers.setdefault(client, []).append(waiter)
+      await waiter
+
+   async def serve(self):
+      """
+          Serve until close() is called.
+      """
+      self.loopident = _get_ident()
+      await asyncio.shield(self.closed)
+
+   def serveonce(self):
+      # run a single iteration of the loop
+      self.loopident = _get_ident()
+      self.loop.call_soon(self.loop.stop)
+      self.loop.run_forever()
+
+   def serveforever(self):
+      self.loop.run_until_complete(self.serve())
+
+   def close(self):
+      super(AsyncWebSocketServer, self).close()
+      for task in list(self.timers):
+         task.cancel()
+      if not self.closed.done():
+         self.closed.set_result(None)
+
+   def _listenerClass(self, websocketclass):
+      return _asyncClass(super(AsyncWebSocketServer, self)._listenerClass(websocketclass))
+
+   def _handleEvents(self, fileno, events):
+      # there is no iteration of our own, loop_time counts each callback
+      start = _clock()
+      self.now = _monotonic()
+      super(AsyncWebSocketServer, self)._handleEvents(fileno, events)
+      self.looptime.add(_clock() - start)
+
+   def _advanceWheel(self):
+      self.now = _monotonic()
+      self.wheel.advance(self.now)
+
+   def _callSoon(self, func, *args):
+      self.loop.call_soon_threadsafe(func, *args)
+
+   def _scheduleHook(self, client, name, hook):
+      previous = self.hooktasks.get(client)
+      task = self.loop.create_task(
+         self._runHook(previous, client, name, hook, client.opcode, client.data))
+      self.hooktasks[client] = task
+      task.add_done_callback(functools.partial(self._hookDone, client))
+
+   def _hookDone(self, client, task):
+      if self.hooktasks.get(client) is task:
+         del self.hooktasks[client]
+
+   async def _runHook(self, previous, client, name, hook, opcode, data):
+      if previous is not None:
+         await asyncio.wait([previous])
+      client.opcode = opcode
+      client.data = data
+      start = _clock()
+      try:
+         await hook(client)
+      except Exception as n:
+         # as with plain hooks, a failing message handler drops the client
+         if name != 'handleClose':
+            self._dropClient(client)
+      else:
+         if name == 'handleMessage':
+            client._recordHandler(_clock() - start)
+
+   def _dropClient(self, client):
+      for fileno, other in list(self.connections.items()):
+         if other is client:
+            self._removeClient(fileno)
+
+   def _invoke(self, callback, args, due):
+      self.timerlateness.add(self.loop.time() - due)
+      result = callback(*args)
+      if inspect.isawaitable(result):
+         task = asyncio.ensure_future(result, loop = self.loop)
+         self.timers.add(task)
+         task.add_done_callback(self.timers.discard)
+
+   async def _every(self, interval, callback, args):
+      deadline = self.loop.time()
+      while True:
+         deadline += interval
+         await asyncio.sleep(max(0.0, deadline - self.loop.time()))
+         self.timerlateness.add(self.loop.time() - deadline)
+         try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+               await result
+         except Exception as e:
+            self.loop.call_exception_handler({
+               'message': 'exception in periodic callback %r' % (callback,),
+               'exception': e})
+         now = self.loop.time()
+         if now - deadline > interval:
+            deadline = now
+
+   def _flushClient(self, fileno, client):
+      super(AsyncWebSocketServer, self)._flushClient(fileno, client)
+      if not client.sendq:
+         self._wakeDrainers(client, None)
+
+   def _removeClient(self, fileno):
+      client = self.connections.get(fileno)
+      super(AsyncWebSocketServer, self)._removeClient(fileno)
+      if client is not None:
+         self._wakeDrainers(client, ConnectionError('websocket closed'))
+
+   def _wakeDrainers(self, client, error):
+      for waiter in self.drainers.pop(client, ()):
+         if waiter.done():
+            continue
+         if error is None:
+            waiter.set_result(None)
+         else:
+            waiter.set_exception(error)
@@ -6,26 +6,54 @@ import sys
 VER = sys.version_info[0]
 if VER >= 3:
     import socketserver
-    from http.server import BaseHTTPRequestHandler
-    from io import StringIO, BytesIO
+    from queue import Queue
+    from urllib.parse import unquote
 else:
     import SocketServer
-    from BaseHTTPServer import BaseHTTPRequestHandler
-    from StringIO import StringIO
+    from Queue import Queue
+    from urllib import unquote
 
 import hashlib
 import base64
+import json
+import binascii
 import socket
 import struct
 import ssl
 import errno
 import codecs
+import email.utils
+import heapq
+import mimetypes
+import os
+import select
+import threading
+import time
+import traceback
+import zlib
 from collections import deque
-from select import select
+
+try:
+    from threading import get_ident as _get_ident
+except ImportError:
+    from thread import get_ident as _get_ident
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
 
 __all__ = ['WebSocket',
             'SimpleWebSocketServer',
-            'SimpleSSLWebSocketServer']
+            'SimpleSSLWebSocketServer',
+            'SelectPoller',
+            'PollPoller',
+            'EpollPoller',
+            'DeflateOptions',
+            'Histogram',
+            'QUEUE_BLOCK',
+            'QUEUE_DROP_OLDEST',
+            'QUEUE_CONFLATE']
 
 def _check_unicode(val):
     if VER >= 3:
@@ -33,15 +61,61 @@ def _check_unicode(val):
     else:
         return isinstance(val, basestring)
 
-class HTTPRequest(BaseHTTPRequestHandler):
+class HTTPHeaders(dict):
+   """
+       Header fields of the handshake request. Names are looked up without
+       regard to case and a missing field reads as None, as it did with the
+       email.message.Message of BaseHTTPRequestHandler. Repeated fields are
+       joined with commas (RFC 7230 3.2.2).
+   """
+   def __getitem__(self, name):
+      return dict.get(self, name.lower())
+
+   def __contains__(self, name):
+      return dict.__contains__(self, name.lower())
+
+   def get(self, name, default = None):
+      return dict.get(self, name.lower(), default)
+
+
+class HTTPRequest(object):
+   """
+       Request line and header fields of the opening handshake, or of a
+       plain HTTP request for the webroot. Only GET and HEAD are accepted;
+       the attributes keep the names BaseHTTPRequestHandler used.
+   """
    def __init__(self, request_text):
       if VER >= 3:
-          self.rfile = BytesIO(request_text)
+         text = request_text.decode('latin-1')
       else:
-          self.rfile = StringIO(request_text)
-      self.raw_requestline = self.rfile.readline()
-      self.error_code = self.error_message = None
-      self.parse_request()
+         text = str(request_text)
+      lines = text.split('\r\n')
+      words = lines[0].split()
+      if len(words) != 3:
+         raise ValueError('bad request line: %r' % lines[0][:80])
+      self.command, self.path, self.request_version = words
+      if (self.command not in ('GET', 'HEAD') or
+            not self.request_version.startswith('HTTP/1.')):
+         raise ValueError('unsupported request: %r' % lines[0][:80])
+
+      self.headers = HTTPHeaders()
+      name = None
+      for line in lines[1:]:
+         if not line:
+            continue
+         if line[0] in ' \t' and name is not None:
+            # obsolete line folding, continues the previous value
+            dict.__setitem__(self.headers, name,
+                             self.headers[name] + ' ' + line.strip())
+            continue
+         name, sep, value = line.partition(':')
+         if not sep:
+            raise ValueError('bad header line: %r' % line[:80])
+         name = name.strip().lower()
+         value = value.strip()
+         if name in self.headers:
+            value = self.headers[name] + ', ' + value
+         dict.__setitem__(self.headers, name, value)
 
 _VALID_STATUS_CODES = [1000, 1001, 1002, 1003, 1007, 1008,
                         1009, 1010, 1011, 3000, 3999, 4000, 4999]
@@ -50,7 +124,8 @@ HANDSHAKE_STR = (
    "HTTP/1.1 101 Switching Protocols\r\n"
    "Upgrade: WebSocket\r\n"
    "Connection: Upgrade\r\n"
-   "Sec-WebSocket-Accept: %(acceptstr)s\r\n\r\n"
+   "Sec-WebSocket-Accept: %(acceptstr)s\r\n"
+   "%(extensions)s\r\n"
 )
 
 FAILED_HANDSHAKE_STR = (
@@ -62,6 +137,11 @@ FAILED_HANDSHAKE_STR = (
    "This service requires use of the WebSocket protocol\r\n"
 )
 
+HTTP_RESPONSE_STR = (
+   "HTTP/1.1 %(status)s\r\n"
+   "%(headers)s\r\n"
+)
+
 GUID_STR = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
 
 STREAM = 0x0
@@ -70,52 +150,1038 @@ BINARY = 0x2
 CLOSE = 0x8
 PING = 0x9
 PONG = 0xA
-
-HEADERB1 = 1
-HEADERB2 = 3
-LENGTHSHORT = 4
-LENGTHLONG = 5
-MASK = 6
-PAYLOAD = 7
+# pseudo opcode for raw bytes queued outside of a frame (HTTP handshake)
+RAW = -1
+# pseudo opcode for a file sent from the webroot behind its HTTP header
+FILE = -2
+
+# what a connection does when its send queue exceeds sendqmaxbytes/frames:
+#  block       keep every frame but stop reading from the client until the
+#              queue drains (back-pressure on request/reply traffic)
+#  drop-oldest discard the oldest complete messages that were not started yet
+#  conflate    a keyed message replaces the queued one with the same key,
+#              overflow is then handled as drop-oldest
+QUEUE_BLOCK = 'block'
+QUEUE_DROP_OLDEST = 'drop-oldest'
+QUEUE_CONFLATE = 'conflate'
+
+# shared by the connections that have nothing queued
+_NOQUEUE = ()
 
 MAXHEADER = 65536
 MAXPAYLOAD = 33554432
 
+RECVSIZE = 16384
+
+# most buffers handed to a single sendmsg call, well below IOV_MAX
+MAXIOV = 512
+
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+HAS_SENDFILE = hasattr(os, 'sendfile')
+
+# most bytes of a file written per attempt
+FILECHUNK = 262144
+
+# payloads at least this large are unmasked with numpy when it is available
+NUMPY_UNMASK_MIN = 4096
+
+if VER >= 3:
+    def _xor_bytes(data, key):
+        return (int.from_bytes(data, 'big') ^
+                int.from_bytes(key, 'big')).to_bytes(len(data), 'big')
+else:
+    def _xor_bytes(data, key):
+        value = int(binascii.hexlify(data), 16) ^ int(binascii.hexlify(key), 16)
+        return binascii.unhexlify('%0*x' % (len(data) * 2, value))
+
+def _frameHeader(fin, opcode, length, rsv = 0):
+    b1 = opcode | rsv
+    if fin is False:
+        b1 |= 0x80
+
+    if length <= 125:
+        return struct.pack('!BB', b1, length)
+    elif length <= 65535:
+        return struct.pack('!BBH', b1, 126, length)
+    else:
+        return struct.pack('!BBQ', b1, 127, length)
+
+def _unmask(mask, data):
+    """
+        Unmask a whole payload in one step instead of byte by byte.
+        mask is the 4 byte masking key, data any buffer holding the payload.
+    """
+    length = len(data)
+    if length == 0:
+        return bytearray()
+    if _np is not None and length >= NUMPY_UNMASK_MIN:
+        if isinstance(data, memoryview):
+            # NumPy on Python 2 does not take a memoryview
+            data = _asbytes(data)
+        payload = _np.frombuffer(data, dtype=_np.uint8)
+        key = _np.resize(_np.frombuffer(mask, dtype=_np.uint8), length)
+        return bytearray(_np.bitwise_xor(payload, key).tobytes())
+    key = (mask * (length // 4 + 1))[:length]
+    return bytearray(_xor_bytes(data, key))
+
+def _unmaskInPlace(mask, buff, pos, length):
+    """
+        Unmask buff[pos:pos + length] where it lies, buff being the
+        bytearray the frame was parsed from.
+    """
+    if length == 0:
+        return
+    if _np is not None and length >= NUMPY_UNMASK_MIN:
+        payload = _np.frombuffer(buff, dtype=_np.uint8, count=length, offset=pos)
+        key = _np.resize(_np.frombuffer(mask, dtype=_np.uint8), length)
+        _np.bitwise_xor(payload, key, out=payload)
+        return
+    key = (mask * (length // 4 + 1))[:length]
+    buff[pos:pos + length] = _xor_bytes(memoryview(buff)[pos:pos + length], key)
+
+if VER >= 3:
+    def _asbytes(data):
+        # decoders and zlib take any buffer
+        return data
+else:
+    def _asbytes(data):
+        # memoryview slices of the parse buffer are not accepted everywhere
+        return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+
+# what self.data is left at between frames, drops the view of the parse buffer
+_NODATA = b''
+
+EVENT_READ = 1
+EVENT_WRITE = 2
+EVENT_ERROR = 4
+
+class SelectPoller(object):
+   """
+       Readiness backend built on select(). Portable, but costs O(n) per call
+       and is limited to FD_SETSIZE descriptors.
+   """
+   edge = False
+
+   def __init__(self):
+      self.readers = set()
+      self.writers = set()
+
+   def register(self, fd, events):
+      self.modify(fd, events)
+
+   def modify(self, fd, events):
+      if events & EVENT_READ:
+         self.readers.add(fd)
+      else:
+         self.readers.discard(fd)
+      if events & EVENT_WRITE:
+         self.writers.add(fd)
+      else:
+         self.writers.discard(fd)
+
+   def unregister(self, fd):
+      self.readers.discard(fd)
+      self.writers.discard(fd)
+
+   def poll(self, timeout):
+      rList, wList, xList = select.select(self.readers, self.writers,
+                                          self.readers, timeout)
+      ready = {}
+      for fd in rList:
+         ready[fd] = EVENT_READ
+      for fd in wList:
+         ready[fd] = ready.get(fd, 0) | EVENT_WRITE
+      for fd in xList:
+         ready[fd] = ready.get(fd, 0) | EVENT_ERROR
+      return ready.items()
+
+   def close(self):
+      self.readers.clear()
+      self.writers.clear()
+
+class PollPoller(object):
+   """
+       Level-triggered readiness backend built on poll(). No FD_SETSIZE
+       ceiling and the interest set is kept in the kernel call arguments.
+   """
+   edge = False
+
+   def __init__(self):
+      self.poller = select.poll()
+
+   def _mask(self, events):
+      mask = 0
+      if events & EVENT_READ:
+         mask |= select.POLLIN | select.POLLPRI
+      if events & EVENT_WRITE:
+         mask |= select.POLLOUT
+      return mask
+
+   def register(self, fd, events):
+      self.poller.register(fd, self._mask(events))
+
+   def modify(self, fd, events):
+      self.poller.modify(fd, self._mask(events))
+
+   def unregister(self, fd):
+      self.poller.unregister(fd)
+
+   def poll(self, timeout):
+      if timeout is not None:
+         # rounded up: waking before a timer deadline would spin until it
+         timeout = int(timeout * 1000 + 0.999)
+      ready = []
+      for fd, mask in self.poller.poll(timeout):
+         events = 0
+         # a hang up is reported as readable so the EOF is read and handled
+         if mask & (select.POLLIN | select.POLLPRI | select.POLLHUP):
+            events |= EVENT_READ
+         if mask & select.POLLOUT:
+            events |= EVENT_WRITE
+         if mask & (select.POLLERR | select.POLLNVAL):
+            events |= EVENT_ERROR
+         ready.append((fd, events))
+      return ready
+
+   def close(self):
+      self.poller = None
+
+class EpollPoller(object):
+   """
+       Edge-triggered readiness backend built on epoll (Linux only). Each
+       readiness change is reported once, so readers must drain the socket.
+   """
+   edge = True
+
+   def __init__(self):
+      self.poller = select.epoll()
+
+   def _mask(self, events):
+      mask = select.EPOLLET
+      if events & EVENT_READ:
+         mask |= select.EPOLLIN | select.EPOLLPRI
+      if events & EVENT_WRITE:
+         mask |= select.EPOLLOUT
+      return mask
+
+   def register(self, fd, events):
+      self.poller.register(fd, self._mask(events))
+
+   def modify(self, fd, events):
+      self.poller.modify(fd, self._mask(events))
+
+   def unregister(self, fd):
+      self.poller.unregister(fd)
+
+   def poll(self, timeout):
+      if timeout is None:
+         timeout = -1
+      elif VER < 3:
+         # Python 2 truncates to whole milliseconds, which wakes up short of
+         # a timer deadline and polls again with a zero timeout until it
+         timeout = int(timeout * 1000 + 0.999) / 1000.0 + 0.0001
+      ready = []
+      for fd, mask in self.poller.poll(timeout):
+         events = 0
+         if mask & (select.EPOLLIN | select.EPOLLPRI | select.EPOLLHUP):
+            events |= EVENT_READ
+         if mask & select.EPOLLOUT:
+            events |= EVENT_WRITE
+         if mask & select.EPOLLERR:
+            events |= EVENT_ERROR
+         ready.append((fd, events))
+      return ready
+
+   def close(self):
+      self.poller.close()
+
+POLLERS = {
+   'select': SelectPoller,
+   'poll': PollPoller,
+   'epoll': EpollPoller,
+}
+
+def _setNonBlocking(fd):
+   # fcntl is POSIX only, elsewhere the loop is not woken up early
+   import fcntl
+   flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+   fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+class _Waker(object):
+   """
+       Makes the server loop return from poll() when another thread hands
+       it work: an eventfd where available (Linux, Python 3.10+), a
+       self-pipe otherwise.
+   """
+   def __init__(self):
+      if hasattr(os, 'eventfd'):
+         self.fd = self.wfd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+      else:
+         self.fd, self.wfd = os.pipe()
+         _setNonBlocking(self.fd)
+         _setNonBlocking(self.wfd)
+
+   def wake(self):
+      try:
+         if self.fd == self.wfd:
+            os.eventfd_write(self.fd, 1)
+         else:
+            os.write(self.wfd, b'\0')
+      except OSError as e:
+         # a full pipe already guarantees a wakeup
+         if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+            raise e
+
+   def drain(self):
+      try:
+         if self.fd == self.wfd:
+            os.eventfd_read(self.fd)
+         else:
+            while os.read(self.fd, 4096):
+               pass
+      except OSError as e:
+         if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+            raise e
+
+   def close(self):
+      os.close(self.fd)
+      if self.wfd != self.fd:
+         os.close(self.wfd)
+
+def _defaultPoller():
+   if hasattr(select, 'epoll'):
+      return 'epoll'
+   if hasattr(select, 'poll'):
+      return 'poll'
+   return 'select'
+
+RSV1 = 0x40
+
+# every deflate block flushed with Z_SYNC_FLUSH ends with this marker,
+# RFC 7692 strips it from the wire and the receiver appends it back
+_DEFLATE_TAIL = b'\x00\x00\xff\xff'
+
+_clock = getattr(time, 'perf_counter', time.time)
+_monotonic = getattr(time, 'monotonic', time.time)
+
+def _callbackFailed(callback):
+   """
+       Report a timer, scheduled, loop or reader callback that raised. The
+       loop keeps running, but a dead periodic task must not go unnoticed.
+   """
+   try:
+      sys.stderr.write('SimpleWebSocketServer: callback %r failed\n' % (callback,))
+      traceback.print_exc()
+   except Exception:
+      pass
+
+# timer wheel resolution in seconds and number of slots; a timer further
+# away than a full turn stays in its slot for the extra rounds
+TIMER_TICK = 0.1
+TIMER_SLOTS = 512
+
+class _Timer(object):
+   __slots__ = ('due', 'callback', 'args', 'slot')
+
+   def __init__(self, due, callback, args):
+      self.due = due
+      self.callback = callback
+      self.args = args
+      self.slot = None
+
+class _TimerWheel(object):
+   """
+       Hashed timer wheel: scheduling and cancelling are O(1), and each
+       tick only looks at the timers hashed to one slot.
+   """
+   def __init__(self, now, tick = TIMER_TICK, slots = TIMER_SLOTS):
+      self.tick = tick
+      self.slots = [set() for i in range(slots)]
+      self.current = int(now / tick)
+      self.count = 0
+
+   def __len__(self):
+      return self.count
+
+   def schedule(self, now, delay, callback, *args):
+      due = max(int((now + delay) / self.tick + 0.999999), self.current + 1)
+      timer = _Timer(due, callback, args)
+      timer.slot = self.slots[due % len(self.slots)]
+      timer.slot.add(timer)
+      self.count += 1
+      return timer
+
+   def cancel(self, timer):
+      if timer.slot is not None:
+         timer.slot.discard(timer)
+         timer.slot = None
+         self.count -= 1
+
+   def timeout(self, now, limit):
+      """
+          How long the loop may block without missing a tick.
+      """
+      if not self.count:
+         return limit
+      return max(0.0, min(limit, (self.current + 1) * self.tick - now))
+
+   def advance(self, now):
+      target = int(now / self.tick)
+      if target <= self.current:
+         return
+      # after a long stall every slot is visited once at most
+      steps = min(target - self.current, len(self.slots))
+      for step in range(1, steps + 1):
+         slot = self.slots[(self.current + step) % len(self.slots)]
+         if not slot:
+            continue
+         for timer in [t for t in slot if t.due <= target]:
+            slot.discard(timer)
+            timer.slot = None
+            self.count -= 1
+            try:
+               timer.callback(*timer.args)
+            except Exception as n:
+               _callbackFailed(timer.callback)
+      self.current = target
+
+class _ScheduledCall(object):
+   """
+       A callback scheduled with call_later() or call_every(); cancel()
+       unschedules it.
+   """
+   __slots__ = ('due', 'interval', 'callback', 'args', 'cancelled')
+
+   def __init__(self, due, interval, callback, args):
+      self.due = due
+      self.interval = interval
+      self.callback = callback
+      self.args = args
+      self.cancelled = False
+
+   def cancel(self):
+      self.cancelled = True
+
+class DeflateOptions(object):
+   """
+       Server settings for the permessage-deflate extension (RFC 7692).
+
+       server_no_context_takeover: reset the compressor after every message.
+       client_no_context_takeover: ask clients to reset theirs, which lets the
+          server drop the decompressor history between messages.
+       server_max_window_bits / client_max_window_bits: LZ77 window (9-15)
+          used by the server and requested from clients.
+       mem_level: zlib memLevel (1-9) of the compressor.
+       level: zlib compression level.
+       min_size: messages shorter than this are sent uncompressed.
+
+       Per connection the compressor holds about
+       2^(server_max_window_bits + 2) + 2^(mem_level + 9) bytes and the
+       decompressor 2^client_max_window_bits bytes, so the window bits and
+       mem_level are the memory caps.
+   """
+   def __init__(self, server_no_context_takeover = False,
+                client_no_context_takeover = False,
+                server_max_window_bits = 15, client_max_window_bits = 15,
+                mem_level = 8, level = 6, min_size = 16):
+      self.server_no_context_takeover = server_no_context_takeover
+      self.client_no_context_takeover = client_no_context_takeover
+      self.server_max_window_bits = server_max_window_bits
+      self.client_max_window_bits = client_max_window_bits
+      self.mem_level = mem_level
+      self.level = level
+      self.min_size = min_size
+
+   def negotiate(self, header, stats):
+      """
+          Pick the first acceptable permessage-deflate offer in a
+          Sec-WebSocket-Extensions header. Returns the response header value
+          and the per connection context, or (None, None).
+      """
+      for offer in header.split(','):
+         params = [p.strip() for p in offer.split(';')]
+         if params[0] != 'permessage-deflate':
+            continue
+
+         server_nct = self.server_no_context_takeover
+         client_nct = self.client_no_context_takeover
+         server_bits = self.server_max_window_bits
+         client_bits = 15
+         client_bits_offered = False
+         valid = True
+
+         for param in params[1:]:
+            name, _, value = param.partition('=')
+            name = name.strip()
+            value = value.strip().strip('"')
+            try:
+               if name == 'server_no_context_takeover' and not value:
+                  server_nct = True
+               elif name == 'client_no_context_takeover' and not value:
+                  client_nct = True
+               elif name == 'server_max_window_bits':
+                  # zlib cannot produce raw deflate with an 8 bit window
+                  server_bits = min(server_bits, int(value))
+                  valid = 9 <= server_bits <= 15
+               elif name == 'client_max_window_bits':
+                  client_bits_offered = True
+                  if value:
+                     client_bits = int(value)
+                     valid = 8 <= client_bits <= 15
+               else:
+                  valid = False
+            except ValueError:
+               valid = False
+            if not valid:
+               break
+
+         if not valid:
+            continue
+
+         response = ['permessage-deflate']
+         if server_nct:
+            response.append('server_no_context_takeover')
+         if client_nct:
+            response.append('client_no_context_takeover')
+         if server_bits < 15:
+            response.append('server_max_window_bits=%d' % server_bits)
+         if client_bits_offered:
+            client_bits = min(client_bits, self.client_max_window_bits)
+            if client_bits < 15:
+               response.append('client_max_window_bits=%d' % client_bits)
+
+         context = _DeflateContext(self, server_nct, client_nct,
+                                   server_bits, client_bits, stats)
+         return '; '.join(response), context
+
+      return None, None
+
+class _DeflateContext(object):
+   """
+       Negotiated permessage-deflate state of one connection.
+   """
+   def __init__(self, options, server_nct, client_nct, server_bits, client_bits, stats):
+      self.options = options
+      self.server_nct = server_nct
+      self.client_nct = client_nct
+      # zlib rejects a raw inflate window of 8 bits, 9 decodes it as well
+      self.server_bits = server_bits
+      self.client_bits = max(client_bits, 9)
+      self.stats = stats
+      self.compressor = None
+      self.decompressor = None
+      self.inflated = 0
+
+   def compress(self, data):
+      start = _clock()
+      if self.compressor is None:
+         self.compressor = zlib.compressobj(self.options.level, zlib.DEFLATED,
+                                            -self.server_bits, self.options.mem_level)
+      out = self.compressor.compress(bytes(data)) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+      if out.endswith(_DEFLATE_TAIL):
+         out = out[:-4]
+      if self.server_nct:
+         self.compressor = None
+
+      stats = self.stats
+      stats.deflate_time += _clock() - start
+      stats.messages_out += 1
+      stats.bytes_out_raw += len(data)
+      stats.bytes_out_wire += len(out)
+      return out
+
+   def decompress(self, data, final, maxsize):
+      """
+          Inflate one frame of a compressed message. Fragments are fed as
+          they arrive, the flush marker is appended on the final one.
+      """
+      start = _clock()
+      if self.decompressor is None:
+         self.decompressor = zlib.decompressobj(-self.client_bits)
+      wire = len(data)
+      data = bytes(_asbytes(data))
+      if final:
+         data += _DEFLATE_TAIL
+      out = self.decompressor.decompress(data, maxsize - self.inflated + 1)
+      self.inflated += len(out)
+      if self.decompressor.unconsumed_tail or self.inflated >= maxsize:
+         raise Exception('payload exceeded allowable size')
+
+      stats = self.stats
+      stats.inflate_time += _clock() - start
+      stats.bytes_in_wire += wire
+      stats.bytes_in_raw += len(out)
+      if final:
+         stats.messages_in += 1
+         self.inflated = 0
+         if self.client_nct:
+            self.decompressor = None
+      return bytearray(out)
+
+class CompressionStats(object):
+   """
+       permessage-deflate counters aggregated over all connections.
+   """
+   def __init__(self):
+      self.messages_in = 0
+      self.messages_out = 0
+      self.bytes_in_wire = 0
+      self.bytes_in_raw = 0
+      self.bytes_out_raw = 0
+      self.bytes_out_wire = 0
+      self.deflate_time = 0.0
+      self.inflate_time = 0.0
+
+   def asDict(self):
+      return {
+         'messages_in': self.messages_in,
+         'messages_out': self.messages_out,
+         'bytes_in_wire': self.bytes_in_wire,
+         'bytes_in_raw': self.bytes_in_raw,
+         'bytes_out_raw': self.bytes_out_raw,
+         'bytes_out_wire': self.bytes_out_wire,
+         'ratio_in': float(self.bytes_in_raw) / self.bytes_in_wire if self.bytes_in_wire else None,
+         'ratio_out': float(self.bytes_out_raw) / self.bytes_out_wire if self.bytes_out_wire else None,
+         'deflate_cpu_s': self.deflate_time,
+         'inflate_cpu_s': self.inflate_time,
+         'deflate_us_per_msg': 1e6 * self.deflate_time / self.messages_out if self.messages_out else None,
+         'inflate_us_per_msg': 1e6 * self.inflate_time / self.messages_in if self.messages_in else None,
+      }
+
+# log2 buckets of the latency histograms: bucket i counts durations below
+# 2**i microseconds, the last one everything from about 35 minutes on
+HISTOGRAM_BUCKETS = 32
+
+class Histogram(object):
+   """
+       Durations in seconds on a log2 scale. Adding a sample costs a
+       multiplication and a bit_length(); percentiles are reported as the
+       upper bound of their bucket, so they are accurate within a factor 2.
+   """
+   __slots__ = ('counts', 'count', 'total', 'max')
+
+   def __init__(self):
+      self.counts = [0] * HISTOGRAM_BUCKETS
+      self.count = 0
+      self.total = 0.0
+      self.max = 0.0
+
+   def add(self, value):
+      index = int(value * 1000000.0).bit_length()
+      if index >= HISTOGRAM_BUCKETS:
+         index = HISTOGRAM_BUCKETS - 1
+      self.counts[index] += 1
+      self.count += 1
+      self.total += value
+      if value > self.max:
+         self.max = value
+
+   def merge(self, other):
+      for index, count in enumerate(other.counts):
+         self.counts[index] += count
+      self.count += other.count
+      self.total += other.total
+      self.max = max(self.max, other.max)
+
+   def percentile(self, fraction):
+      rank = fraction * self.count
+      seen = 0
+      for index, count in enumerate(self.counts):
+         seen += count
+         if count and seen >= rank:
+            return min((1 << index) / 1000000.0, self.max)
+      return self.max
+
+   def asDict(self):
+      if not self.count:
+         return {'count': 0}
+      return {'count': self.count,
+              'avg_ms': 1e3 * self.total / self.count,
+              'p50_ms': 1e3 * self.percentile(0.50),
+              'p95_ms': 1e3 * self.percentile(0.95),
+              'p99_ms': 1e3 * self.percentile(0.99),
+              'max_ms': 1e3 * self.max}
+
+class TransportStats(object):
+   """
+       Traffic counters and latency histograms of one connection or summed
+       over many. Connections count into their own slots on the hot path;
+       the server adds them up here when it is asked or when they close.
+   """
+   def __init__(self):
+      self.connections = 0
+      self.framesin = 0
+      self.bytesin = 0
+      self.framesout = 0
+      self.bytesout = 0
+      self.partialwrites = 0
+      self.sendqpeakframes = 0
+      self.sendqpeakbytes = 0
+      self.queuetime = Histogram()
+      self.handlertime = Histogram()
+
+   def add(self, source):
+      """
+          Add the counters of a WebSocket or of another TransportStats.
+      """
+      self.connections += getattr(source, 'connections', 1)
+      self.framesin += source.framesin
+      self.bytesin += source.bytesin
+      self.framesout += source.framesout
+      self.bytesout += source.bytesout
+      self.partialwrites += source.partialwrites
+      self.sendqpeakframes = max(self.sendqpeakframes, source.sendqpeakframes)
+      self.sendqpeakbytes = max(self.sendqpeakbytes, source.sendqpeakbytes)
+      if source.queuetime is not None:
+         self.queuetime.merge(source.queuetime)
+      if source.handlertime is not None:
+         self.handlertime.merge(source.handlertime)
+
+   def asDict(self):
+      return {
+         'connections': self.connections,
+         'frames_in': self.framesin,
+         'bytes_in': self.bytesin,
+         'frames_out': self.framesout,
+         'bytes_out': self.bytesout,
+         'partial_writes': self.partialwrites,
+         'sendq_peak_frames': self.sendqpeakframes,
+         'sendq_peak_bytes': self.sendqpeakbytes,
+         'queue_time': self.queuetime.asDict(),
+         'handler_time': self.handlertime.asDict(),
+      }
+
+# per thread state of the worker pool: the message a handler is processing
+_workerlocal = threading.local()
+
+def _messageProperty(name):
+   # self.data/self.opcode inside a worker refer to the message the worker
+   # runs, while the server loop keeps parsing into the connection's own slot
+   slot = '_' + name
+
+   def get(self):
+      if getattr(_workerlocal, 'client', None) is self:
+         return getattr(_workerlocal, name)
+      return getattr(self, slot)
+
+   def set(self, value):
+      if getattr(_workerlocal, 'client', None) is self:
+         setattr(_workerlocal, name, value)
+      else:
+         setattr(self, slot, value)
+
+   return property(get, set)
+
+class WorkerStats(object):
+   """
+       Queue wait and handler time of the worker pool, per message kind.
+   """
+   def __init__(self):
+      self.lock = threading.Lock()
+      # kind -> [count, wait total, wait max, run total, run max]
+      self.kinds = {}
+
+   def add(self, kind, wait, run):
+      with self.lock:
+         entry = self.kinds.get(kind)
+         if entry is None:
+            entry = self.kinds[kind] = [0, 0.0, 0.0, 0.0, 0.0]
+         entry[0] += 1
+         entry[1] += wait
+         entry[2] = max(entry[2], wait)
+         entry[3] += run
+         entry[4] = max(entry[4], run)
+
+   def asDict(self):
+      with self.lock:
+         return dict((kind, {'count': count,
+                             'wait_avg_ms': 1e3 * wait / count,
+                             'wait_max_ms': 1e3 * waitmax,
+                             'run_avg_ms': 1e3 * run / count,
+                             'run_max_ms': 1e3 * runmax})
+                     for kind, (count, wait, waitmax, run, runmax) in self.kinds.items())
+
+class WorkerPool(object):
+   """
+       Fixed set of threads running handleMessage away from the server
+       loop. Messages of a connection run one after another unless its
+       class sets workerordered = False; anything the handlers send is
+       handed back to the loop thread.
+   """
+   def __init__(self, server, size):
+      self.server = server
+      self.stats = WorkerStats()
+      self.lock = threading.Lock()
+      # jobs are (client, kind, opcode, data, queued at) or, for ordered
+      # connections, the client whose workq holds the next job
+      self.jobs = Queue()
+      self.threads = []
+      for i in range(size):
+         thread = threading.Thread(target = self._run, name = 'ws-worker-%d' % i)
+         thread.daemon = True
+         thread.start()
+         self.threads.append(thread)
+
+   def submit(self, client):
+      job = (client, client.messageKind(), client.opcode, client.data, _clock())
+      client.workpending += 1
+      if client.workpending > client.workermaxpending and not client.readpaused:
+         # stop reading from a client that sends faster than it is served
+         client.readpaused = True
+         self.server._updateInterest(client)
+
+      if not client.workerordered:
+         self.jobs.put(job)
+         return
+      with self.lock:
+         if client.workq is None:
+            client.workq = deque()
+         client.workq.append(job)
+         if client.workbusy:
+            return
+         client.workbusy = True
+      self.jobs.put(client)
+
+   def close(self):
+      for thread in self.threads:
+         self.jobs.put(None)
+
+   def _run(self):
+      while True:
+         job = self.jobs.get()
+         if job is None:
+            return
+         if isinstance(job, tuple):
+            self._execute(job)
+            continue
+
+         client = job
+         with self.lock:
+            job = client.workq.popleft()
+         self._execute(job)
+         with self.lock:
+            if not client.workq:
+               client.workbusy = False
+               continue
+         # one message per turn keeps a busy client from starving the rest
+         self.jobs.put(client)
+
+   def _execute(self, job):
+      client, kind, opcode, data, queued = job
+      start = _clock()
+      _workerlocal.client = client
+      _workerlocal.opcode = opcode
+      _workerlocal.data = data
+      failed = False
+      try:
+         client.handleMessage()
+      except Exception as n:
+         failed = True
+      finally:
+         _workerlocal.client = None
+         _workerlocal.data = None
+      run = _clock() - start
+      self.stats.add(kind, start - queued, run)
+      self.server._callSoon(self.server._workDone, client, failed, run)
+
+def _threadedClass(websocketclass):
+   return type(websocketclass.__name__, (websocketclass,),
+               {'__slots__': ('_data', '_opcode'),
+                'data': _messageProperty('data'),
+                'opcode': _messageProperty('opcode'),
+                '__module__': websocketclass.__module__})
+
+def _acceptsEncoding(header, coding):
+   """
+       Whether an Accept-Encoding value allows coding: named or covered by
+       '*' with a q-value above zero ('gzip;q=0' refuses it).
+   """
+   quality = {}
+   for item in header.split(','):
+      params = item.split(';')
+      name = params[0].strip().lower()
+      if not name:
+         continue
+      q = 1.0
+      for param in params[1:]:
+         key, _, value = param.partition('=')
+         if key.strip().lower() == 'q':
+            try:
+               q = float(value)
+            except ValueError:
+               q = 0.0
+      quality[name] = q
+   return quality.get(coding, quality.get('*', 0.0)) > 0
+
+class _StaticFile(object):
+   """
+       Body of a file response in the send queue. The socket is written
+       from the file with sendfile() where available, or read in chunks.
+   """
+   __slots__ = ('file', 'size')
+
+   def __init__(self, file, size):
+      self.file = file
+      self.size = size
+
+   def __len__(self):
+      return self.size
+
+   def send(self, client, offset):
+      count = min(self.size - offset, FILECHUNK)
+      if HAS_SENDFILE and not client.usingssl:
+         return os.sendfile(client.client.fileno(), self.file.fileno(), offset, count)
+      self.file.seek(offset)
+      return client.client.send(self.file.read(count))
+
+   def close(self):
+      self.file.close()
+
+class _Listener(object):
+   """
+       A listening socket and what its connections are made of.
+   """
+   __slots__ = ('socket', 'websocketclass', 'webroot')
+
+   def __init__(self, sock, websocketclass, webroot):
+      self.socket = sock
+      self.websocketclass = websocketclass
+      self.webroot = webroot
+
 class WebSocket(object):
 
+   # connection state lives in slots, a subclass that declares
+   # __slots__ = () (or lists its own attributes) has no __dict__ at all
+   __slots__ = ('server', 'client', 'address', 'handshaked', 'headerbuffer',
+                'headertoread', 'headerscan', 'fin', 'data', 'opcode', 'request',
+                'usingssl', 'frag_start', 'frag_type', 'frag_buffer',
+                'frag_size', 'frag_decoder', 'framehead', 'framebuf', 'framepos',
+                'frameleft', 'framemask', 'streamed', 'streamfirst', 'closed', 'deflate', 'inflating', 'sendq',
+                'sendoffset', 'sendqbytes', 'sendkeys', 'sendqdropped',
+                'sendqconflated', 'readpaused', 'workq', 'workbusy',
+                'workpending', 'connectedat', 'lastrecv', 'lastmessage',
+                'pingsent', 'idleclosed', 'keepalive', 'pending', 'maxheader',
+                'maxpayload', 'framesin', 'bytesin', 'framesout', 'bytesout',
+                'partialwrites', 'sendqpeakframes', 'sendqpeakbytes',
+                'queuetime', 'handlertime', 'webroot', '__weakref__')
+
+   # send queue limits, None means unbounded; subclasses may override them
+   sendqmaxbytes = None
+   sendqmaxframes = None
+   sendqpolicy = QUEUE_BLOCK
+
+   # with a worker pool: run the messages of a connection in order, and
+   # how many may wait before reading from the client pauses
+   workerordered = True
+   workermaxpending = 64
+
+   # keepalive, in seconds, None disables each check:
+   #  pinginterval      ping a client that has been silent this long
+   #  pongtimeout       drop it when nothing arrives this long after a ping,
+   #                    or when it does not answer a close sent on idle
+   #  idletimeout       close it after this long without a data message
+   #  handshaketimeout  drop a connection that does not complete the handshake
+   #  httpidletimeout   the same for connections of a listener with a webroot
+   #                    when handshaketimeout is None, so idle HTTP keep-alive
+   #                    connections and stalled downloads do not stay forever
+   pinginterval = None
+   pongtimeout = 10
+   idletimeout = None
+   handshaketimeout = None
+   httpidletimeout = 30
+
+   # deliver binary messages piece by piece to handleChunk() as they
+   # arrive instead of assembling them for handleMessage()
+   streambinary = False
+
    def __init__(self, server, sock, address):
       self.server = server
       self.client = sock
       self.address = address
 
       self.handshaked = False
-      self.headerbuffer = bytearray()
+      # buffers are only allocated while in use: the header until the
+      # handshake is done, the utf-8 decoder for fragmented text, the send
+      # queue while frames wait to be written
+      self.headerbuffer = None
       self.headertoread = 2048
+      # where the search for the end of the header resumes
+      self.headerscan = 0
 
       self.fin = 0
       self.data = bytearray()
       self.opcode = 0
-      self.hasmask = 0
-      self.maskarray = None
-      self.length = 0
-      self.lengtharray = None
-      self.index = 0
       self.request = None
       self.usingssl = False
+      # directory for plain HTTP requests, that of the listener it came in on
+      self.webroot = server.webroot
 
       self.frag_start = False
       self.frag_type = BINARY
       self.frag_buffer = None
-      self.frag_decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+      self.frag_size = 0
+      self.frag_decoder = None
+      # payload of a frame larger than the receive buffer, filled and
+      # unmasked as it arrives: its first header byte, framebuf (None when
+      # streamed to handleChunk), bytes written to it, bytes still expected
+      # and the mask key rotated to the next byte
+      self.framehead = 0
+      self.framebuf = None
+      self.framepos = 0
+      self.frameleft = 0
+      self.framemask = None
+      # a binary message is being streamed, and nothing of it was delivered
+      self.streamed = False
+      self.streamfirst = False
       self.closed = False
-      self.sendq = deque()
-
-      self.state = HEADERB1
+      # permessage-deflate context once negotiated in the handshake
+      self.deflate = None
+      self.inflating = False
+      self.sendq = _NOQUEUE
+      # bytes of the first queued frame already written to the socket
+      self.sendoffset = 0
+      self.sendqbytes = 0
+      # key -> queued frame, for QUEUE_CONFLATE
+      self.sendkeys = {}
+      self.sendqdropped = 0
+      self.sendqconflated = 0
+      # reading is paused while over the limits with QUEUE_BLOCK, or while
+      # too many messages wait for the worker pool
+      self.readpaused = False
+      self.workq = None
+      self.workbusy = False
+      self.workpending = 0
+
+      # keepalive state, times from the server loop clock; until the
+      # handshake connectedat is the last HTTP request or response progress
+      self.connectedat = server.now
+      self.lastrecv = server.now
+      self.lastmessage = server.now
+      self.pingsent = None
+      self.idleclosed = None
+      self.keepalive = None
+
+      # frames are sliced out of the server's receive buffer; incomplete
+      # trailing bytes are kept in pending until the rest of the frame arrives
+      self.pending = None
 
       # restrict the size of header and payload for security reasons
       self.maxheader = MAXHEADER
       self.maxpayload = MAXPAYLOAD
 
+      # transport counters, see getStats(); the histograms of time spent
+      # in the send queue and in handleMessage are created by the first sample
+      self.framesin = 0
+      self.bytesin = 0
+      self.framesout = 0
+      self.bytesout = 0
+      # writes that left a frame partially sent
+      self.partialwrites = 0
+      self.sendqpeakframes = 0
+      self.sendqpeakbytes = 0
+      self.queuetime = None
+      self.handlertime = None
+
    def handleMessage(self):
       """
           Called when websocket frame is received.
@@ -126,6 +1192,25 @@ class WebSocket(object):
       """
       pass
 
+   def handleChunk(self, data, first, last):
+      """
+          Called instead of handleMessage for binary messages when
+          streambinary is set: data is the next piece of the payload as a
+          bytearray, first and last mark the start and the end of the
+          message. Runs on the server loop, also with a worker pool.
+      """
+      pass
+
+   def messageKind(self):
+      """
+          Label of the current message used for the worker pool statistics.
+          Called on the server loop with self.data set; override it to
+          break the timings down further, e.g. by command name.
+      """
+      if self.opcode == TEXT:
+         return 'text'
+      return 'binary'
+
    def handleConnected(self):
       """
           Called when a websocket client connects to the server.
@@ -138,6 +1223,28 @@ class WebSocket(object):
       """
       pass
 
+   def getStats(self):
+      """
+          Transport counters of this connection: frames and bytes in and
+          out, partial writes, the send queue now and at its peak, and the
+          time frames waited in the queue and handleMessage ran.
+      """
+      stats = TransportStats()
+      stats.add(self)
+      result = stats.asDict()
+      del result['connections']
+      result['address'] = self.address
+      result['sendq_frames'] = len(self.sendq)
+      result['sendq_bytes'] = self.sendqbytes
+      result['sendq_dropped'] = self.sendqdropped
+      result['sendq_conflated'] = self.sendqconflated
+      return result
+
+   def _recordHandler(self, elapsed):
+      if self.handlertime is None:
+         self.handlertime = Histogram()
+      self.handlertime.add(elapsed)
+
    def _handlePacket(self):
       if self.opcode == CLOSE:
          pass
@@ -170,7 +1277,7 @@ class WebSocket(object):
 
             if len(reason) > 0:
                 try:
-                    reason = reason.decode('utf8', errors='strict')
+                    reason = codecs.utf_8_decode(reason, 'strict', True)[0]
                 except:
                     status = 1002
          else:
@@ -186,23 +1293,32 @@ class WebSocket(object):
 
               self.frag_type = self.opcode
               self.frag_start = True
-              self.frag_decoder.reset()
+              self.frag_size = len(self.data)
 
               if self.frag_type == TEXT:
+                  if self.frag_decoder is None:
+                      self.frag_decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+                  self.frag_decoder.reset()
                   self.frag_buffer = []
-                  utf_str = self.frag_decoder.decode(self.data, final = False)
+                  utf_str = self.frag_decoder.decode(_asbytes(self.data), final = False)
                   if utf_str:
                       self.frag_buffer.append(utf_str)
               else:
-                  self.frag_buffer = bytearray()
-                  self.frag_buffer.extend(self.data)
+                  # the payload is a view of the parse buffer, the message
+                  # buffer starts as a copy of it and the rest is appended
+                  # in place: amortized linear and a single copy in memory
+                  self.frag_buffer = bytearray(self.data)
 
           else:
               if self.frag_start is False:
                   raise Exception('fragmentation protocol error')
 
+              self.frag_size += len(self.data)
+              if self.frag_size >= self.maxpayload:
+                  raise Exception('payload exceeded allowable size')
+
               if self.frag_type == TEXT:
-                  utf_str = self.frag_decoder.decode(self.data, final = False)
+                  utf_str = self.frag_decoder.decode(_asbytes(self.data), final = False)
                   if utf_str:
                       self.frag_buffer.append(utf_str)
               else:
@@ -213,23 +1329,28 @@ class WebSocket(object):
               if self.frag_start is False:
                   raise Exception('fragmentation protocol error')
 
+              self.frag_size += len(self.data)
+              if self.frag_size >= self.maxpayload:
+                  raise Exception('payload exceeded allowable size')
+
               if self.frag_type == TEXT:
-                  utf_str = self.frag_decoder.decode(self.data, final = True)
+                  utf_str = self.frag_decoder.decode(_asbytes(self.data), final = True)
                   self.frag_buffer.append(utf_str)
                   self.data = u''.join(self.frag_buffer)
               else:
                   self.frag_buffer.extend(self.data)
                   self.data = self.frag_buffer
+              self.frag_buffer = None
 
-              self.handleMessage()
+              self._dispatchMessage()
 
-              self.frag_decoder.reset()
               self.frag_type = BINARY
               self.frag_start = False
-              self.frag_buffer = None
+              self.frag_size = 0
 
           elif self.opcode == PING:
-              self._sendMessage(False, PONG, self.data)
+              # queued by reference, the parse buffer is reused
+              self._sendMessage(False, PONG, bytearray(self.data))
 
           elif self.opcode == PONG:
               pass
@@ -239,15 +1360,26 @@ class WebSocket(object):
                   raise Exception('fragmentation protocol error')
 
               if self.opcode == TEXT:
+                  # decoded straight from the parse buffer
                   try:
-                      self.data = self.data.decode('utf8', errors='strict')
+                      self.data = codecs.utf_8_decode(self.data, 'strict', True)[0]
                   except Exception as exp:
                       raise Exception('invalid utf-8 payload')
+              elif isinstance(self.data, memoryview):
+                  # the handler may keep it or run later on a worker
+                  self.data = bytearray(self.data)
 
-              self.handleMessage()
+              self._dispatchMessage()
 
 
    def _handleData(self):
+      """
+          Read once from the socket and process what arrived. Returns True
+          when the socket may still hold unread data, which edge-triggered
+          pollers use to keep reading until it is drained.
+      """
+      self.lastrecv = self.server.now
+
       # do the HTTP header and handshake
       if self.handshaked is False:
 
@@ -255,52 +1387,193 @@ class WebSocket(object):
             data = self.client.recv(self.headertoread)
          except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
             # SSL socket not ready to read yet, wait and try again
-            return
+            return False
+         except socket.error as e:
+            if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+               return False
+            raise e
          if not data:
             raise Exception('remote socket closed')
 
          else:
+            self.bytesin += len(data)
             # accumulate
+            if self.headerbuffer is None:
+               self.headerbuffer = bytearray()
             self.headerbuffer.extend(data)
 
             if len(self.headerbuffer) >= self.maxheader:
                raise Exception('header exceeded allowable size')
 
-            # indicates end of HTTP header
-            if b'\r\n\r\n' in self.headerbuffer:
-               self.request = HTTPRequest(self.headerbuffer)
-
-               # handshake rfc 6455
-               try:
-                  key = self.request.headers['Sec-WebSocket-Key']
-                  k = key.encode('ascii') + GUID_STR.encode('ascii')
-                  k_s = base64.b64encode(hashlib.sha1(k).digest()).decode('ascii')
-                  hStr = HANDSHAKE_STR % {'acceptstr': k_s}
-                  self.sendq.append((BINARY, hStr.encode('ascii')))
-                  self.handshaked = True
-                  self.handleConnected()
-               except Exception as e:
-                  hStr = FAILED_HANDSHAKE_STR
-                  self._sendBuffer(hStr.encode('ascii'), True)
-                  self.client.close()
-                  raise Exception('handshake failed: %s', str(e))
+            self._handleHeader()
+            return len(data) == self.headertoread
 
       # else do normal data
       else:
+         # the receive buffer is shared by all connections of the server,
+         # whatever is left of it after parsing is copied to pending
+         recvbuffer = self.server.recvbuffer
          try:
-            data = self.client.recv(16384)
+            nbytes = self.client.recv_into(recvbuffer)
          except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
             # SSL socket not ready to read yet, wait and try again
-            return
-         if not data:
+            return False
+         except socket.error as e:
+            if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+               return False
+            raise e
+         if not nbytes:
             raise Exception("remote socket closed")
+         self.bytesin += nbytes
 
-         if VER >= 3:
-             for d in data:
-                 self._parseMessage(d)
+         if self.pending:
+            self.pending.extend(self.server.recvview[:nbytes])
+            self._parsePending()
          else:
-             for d in data:
-                 self._parseMessage(ord(d))
+            consumed = self._parseFrames(recvbuffer, nbytes)
+            if consumed < nbytes:
+               self.pending = bytearray(self.server.recvview[consumed:nbytes])
+
+         if self.usingssl and self.client.pending():
+            return True
+         return nbytes == len(recvbuffer)
+
+   def _handleHeader(self):
+      """
+          Answer every complete request in headerbuffer: plain HTTP requests
+          for the webroot until the WebSocket handshake.
+      """
+      while not self.handshaked:
+         # indicates end of HTTP header, only look at the new bytes
+         end = self.headerbuffer.find(b'\r\n\r\n', self.headerscan)
+         if end < 0:
+            self.headerscan = max(0, len(self.headerbuffer) - 3)
+            return
+
+         # handshake rfc 6455
+         try:
+            self.request = HTTPRequest(self.headerbuffer[:end])
+            upgrade = self.request.headers.get('Upgrade', '').lower() == 'websocket'
+            if self.webroot is not None and not upgrade:
+               self._serveStatic()
+               # keep-alive, the handshake timeout now counts from this
+               # request and the next one may already be buffered
+               self.connectedat = self.server.now
+               self.server._watchClient(self)
+               self.headerbuffer = self.headerbuffer[end + 4:]
+               self.headerscan = 0
+               continue
+            if self.request.command != 'GET':
+               raise ValueError('websocket handshake must be a GET')
+            key = self.request.headers['Sec-WebSocket-Key']
+            if not key:
+               raise ValueError('missing Sec-WebSocket-Key')
+            k = key.encode('ascii') + GUID_STR.encode('ascii')
+            k_s = base64.b64encode(hashlib.sha1(k).digest()).decode('ascii')
+            extensions = ''
+            offer = self.request.headers.get('Sec-WebSocket-Extensions')
+            if offer and self.server.deflate is not None:
+               response, self.deflate = self.server.deflate.negotiate(
+                  offer, self.server.compression)
+               if response:
+                  extensions = 'Sec-WebSocket-Extensions: %s\r\n' % response
+            hStr = HANDSHAKE_STR % {'acceptstr': k_s, 'extensions': extensions}
+            self._enqueue((RAW, hStr.encode('ascii'), b'', None, _clock()))
+            self.handshaked = True
+            self.server._watchClient(self)
+            self.handleConnected()
+         except Exception as e:
+            hStr = FAILED_HANDSHAKE_STR
+            self._sendBuffer(hStr.encode('ascii'), True)
+            self.client.close()
+            raise Exception('handshake failed: %s', str(e))
+
+         # frames sent right behind the header arrived in the same read
+         rest = self.headerbuffer[end + 4:]
+         self.headerbuffer = None
+         if rest:
+            self.pending = rest
+            self._parsePending()
+
+   def _handshakeTimeout(self):
+      if self.handshaketimeout is not None or self.webroot is None:
+         return self.handshaketimeout
+      return self.httpidletimeout
+
+   def _serveStatic(self):
+      """
+          Answer a plain GET or HEAD with a file from its listener's webroot.
+          A precompressed name.gz is sent instead of name to clients that
+          accept gzip; ETag and Last-Modified allow 304 revalidation.
+      """
+      request = self.request
+      root = self.webroot
+      path = unquote(request.path.split('?', 1)[0].split('#', 1)[0])
+      target = os.path.realpath(os.path.join(root, path.lstrip('/')))
+      if target != root and not target.startswith(root + os.sep):
+         self._sendHTTP('404 Not Found')
+         return
+      if os.path.isdir(target):
+         target = os.path.join(target, 'index.html')
+
+      headers = 'Cache-Control: no-cache\r\n'
+      served = target
+      if os.path.isfile(target + '.gz'):
+         headers += 'Vary: Accept-Encoding\r\n'
+         if _acceptsEncoding(request.headers.get('Accept-Encoding', ''), 'gzip'):
+            served = target + '.gz'
+            headers += 'Content-Encoding: gzip\r\n'
+      try:
+         if not os.path.isfile(served):
+            raise IOError(errno.ENOENT, 'not a file')
+         f = open(served, 'rb')
+      except (IOError, OSError):
+         self._sendHTTP('404 Not Found')
+         return
+
+      st = os.fstat(f.fileno())
+      etag = '"%x-%x"' % (int(st.st_mtime * 1000000), st.st_size)
+      headers += 'ETag: %s\r\nLast-Modified: %s\r\n' % (
+         etag, email.utils.formatdate(st.st_mtime, usegmt = True))
+
+      match = request.headers.get('If-None-Match')
+      since = request.headers.get('If-Modified-Since')
+      if match is not None:
+         unchanged = match.strip() == '*' or etag in match
+      elif since is not None:
+         since = email.utils.parsedate_tz(since)
+         unchanged = since is not None and int(st.st_mtime) <= email.utils.mktime_tz(since)
+      else:
+         unchanged = False
+      if unchanged:
+         f.close()
+         self._sendHTTP('304 Not Modified', headers, body = None)
+         return
+
+      ctype = mimetypes.guess_type(target)[0] or 'application/octet-stream'
+      headers += 'Content-Type: %s\r\nContent-Length: %d\r\n' % (ctype, st.st_size)
+      header = (HTTP_RESPONSE_STR % {'status': '200 OK', 'headers': headers}).encode('latin-1')
+      if request.command == 'HEAD' or not st.st_size:
+         f.close()
+         self._enqueue((RAW, header, b'', None, _clock()))
+      else:
+         self._enqueue((FILE, header, _StaticFile(f, st.st_size), None, _clock()))
+
+   def _sendHTTP(self, status, headers = '', body = b''):
+      # short answer without a file, body None for responses without one
+      if body is not None:
+         headers += 'Content-Type: text/plain\r\nContent-Length: %d\r\n' % len(body)
+         if self.request is not None and self.request.command == 'HEAD':
+            body = b''
+      header = HTTP_RESPONSE_STR % {'status': status, 'headers': headers}
+      self._enqueue((RAW, header.encode('latin-1'), body or b'', None, _clock()))
+
+   def _parsePending(self):
+      consumed = self._parseFrames(self.pending, len(self.pending))
+      if consumed == len(self.pending):
+         self.pending = None
+      else:
+         del self.pending[:consumed]
 
    def close(self, status = 1000, reason = u''):
        """
@@ -326,37 +1599,121 @@ class WebSocket(object):
 
 
    def _sendBuffer(self, buff, send_all = False):
-      size = len(buff)
-      tosend = size
+      view = memoryview(buff)
+      size = len(view)
       already_sent = 0
 
-      while tosend > 0:
+      while already_sent < size:
          try:
-            # i should be able to send a bytearray
-            sent = self.client.send(buff[already_sent:])
+            sent = self.client.send(view[already_sent:])
             if sent == 0:
                raise RuntimeError('socket connection broken')
 
             already_sent += sent
-            tosend -= sent
 
          except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
             # SSL socket not ready to send yet, wait and try again
             if send_all:
                continue
-            return buff[already_sent:]
+            return view[already_sent:]
 
          except socket.error as e:
             # if we have full buffers then wait for them to drain and try again
             if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
                if send_all:
                    continue
-               return buff[already_sent:]
+               return view[already_sent:]
             else:
                raise e
 
       return None
 
+   def _gatherQueue(self):
+      """
+          Collect the unsent parts of the queued frames, up to MAXIOV
+          buffers, skipping what was already written of the first one.
+      """
+      buffers = []
+      skip = self.sendoffset
+      for opcode, header, payload, key, queued in self.sendq:
+         # a file body is written on its own, once its header is out
+         for buff in ((header,) if opcode == FILE else (header, payload)):
+            length = len(buff)
+            if skip >= length:
+               skip -= length
+               continue
+            buffers.append(memoryview(buff)[skip:] if skip else buff)
+            skip = 0
+         # nothing is written after a close frame
+         if opcode in (CLOSE, FILE) or len(buffers) >= MAXIOV:
+            break
+      return buffers
+
+   def _writeBuffers(self, buffers):
+      if HAS_SENDMSG and not self.usingssl:
+         return self.client.sendmsg(buffers)
+      if len(buffers) == 1:
+         return self.client.send(buffers[0])
+      joined = bytearray()
+      for buff in buffers:
+         joined.extend(buff)
+      return self.client.send(joined)
+
+   def _flushQueue(self):
+      """
+          Write the queued frames, coalescing all of them into a single
+          send call per attempt. Partially written frames are tracked by
+          offset. Returns True once the queue is empty.
+      """
+      while self.sendq:
+         opcode, header, payload, key, queued = self.sendq[0]
+         try:
+            if opcode == FILE and self.sendoffset >= len(header):
+               sent = payload.send(self, self.sendoffset - len(header))
+            else:
+               sent = self._writeBuffers(self._gatherQueue())
+         except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            # SSL socket not ready to send yet, wait and try again
+            return False
+         except socket.error as e:
+            # if we have full buffers then wait for them to drain and try again
+            if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+               return False
+            raise e
+
+         if sent == 0:
+            raise RuntimeError('socket connection broken')
+
+         self.bytesout += sent
+         sent += self.sendoffset
+         now = _clock()
+         if self.queuetime is None:
+            self.queuetime = Histogram()
+         while self.sendq:
+            entry = self.sendq[0]
+            opcode, header, payload, key, queued = entry
+            length = len(header) + len(payload)
+            if sent < length:
+               break
+            sent -= length
+            self.sendq.popleft()
+            self.sendqbytes -= length
+            self.framesout += 1
+            self.queuetime.add(now - queued)
+            if opcode == FILE:
+               payload.close()
+            if key is not None and self.sendkeys.get(key) is entry:
+               del self.sendkeys[key]
+            if opcode == CLOSE:
+               raise Exception('received client close')
+         if sent:
+            self.partialwrites += 1
+         self.sendoffset = sent
+
+      # an idle connection holds no queue
+      self.sendq = _NOQUEUE
+      return True
+
    def sendFragmentStart(self, data):
       """
           Send the start of a data fragment stream to a websocket client.
@@ -389,219 +1746,480 @@ class WebSocket(object):
       """
       self._sendMessage(False, STREAM, data)
 
-   def sendMessage(self, data):
+   def sendMessage(self, data, key = None):
       """
           Send websocket data frame to the client.
 
           If data is a unicode object then the frame is sent as Text.
           If the data is a bytearray object then the frame is sent as Binary.
+
+          With the QUEUE_CONFLATE policy a message sent with a key replaces
+          a queued, not yet started message with the same key.
+
+          Safe to call from any thread: off the server loop the message is
+          handed to it and the loop is woken up right away.
       """
       opcode = BINARY
       if _check_unicode(data):
          opcode = TEXT
-      self._sendMessage(False, opcode, data)
+      self._sendMessage(False, opcode, data, key)
 
 
-   def _sendMessage(self, fin, opcode, data):
-
-        payload = bytearray()
-
-        b1 = 0
-        b2 = 0
-        if fin is False:
-           b1 |= 0x80
-        b1 |= opcode
+   def _sendMessage(self, fin, opcode, data, key = None):
+        """
+            Queue a frame. The header is built separately and the payload is
+            queued by reference, so it must not be modified afterwards.
+        """
+        loopident = self.server.loopident
+        if loopident is not None and loopident != _get_ident():
+           # called from another thread, the loop thread owns the queue
+           self.server._callSoon(self._sendMessage, fin, opcode, data, key)
+           return
 
         if _check_unicode(data):
            data = data.encode('utf-8')
 
-        length = len(data)
-        payload.append(b1)
-
-        if length <= 125:
-           b2 |= length
-           payload.append(b2)
-
-        elif length >= 126 and length <= 65535:
-           b2 |= 126
-           payload.append(b2)
-           payload.extend(struct.pack("!H", length))
+        rsv = 0
+        # only complete data messages are compressed, fragments go out as is
+        if (self.deflate is not None and fin is False and opcode in (TEXT, BINARY)
+              and len(data) >= self.deflate.options.min_size):
+           data = self.deflate.compress(data)
+           rsv = RSV1
+
+        self._enqueue((opcode, _frameHeader(fin, opcode, len(data), rsv), data, key, _clock()))
+
+   def _enqueue(self, item):
+      # the server only watches for writability while there is something to send
+      if not self.sendq:
+         self.server._wantWrite(self)
+         if self.sendq is _NOQUEUE:
+            self.sendq = deque()
+
+      key = item[3]
+      if key is not None and self.sendqpolicy == QUEUE_CONFLATE:
+         queued = self.sendkeys.get(key)
+         self.sendkeys[key] = item
+         if queued is not None and self._conflate(queued, item):
+            return
 
-        else:
-           b2 |= 127
-           payload.append(b2)
-           payload.extend(struct.pack("!Q", length))
+      self.sendq.append(item)
+      self.sendqbytes += len(item[1]) + len(item[2])
+      if len(self.sendq) > self.sendqpeakframes:
+         self.sendqpeakframes = len(self.sendq)
+      if self.sendqbytes > self.sendqpeakbytes:
+         self.sendqpeakbytes = self.sendqbytes
+
+      if ((self.sendqmaxbytes is not None and self.sendqbytes > self.sendqmaxbytes) or
+            (self.sendqmaxframes is not None and len(self.sendq) > self.sendqmaxframes)):
+         if self.sendqpolicy == QUEUE_BLOCK:
+            if not self.readpaused:
+               self.readpaused = True
+               self.server._updateInterest(self)
+         else:
+            self._shedQueue()
+
+   def _conflate(self, queued, item):
+      # the head frame may already be partially written, it must go out whole
+      if not self._droppable(queued):
+         return False
+      start = 1 if self.sendoffset else 0
+      for index in range(start, len(self.sendq)):
+         if self.sendq[index] is queued:
+            self.sendq[index] = item
+            self.sendqbytes += len(item[1]) + len(item[2]) - len(queued[1]) - len(queued[2])
+            self.sendqconflated += 1
+            self.server.sendqconflated += 1
+            return True
+      return False
+
+   def _shedQueue(self):
+      """
+          Drop the oldest complete messages that were not started yet until
+          the queue is within its limits again. Control frames, fragments,
+          messages compressed with context takeover and the newest message
+          are never dropped.
+      """
+      index = 1 if self.sendoffset else 0
+      while ((self.sendqmaxbytes is not None and self.sendqbytes > self.sendqmaxbytes) or
+             (self.sendqmaxframes is not None and len(self.sendq) > self.sendqmaxframes)):
+         if index >= len(self.sendq) - 1:
+            break
+         entry = self.sendq[index]
+         if not self._droppable(entry):
+            index += 1
+            continue
+         opcode, header, payload, key, queued = entry
+         del self.sendq[index]
+         self.sendqbytes -= len(header) + len(payload)
+         if key is not None and self.sendkeys.get(key) is entry:
+            del self.sendkeys[key]
+         self.sendqdropped += 1
+         self.server.sendqdropped += 1
+
+   def _droppable(self, entry):
+      opcode, header, payload, key, queued = entry
+      # only complete data messages can go
+      if opcode not in (TEXT, BINARY):
+         return False
+      flags = struct.unpack_from('!B', header)[0]
+      if not flags & 0x80:
+         return False
+      # a compressed message is part of the shared LZ77 window unless the
+      # context is reset after every message
+      if flags & RSV1 and not self.deflate.server_nct:
+         return False
+      return True
+
+   def _belowLimits(self):
+      return ((self.sendqmaxbytes is None or self.sendqbytes <= self.sendqmaxbytes) and
+              (self.sendqmaxframes is None or len(self.sendq) <= self.sendqmaxframes) and
+              self.workpending <= self.workermaxpending)
+
+   def _dispatchMessage(self):
+      self.lastmessage = self.server.now
+      if self.server.workers is None:
+         start = _clock()
+         self.handleMessage()
+         self._recordHandler(_clock() - start)
+      else:
+         self.server.workers.submit(self)
 
-        if length > 0:
-           payload.extend(data)
 
-        self.sendq.append((opcode, payload))
+   def _parseFrames(self, buff, end):
+      """
+          Handle every complete frame in buff[:end] and return the number of
+          bytes consumed. A trailing partial frame is left for the next call,
+          unless its payload is larger than the receive buffer or streamed:
+          then the payload is consumed as it arrives.
+      """
+      view = memoryview(buff)
+      offset = 0
 
+      while True:
+         if self.frameleft:
+            offset = self._fillFrame(view, offset, end)
+            if self.frameleft:
+               break
+            if self.framebuf is not None:
+               self.fin = self.framehead & 0x80
+               self.opcode = self.framehead & 0x0F
+               self.data = self.framebuf
+               self.framebuf = None
+               self._handleFrame()
+            continue
 
-   def _parseMessage(self, byte):
-      # read in the header
-      if self.state == HEADERB1:
+         if end - offset < 2:
+            break
 
-         self.fin = byte & 0x80
-         self.opcode = byte & 0x0F
-         self.state = HEADERB2
+         b1 = buff[offset]
+         b2 = buff[offset + 1]
 
-         self.index = 0
-         self.length = 0
-         self.lengtharray = bytearray()
-         self.data = bytearray()
+         opcode = b1 & 0x0F
+         rsv = b1 & 0x70
 
-         rsv = byte & 0x70
-         if rsv != 0:
+         # RSV1 marks the first frame of a compressed message
+         if rsv != 0 and not (rsv == RSV1 and self.deflate is not None
+                              and opcode in (TEXT, BINARY)):
             raise Exception('RSV bit must be 0')
+         hasmask = b2 & 0x80
+         length = b2 & 0x7F
+         pos = offset + 2
 
-      elif self.state == HEADERB2:
-         mask = byte & 0x80
-         length = byte & 0x7F
-
-         if self.opcode == PING and length > 125:
-             raise Exception('ping packet is too large')
-
-         if mask == 128:
-            self.hasmask = True
-         else:
-            self.hasmask = False
-
-         if length <= 125:
-            self.length = length
-
-            # if we have a mask we must read it
-            if self.hasmask is True:
-               self.maskarray = bytearray()
-               self.state = MASK
-            else:
-               # if there is no mask and no payload we are done
-               if self.length <= 0:
-                  try:
-                     self._handlePacket()
-                  finally:
-                     self.state = HEADERB1
-                     self.data = bytearray()
-
-               # we have no mask and some payload
-               else:
-                  #self.index = 0
-                  self.data = bytearray()
-                  self.state = PAYLOAD
-
-         elif length == 126:
-            self.lengtharray = bytearray()
-            self.state = LENGTHSHORT
+         if opcode == PING and length > 125:
+            raise Exception('ping packet is too large')
+         if opcode in (CLOSE, PONG) and length > 125:
+            raise Exception('control frame length can not be > 125')
 
+         if length == 126:
+            if end - pos < 2:
+               break
+            length = struct.unpack_from('!H', buff, pos)[0]
+            pos += 2
          elif length == 127:
-            self.lengtharray = bytearray()
-            self.state = LENGTHLONG
+            if end - pos < 8:
+               break
+            length = struct.unpack_from('!Q', buff, pos)[0]
+            pos += 8
 
+         streamed = self._streams(opcode, rsv)
 
-      elif self.state == LENGTHSHORT:
-         self.lengtharray.append(byte)
-
-         if len(self.lengtharray) > 2:
-            raise Exception('short length exceeded allowable size')
-
-         if len(self.lengtharray) == 2:
-            self.length = struct.unpack_from('!H', self.lengtharray)[0]
-
-            if self.hasmask is True:
-               self.maskarray = bytearray()
-               self.state = MASK
-            else:
-               # if there is no mask and no payload we are done
-               if self.length <= 0:
-                  try:
-                     self._handlePacket()
-                  finally:
-                     self.state = HEADERB1
-                     self.data = bytearray()
-
-               # we have no mask and some payload
-               else:
-                  #self.index = 0
-                  self.data = bytearray()
-                  self.state = PAYLOAD
-
-      elif self.state == LENGTHLONG:
-
-         self.lengtharray.append(byte)
-
-         if len(self.lengtharray) > 8:
-            raise Exception('long length exceeded allowable size')
-
-         if len(self.lengtharray) == 8:
-            self.length = struct.unpack_from('!Q', self.lengtharray)[0]
+         # if length exceeds allowable size then we except and remove the
+         # connection, streamed payloads are never held in memory
+         if length >= self.maxpayload and not streamed:
+            raise Exception('payload exceeded allowable size')
 
-            if self.hasmask is True:
-               self.maskarray = bytearray()
-               self.state = MASK
+         mask = None
+         if hasmask:
+            if end - pos < 4:
+               break
+            mask = buff[pos:pos + 4]
+            pos += 4
+
+         if streamed or (end - pos < length and length > RECVSIZE):
+            # take the payload piece by piece instead of waiting for all of
+            # it in pending; the header is consumed, so the frame counts now
+            self.framesin += 1
+            offset = pos
+            # fin and opcode are only set once the frame is complete, hooks
+            # of earlier messages may still look at them meanwhile
+            self.framehead = b1
+            if rsv:
+               self.inflating = True
+            self.framemask = mask
+            self.frameleft = length
+            if streamed:
+               if opcode == BINARY:
+                  self.streamed = True
+                  self.streamfirst = True
+               if not length:
+                  self._deliverChunk(bytearray())
             else:
-               # if there is no mask and no payload we are done
-               if self.length <= 0:
-                  try:
-                     self._handlePacket()
-                  finally:
-                     self.state = HEADERB1
-                     self.data = bytearray()
+               self.framebuf = bytearray(length)
+               self.framepos = 0
+            continue
 
-               # we have no mask and some payload
-               else:
-                  #self.index = 0
-                  self.data = bytearray()
-                  self.state = PAYLOAD
+         if end - pos < length:
+            # the header is parsed again with the rest of the payload
+            break
+
+         self.framesin += 1
+         # unmasked in place: the frame hands a view of the parse buffer to
+         # _handlePacket, copies are only made for what outlives the frame
+         if hasmask:
+            _unmaskInPlace(mask, buff, pos, length)
+         self.data = view[pos:pos + length]
+
+         offset = pos + length
+         self.fin = b1 & 0x80
+         self.opcode = opcode
+
+         if rsv:
+            self.inflating = True
+         self._handleFrame()
+
+      return offset
+
+   def _streams(self, opcode, rsv):
+      # whether the frame belongs to a binary message for handleChunk;
+      # compressed messages are inflated and assembled as usual
+      if self.streamed:
+         if opcode in (TEXT, BINARY):
+            raise Exception('fragmentation protocol error')
+         return opcode == STREAM
+      return (opcode == BINARY and self.streambinary and not rsv
+              and not self.frag_start)
+
+   def _fillFrame(self, view, offset, end):
+      """
+          Take the part of the current frame's payload that is in
+          view[offset:end], returns the new offset.
+      """
+      size = min(self.frameleft, end - offset)
+      if not size:
+         return offset
+      piece = view[offset:offset + size]
+      if self.framemask is not None:
+         piece = _unmask(self.framemask, piece)
+         shift = size % 4
+         self.framemask = self.framemask[shift:] + self.framemask[:shift]
+      self.frameleft -= size
+      if self.framebuf is None:
+         self._deliverChunk(bytearray(piece))
+      else:
+         self.framebuf[self.framepos:self.framepos + size] = piece
+         self.framepos += size
+      return offset + size
+
+   def _deliverChunk(self, data):
+      last = bool(self.framehead & 0x80) and not self.frameleft
+      first = self.streamfirst
+      self.streamfirst = False
+      if last:
+         self.streamed = False
+      self.lastmessage = self.server.now
+      self.handleChunk(data, first, last)
+
+   def _handleFrame(self):
+      if self.inflating and self.opcode in (TEXT, BINARY, STREAM):
+         self.data = self.deflate.decompress(self.data, self.fin, self.maxpayload)
+         if self.fin:
+            self.inflating = False
+
+      try:
+         self._handlePacket()
+      finally:
+         self.data = _NODATA
 
-      # MASK STATE
-      elif self.state == MASK:
-         self.maskarray.append(byte)
 
-         if len(self.maskarray) > 4:
-            raise Exception('mask exceeded allowable size')
+class SimpleWebSocketServer(object):
+   def __init__(self, host, port, websocketclass, selectInterval = 0.1, poller = None,
+                deflate = None, workers = 0, webroot = None):
+      """
+          poller selects the readiness backend: 'epoll', 'poll' or 'select',
+          or is a poller instance with the same interface. By default the
+          most scalable one available on the platform is used.
 
-         if len(self.maskarray) == 4:
-            # if there is no mask and no payload we are done
-            if self.length <= 0:
-               try:
-                  self._handlePacket()
-               finally:
-                  self.state = HEADERB1
-                  self.data = bytearray()
+          deflate is a DeflateOptions instance enabling permessage-deflate
+          for clients that offer it.
 
-            # we have no mask and some payload
-            else:
-               #self.index = 0
-               self.data = bytearray()
-               self.state = PAYLOAD
-
-      # PAYLOAD STATE
-      elif self.state == PAYLOAD:
-         if self.hasmask is True:
-            self.data.append( byte ^ self.maskarray[self.index % 4] )
-         else:
-            self.data.append( byte )
+          workers is the number of threads running handleMessage. With 0
+          (the default) handlers run inline on the server loop.
 
-         # if length exceeds allowable size then we except and remove the connection
-         if len(self.data) >= self.maxpayload:
-            raise Exception('payload exceeded allowable size')
+          webroot is a directory served to plain HTTP GET requests on the
+          same port, e.g. the web app that opens the WebSocket.
+      """
+      self.webroot = os.path.realpath(webroot) if webroot is not None else None
+      self.deflate = deflate
+      self.compression = CompressionStats()
+      self.serversocket = self._listen(host, port)
+      self.serverfileno = self.serversocket.fileno()
+      self.workers = None
+      if workers:
+         self.workers = WorkerPool(self, workers)
+      self.websocketclass = self._listenerClass(websocketclass)
+      # fileno -> _Listener of every listening socket, this one included
+      self.listeners = {self.serverfileno: _Listener(self.serversocket,
+                                                     self.websocketclass,
+                                                     self.webroot)}
+      self.selectInterval = selectInterval
+      self.connections = {}
+      # every read lands here first, the loop handles one socket at a time
+      self.recvbuffer = bytearray(RECVSIZE)
+      self.recvview = memoryview(self.recvbuffer)
+      # filenos currently registered for write readiness
+      self.writers = set()
+      # send queue policy counters over all connections
+      self.sendqdropped = 0
+      self.sendqconflated = 0
+      # loop clock, read once per iteration; drives the keepalive timers
+      self.now = _monotonic()
+      self.wheel = _TimerWheel(self.now)
+      self.pingssent = 0
+      self.reaped = 0
+      # transport counters of the connections already closed, and the time
+      # each loop iteration spent handling events (poll wait excluded)
+      self.transport = TransportStats()
+      self.looptime = Histogram()
+      # call_later()/call_every() callbacks as a heap of (due, sequence,
+      # call), and how late they ran after their deadline
+      self.scheduled = []
+      self.scheduledseq = 0
+      self.timerlateness = Histogram()
+      # descriptors added with add_reader(): fileno -> (callback, args)
+      self.fdcallbacks = {}
+
+      if poller is None:
+         poller = _defaultPoller()
+      if poller in POLLERS:
+         poller = POLLERS[poller]()
+      self.poller = poller
+      self.poller.register(self.serverfileno, EVENT_READ)
+
+      # calls handed over by other threads; the first one queued since the
+      # last run wakes the loop up
+      self.calls = deque()
+      self.callslock = threading.Lock()
+      self.wakeuppending = False
+      # thread running serveonce(), set once the loop has started
+      self.loopident = None
+      try:
+         self.waker = _Waker()
+         self.wakeupfd = self.waker.fd
+         self.poller.register(self.wakeupfd, EVENT_READ)
+      except ImportError:
+         self.waker = None
+         self.wakeupfd = None
+
+   def addListener(self, host, port, websocketclass, webroot = None):
+      """
+          Also accept connections on host:port, handled by websocketclass
+          (and webroot for plain HTTP requests, none by default). Every
+          listener is served by the same loop, worker pool and settings.
+          Returns the listening socket.
+      """
+      sock = self._listen(host, port)
+      if webroot is not None:
+         webroot = os.path.realpath(webroot)
+      self.listeners[sock.fileno()] = _Listener(sock, self._listenerClass(websocketclass),
+                                                webroot)
+      self.poller.register(sock.fileno(), EVENT_READ)
+      return sock
 
-         # check if we have processed length bytes; if so we are done
-         if (self.index+1) == self.length:
-            try:
-               self._handlePacket()
-            finally:
-               #self.index = 0
-               self.state = HEADERB1
-               self.data = bytearray()
-         else:
-            self.index += 1
+   def call_later(self, delay, callback, *args):
+      """
+          Run callback(*args) on the loop once, delay seconds from now on
+          the monotonic clock. Returns a handle whose cancel() unschedules
+          it. Safe to call from any thread.
+      """
+      return self._schedule(_ScheduledCall(_monotonic() + delay, None, callback, args))
 
+   def call_every(self, interval, callback, *args):
+      """
+          Run callback(*args) on the loop every interval seconds until the
+          returned handle is cancelled. Deadlines are fixed, a late run does
+          not delay the next ones; ticks missed by more than an interval are
+          skipped. Safe to call from any thread.
+      """
+      return self._schedule(_ScheduledCall(_monotonic() + interval, interval, callback, args))
 
-class SimpleWebSocketServer(object):
-   def __init__(self, host, port, websocketclass, selectInterval = 0.1):
-      self.websocketclass = websocketclass
+   def add_reader(self, fd, callback, *args):
+      """
+          Run callback(*args) on the loop whenever fd (a descriptor or an
+          object with fileno()) is readable, e.g. a UDP socket. With an
+          edge-triggered poller (epoll) the callback has to read until
+          EAGAIN, readiness is only reported again for new data. Safe to
+          call from any thread.
+      """
+      if not isinstance(fd, int):
+         fd = fd.fileno()
+      if self.loopident is not None and self.loopident != _get_ident():
+         self._callSoon(self.add_reader, fd, callback, *args)
+         return
+      if fd not in self.fdcallbacks:
+         self.poller.register(fd, EVENT_READ)
+      self.fdcallbacks[fd] = (callback, args)
 
+   def remove_reader(self, fd):
+      """
+          Stop watching a descriptor passed to add_reader().
+      """
+      if not isinstance(fd, int):
+         fd = fd.fileno()
+      if self.loopident is not None and self.loopident != _get_ident():
+         self._callSoon(self.remove_reader, fd)
+         return
+      if self.fdcallbacks.pop(fd, None) is not None:
+         self.poller.unregister(fd)
+
+   def _schedule(self, call):
+      if self.loopident is not None and self.loopident != _get_ident():
+         # the heap belongs to the loop thread
+         self._callSoon(self._schedule, call)
+         return call
+      self.scheduledseq += 1
+      heapq.heappush(self.scheduled, (call.due, self.scheduledseq, call))
+      return call
+
+   def _runScheduled(self):
+      scheduled = self.scheduled
+      while scheduled and scheduled[0][0] <= self.now:
+         due, seq, call = heapq.heappop(scheduled)
+         if call.cancelled:
+            continue
+         now = _monotonic()
+         self.timerlateness.add(now - due)
+         try:
+            call.callback(*call.args)
+         except Exception as n:
+            _callbackFailed(call.callback)
+         if call.interval is not None and not call.cancelled:
+            if now - due > call.interval:
+               due = now
+            call.due = due + call.interval
+            self.scheduledseq += 1
+            heapq.heappush(scheduled, (call.due, self.scheduledseq, call))
+
+   def _listen(self, host, port):
       if (host == ''):
          host = None
 
@@ -611,32 +2229,188 @@ class SimpleWebSocketServer(object):
          fam = 0
 
       hostInfo = socket.getaddrinfo(host, port, fam, socket.SOCK_STREAM, socket.IPPROTO_TCP, socket.AI_PASSIVE)
-      self.serversocket = socket.socket(hostInfo[0][0], hostInfo[0][1], hostInfo[0][2])
-      self.serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+      sock = socket.socket(hostInfo[0][0], hostInfo[0][1], hostInfo[0][2])
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
       if host is None:
          # bind on both IPv4 and IPv6 localhost 
          # if we don't explicitly set this, the behaviour isn't guranteed on some platforms. e.g. Windows
-         self.serversocket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+         sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
 
-      self.serversocket.bind(hostInfo[0][4])
-      self.serversocket.listen(5)
-      self.selectInterval = selectInterval
-      self.connections = {}
-      self.listeners = [self.serversocket]
+      sock.bind(hostInfo[0][4])
+      sock.listen(5)
+      sock.setblocking(0)
+      return sock
+
+   def _listenerClass(self, websocketclass):
+      # the class connections of a listener are made of
+      if self.workers is not None:
+         return _threadedClass(websocketclass)
+      return websocketclass
+
+   def getStats(self):
+      """
+          Server wide counters, e.g. the permessage-deflate compression
+          ratio and the time spent compressing and decompressing.
+      """
+      return {'connections': len(self.connections),
+              'compression': self.compression.asDict(),
+              'sendq': {'frames': sum(len(c.sendq) for c in self.connections.values()),
+                        'bytes': sum(c.sendqbytes for c in self.connections.values()),
+                        'dropped': self.sendqdropped,
+                        'conflated': self.sendqconflated},
+              'workers': self.workers.stats.asDict() if self.workers is not None else None,
+              'keepalive': {'timers': len(self.wheel),
+                            'pings': self.pingssent,
+                            'reaped': self.reaped},
+              'transport': self.transportStats().asDict(),
+              'loop_time': self.looptime.asDict(),
+              'timer_lateness': self.timerlateness.asDict()}
+
+   def transportStats(self):
+      """
+          TransportStats summed over the open connections and those that
+          have closed since the server started.
+      """
+      total = TransportStats()
+      total.add(self.transport)
+      for client in self.connections.values():
+         total.add(client)
+      return total
+
+   def dumpStats(self, stream = None):
+      """
+          Write getStats() and the stats of every connection as JSON lines
+          to stream (stderr by default), e.g. from a signal handler.
+      """
+      if stream is None:
+         stream = sys.stderr
+      stream.write(json.dumps({'server': self.getStats()}, sort_keys = True) + '\n')
+      for client in list(self.connections.values()):
+         stream.write(json.dumps({'connection': client.getStats()},
+                                 sort_keys = True, default = repr) + '\n')
+      stream.flush()
+
+   def broadcast(self, data, predicate = None, key = None):
+      """
+          Send one message to every connected client, or only to those for
+          which predicate(client) is true. The frame is built once and the
+          same immutable buffer is queued on every target connection.
+
+          If data is a unicode object then the frame is sent as Text.
+          If the data is a bytearray object then the frame is sent as Binary.
+          key is used for conflation, see WebSocket.sendMessage().
+
+          Returns the number of clients the message was queued for. Called
+          from another thread the broadcast is handed to the server loop
+          and None is returned.
+      """
+      if self.loopident is not None and self.loopident != _get_ident():
+         self._callSoon(self.broadcast, data, predicate, key)
+         return None
+
+      opcode = BINARY
+      if _check_unicode(data):
+         opcode = TEXT
+         data = data.encode('utf-8')
+      else:
+         data = bytes(data)
+
+      queued = _clock()
+      frame = (opcode, _frameHeader(False, opcode, len(data)), data, key, queued)
+      # compressed frames can only be shared when no context is kept
+      compressed = {}
+      count = 0
+
+      for client in list(self.connections.values()):
+         if not client.handshaked or client.closed:
+            continue
+         if predicate is not None and not predicate(client):
+            continue
+
+         deflate = client.deflate
+         if deflate is None or len(data) < deflate.options.min_size:
+            client._enqueue(frame)
+         elif deflate.server_nct:
+            shared = compressed.get(deflate.server_bits)
+            if shared is None:
+               payload = deflate.compress(data)
+               shared = (opcode, _frameHeader(False, opcode, len(payload), RSV1), payload, key, queued)
+               compressed[deflate.server_bits] = shared
+            client._enqueue(shared)
+         else:
+            client._sendMessage(False, opcode, data, key)
+         count += 1
+
+      return count
 
    def _decorateSocket(self, sock):
       return sock
 
-   def _constructWebSocket(self, sock, address):
-      return self.websocketclass(self, sock, address)
+   def _constructWebSocket(self, sock, address, websocketclass):
+      return websocketclass(self, sock, address)
 
    def close(self):
-      self.serversocket.close()
+      for listener in self.listeners.values():
+         listener.socket.close()
 
-      for desc, conn in self.connections.items():
+      for desc, conn in list(self.connections.items()):
          conn.close()
-         self._handleClose(conn)
+         self._removeClient(desc)
+
+      if self.workers is not None:
+         self.workers.close()
+      if self.waker is not None:
+         self.poller.unregister(self.wakeupfd)
+         self.waker.close()
+      self.poller.close()
+
+   def _callSoon(self, func, *args):
+      """
+          Run func(*args) on the loop thread. Safe to call from any thread.
+      """
+      with self.callslock:
+         self.calls.append((func, args))
+         if self.wakeuppending:
+            return
+         self.wakeuppending = True
+      if self.waker is not None:
+         self.waker.wake()
+
+   def _runCalls(self):
+      if self.waker is not None:
+         self.waker.drain()
+      with self.callslock:
+         calls = self.calls
+         self.calls = deque()
+         self.wakeuppending = False
+      while calls:
+         func, args = calls.popleft()
+         try:
+            func(*args)
+         except Exception as n:
+            _callbackFailed(func)
+
+   def _workDone(self, client, failed, run):
+      client.workpending -= 1
+      fileno = self._filenoOf(client)
+      if fileno is None:
+         return
+      client._recordHandler(run)
+      if failed:
+         # as inline, a failing handler drops its client
+         self._removeClient(fileno)
+      elif client.readpaused and client._belowLimits():
+         self._resumeRead(fileno, client)
+
+   def _filenoOf(self, client):
+      try:
+         fileno = client.client.fileno()
+      except socket.error:
+         return None
+      if self.connections.get(fileno) is not client:
+         return None
+      return fileno
 
    def _handleClose(self, client):
       client.client.close()
@@ -647,70 +2421,235 @@ class SimpleWebSocketServer(object):
          except:
             pass
 
-   def serveonce(self):
-      writers = []
-      for fileno in self.listeners:
-         if fileno == self.serversocket:
-            continue
-         client = self.connections[fileno]
-         if client.sendq:
-            writers.append(fileno)
+   def _removeClient(self, fileno):
+      client = self.connections.pop(fileno)
+      # a download aborted halfway leaves its file in the queue
+      for opcode, header, payload, key, queued in client.sendq:
+         if opcode == FILE:
+            payload.close()
+      self.transport.add(client)
+      self.writers.discard(fileno)
+      if client.keepalive is not None:
+         self.wheel.cancel(client.keepalive)
+         client.keepalive = None
+      try:
+         self.poller.unregister(fileno)
+      except Exception:
+         # the socket may already be closed, e.g. after a failed handshake
+         pass
+      self._handleClose(client)
 
-      rList, wList, xList = select(self.listeners, writers, self.listeners, self.selectInterval)
+   def _wantWrite(self, client):
+      fileno = client.client.fileno()
+      if fileno in self.writers or self.connections.get(fileno) is not client:
+         return
+      self.writers.add(fileno)
+      self._updateInterest(client)
 
-      for ready in wList:
-         client = self.connections[ready]
+   def _updateInterest(self, client):
+      fileno = client.client.fileno()
+      if self.connections.get(fileno) is not client:
+         return
+      events = 0 if client.readpaused else EVENT_READ
+      if fileno in self.writers:
+         events |= EVENT_WRITE
+      self.poller.modify(fileno, events)
+
+   def _resumeRead(self, fileno, client):
+      client.readpaused = False
+      # modify() re-arms an edge-triggered poller for data still in the
+      # socket, but not for records already decrypted into the SSL buffer
+      self._updateInterest(client)
+      if self.poller.edge and client.usingssl and client.client.pending():
+         self._callSoon(self._readClient, fileno, client)
+
+   def _acceptClients(self, listener):
+      # drain the accept queue, edge-triggered pollers only report it once
+      while True:
+         sock = None
          try:
-            while client.sendq:
-               opcode, payload = client.sendq.popleft()
-               remaining = client._sendBuffer(payload)
-               if remaining is not None:
-                   client.sendq.appendleft((opcode, remaining))
-                   break
-               else:
-                   if opcode == CLOSE:
-                      raise Exception('received client close')
-
+            sock, address = listener.socket.accept()
+         except socket.error as e:
+            if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+               return
+            raise e
+         try:
+            # the send queue already coalesces what is pending into one
+            # write; with Nagle a reply written while the previous one is
+            # unacknowledged would wait for the peer's delayed ACK (~40 ms)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            newsock = self._decorateSocket(sock)
+            newsock.setblocking(0)
+            fileno = newsock.fileno()
+            client = self._constructWebSocket(newsock, address, listener.websocketclass)
+            client.webroot = listener.webroot
+            self.connections[fileno] = client
+            self.poller.register(fileno, EVENT_READ)
+            self._watchClient(client)
          except Exception as n:
-            self._handleClose(client)
-            del self.connections[ready]
-            self.listeners.remove(ready)
+            if sock is not None:
+               sock.close()
+
+   def _flushClient(self, fileno, client):
+      drained = client._flushQueue()
+      if not client.handshaked:
+         # a download that keeps moving is not idle
+         client.connectedat = self.now
+      if drained:
+         # nothing left to send, stop watching for writability
+         self.writers.discard(fileno)
+      if client.readpaused and client._belowLimits():
+         self._resumeRead(fileno, client)
+      elif drained:
+         self._updateInterest(client)
 
-      for ready in rList:
-         if ready == self.serversocket:
-            sock = None
-            try:
-               sock, address = self.serversocket.accept()
-               newsock = self._decorateSocket(sock)
-               newsock.setblocking(0)
-               fileno = newsock.fileno()
-               self.connections[fileno] = self._constructWebSocket(newsock, address)
-               self.listeners.append(fileno)
-            except Exception as n:
-               if sock is not None:
-                  sock.close()
-         else:
-            if ready not in self.connections:
-                continue
-            client = self.connections[ready]
-            try:
-               client._handleData()
-            except Exception as n:
-               self._handleClose(client)
-               del self.connections[ready]
-               self.listeners.remove(ready)
+   def serveonce(self):
+      self.loopident = _get_ident()
+      now = _monotonic()
+      timeout = self.wheel.timeout(now, self.selectInterval)
+      if self.scheduled:
+         # wake up for the next call_later()/call_every() deadline
+         timeout = max(0.0, min(timeout, self.scheduled[0][0] - now))
+      try:
+         events = self.poller.poll(timeout)
+      except (select.error, IOError, OSError) as e:
+         # Python 2 does not retry a poll interrupted by a signal, e.g. a
+         # SIGUSR1 handler calling dumpStats(); count it as an empty poll
+         if e.args[0] != errno.EINTR:
+            raise
+         events = ()
+      start = _clock()
+      self.now = _monotonic()
+      for fileno, events in events:
+         self._handleEvents(fileno, events)
+      if self.waker is None and self.calls:
+         # no wakeup descriptor on this platform, run them every iteration
+         self._runCalls()
+      if self.scheduled:
+         self._runScheduled()
+      self.wheel.advance(self.now)
+      self.looptime.add(_clock() - start)
+
+   def _watchClient(self, client):
+      """
+          (Re)schedule the keepalive check of client at its earliest
+          deadline, if any of its checks is enabled.
+      """
+      if client.keepalive is not None:
+         self.wheel.cancel(client.keepalive)
+         client.keepalive = None
+
+      deadlines = []
+      if not client.handshaked:
+         timeout = client._handshakeTimeout()
+         if timeout is not None:
+            deadlines.append(client.connectedat + timeout)
+      else:
+         if client.pingsent is not None:
+            if client.pongtimeout is not None:
+               deadlines.append(client.pingsent + client.pongtimeout)
+         elif client.pinginterval is not None:
+            deadlines.append(client.lastrecv + client.pinginterval)
+         if client.idleclosed is not None:
+            if client.pongtimeout is not None:
+               deadlines.append(client.idleclosed + client.pongtimeout)
+         elif client.idletimeout is not None:
+            deadlines.append(client.lastmessage + client.idletimeout)
+      if deadlines:
+         client.keepalive = self.wheel.schedule(self.now, min(deadlines) - self.now,
+                                                self._checkClient, client)
+
+   def _checkClient(self, client):
+      client.keepalive = None
+      fileno = self._filenoOf(client)
+      if fileno is None:
+         return
+      now = self.now
+
+      if not client.handshaked:
+         # a response that is still going out moves connectedat forward
+         timeout = client._handshakeTimeout()
+         if timeout is not None and now - client.connectedat >= timeout:
+            self._reapClient(fileno)
+            return
+      else:
+         # any traffic after the ping counts as the answer
+         if client.pingsent is not None and client.lastrecv > client.pingsent:
+            client.pingsent = None
+         if client.pingsent is not None:
+            if client.pongtimeout is not None and now - client.pingsent >= client.pongtimeout:
+               self._reapClient(fileno)
+               return
+         elif client.pinginterval is not None and now - client.lastrecv >= client.pinginterval:
+            client._sendMessage(False, PING, b'')
+            client.pingsent = now
+            self.pingssent += 1
+
+         if client.idleclosed is not None:
+            if client.pongtimeout is not None and now - client.idleclosed >= client.pongtimeout:
+               self._reapClient(fileno)
+               return
+         elif client.idletimeout is not None and now - client.lastmessage >= client.idletimeout:
+            client.close(1001, u'idle timeout')
+            client.idleclosed = now
+
+      self._watchClient(client)
+
+   def _reapClient(self, fileno):
+      self.reaped += 1
+      self._removeClient(fileno)
+
+   def _handleEvents(self, fileno, events):
+      if fileno == self.wakeupfd:
+         self._runCalls()
+         return
 
-      for failed in xList:
-         if failed == self.serversocket:
+      client = self.connections.get(fileno)
+      if client is None:
+         listener = self.listeners.get(fileno)
+         if listener is None:
+            reader = self.fdcallbacks.get(fileno)
+            if reader is not None:
+               try:
+                  reader[0](*reader[1])
+               except Exception as n:
+                  _callbackFailed(reader[0])
+            return
+         if events & EVENT_ERROR:
             self.close()
             raise Exception('server socket failed')
-         else:
-            if failed not in self.connections:
-               continue
-            client = self.connections[failed]
-            self._handleClose(client)
-            del self.connections[failed]
-            self.listeners.remove(failed)
+         try:
+            self._acceptClients(listener)
+         except Exception as n:
+            pass
+         return
+
+      if events & EVENT_WRITE:
+         try:
+            self._flushClient(fileno, client)
+         except Exception as n:
+            self._removeClient(fileno)
+            return
+
+      if events & EVENT_READ and not client.readpaused:
+         if not self._readClient(fileno, client):
+            return
+
+      if events & EVENT_ERROR:
+         self._removeClient(fileno)
+
+   def _readClient(self, fileno, client):
+      if self.connections.get(fileno) is not client or client.readpaused:
+         return False
+      try:
+         more = client._handleData()
+         # a client paused by back-pressure is read again by _resumeRead
+         while more and self.poller.edge and not client.readpaused:
+            more = client._handleData()
+      except Exception as n:
+         self._removeClient(fileno)
+         return False
+      return True
 
    def serveforever(self):
       while True:
@@ -719,10 +2658,12 @@ class SimpleWebSocketServer(object):
 class SimpleSSLWebSocketServer(SimpleWebSocketServer):
 
    def __init__(self, host, port, websocketclass, certfile = None,
-                keyfile = None, version = ssl.PROTOCOL_TLSv1_2, selectInterval = 0.1, ssl_context = None):
+                keyfile = None, version = ssl.PROTOCOL_TLSv1_2, selectInterval = 0.1, ssl_context = None,
+                poller = None, deflate = None, workers = 0, webroot = None):
 
       SimpleWebSocketServer.__init__(self, host, port,
-                                        websocketclass, selectInterval)
+                                        websocketclass, selectInterval, poller, deflate, workers,
+                                        webroot)
 
       if ssl_context is None:
          self.context = ssl.SSLContext(version)
@@ -737,8 +2678,8 @@ class SimpleSSLWebSocketServer(SimpleWebSocketServer):
       sslsock = self.context.wrap_socket(sock, server_side=True)
       return sslsock
 
-   def _constructWebSocket(self, sock, address):
-      ws = self.websocketclass(self, sock, address)
+   def _constructWebSocket(self, sock, address, websocketclass):
+      ws = websocketclass(self, sock, address)
       ws.usingssl = True
       return ws
 
@@ -112,17 +112,25 @@ const NaoController = () => {
         // Para walk: adelante = vy local; lateral = vx local
         sendMessage({ action: 'walk', vx: vy, vy: vx, wz: 0 });
         break;
+      // Las dos articulaciones en un solo frame: el servidor las aplica
+      // con un único setAngles
       case 'larm':
-        sendMessage({ action: 'move', joint: 'LShoulderPitch', value: vy });
-        sendMessage({ action: 'move', joint: 'LShoulderRoll', value: vx });
+        sendMessage({ action: 'batch', items: [
+          { action: 'move', joint: 'LShoulderPitch', value: vy },
+          { action: 'move', joint: 'LShoulderRoll', value: vx },
+        ] });
         break;
       case 'rarm':
-        sendMessage({ action: 'move', joint: 'RShoulderPitch', value: vy });
-        sendMessage({ action: 'move', joint: 'RShoulderRoll', value: vx });
+        sendMessage({ action: 'batch', items: [
+          { action: 'move', joint: 'RShoulderPitch', value: vy },
+          { action: 'move', joint: 'RShoulderRoll', value: vx },
+        ] });
         break;
       case 'head':
-        sendMessage({ action: 'move', joint: 'HeadPitch', value: vy });
-        sendMessage({ action: 'move', joint: 'HeadYaw', value: vx });
+        sendMessage({ action: 'batch', items: [
+          { action: 'move', joint: 'HeadPitch', value: vy },
+          { action: 'move', joint: 'HeadYaw', value: vx },
+        ] });
         break;
       default:
         break;
@@ -151,12 +159,12 @@ const NaoController = () => {
       // 1) Detener movimiento
       currentValuesRef.current = { x: 0, y: 0, mode };
       if (sendMessage) {
-        sendMessage({ action: 'walk', vx: 0, vy: 0, wz: 0 });
-        console.log('[JOY] walk STOP');
-        
-        // 2) Volver a Stand
-        sendMessage({ action: 'posture', value: 'Stand' });
-        console.log('[JOY] STAND enviado tras parada');
+        // 2) Volver a Stand, en el mismo frame y en este orden
+        sendMessage({ action: 'batch', items: [
+          { action: 'walk', vx: 0, vy: 0, wz: 0 },
+          { action: 'posture', value: 'Stand' },
+        ] });
+        console.log('[JOY] walk STOP + STAND enviados');
       }
     } else {
       console.log('[JOY] hold position (mode=' + mode + ')');
@@ -45,7 +45,9 @@ const useWebSocket = (port = 6671) => {
       try {
         wsRef.current.send(JSON.stringify(message));
         // Solo log para comandos que no sean de movimiento continuo
-        if (message.action !== 'walk' && message.action !== 'move') {
+        const continuous = (m) => m.action === 'walk' || m.action === 'move';
+        const items = message.action === 'batch' ? message.items : [message];
+        if (!items.every(continuous)) {
           console.log("[WS] Enviado:", message);
         }
         return true;
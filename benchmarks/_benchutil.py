@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+_benchutil.py - Utilidades compartidas por los benchmarks de SimpleWebSocketServer
+
+- Carga del módulo SimpleWebSocketServer desde el payload del instalador
+  (o desde una ruta alternativa para comparar contra otra versión).
+- Construcción de frames WebSocket tal y como los envía un navegador.
+"""
+
+import os
+import sys
+import struct
+import random
+import time
+
+SWS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                       "NaoControlInstaller", "payload", "SimpleWebSocketServer-0.1.2")
+
+# Mensaje típico del joystick (~15 Hz por cliente)
+WALK_MSG = b'{"action":"walk","vx":0.42,"vy":-0.17,"wz":0.05}'
+
+def load_sws(path=None):
+    """Importar SimpleWebSocketServer; con path se carga ese fichero concreto."""
+    if path is None:
+        sys.path.insert(0, os.path.normpath(SWS_DIR))
+        import SimpleWebSocketServer
+        # el paquete re-exporta la clase con el mismo nombre que el módulo
+        return sys.modules["SimpleWebSocketServer.SimpleWebSocketServer"]
+    name = "sws_bench_%d" % abs(hash(path))
+    if sys.version_info[0] >= 3:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    import imp
+    return imp.load_source(name, path)
+
+def make_frame(payload, opcode=0x1, fin=True, mask=True):
+    """Frame cliente → servidor (enmascarado, como exige RFC 6455)."""
+    payload = bytearray(payload)
+    frame = bytearray()
+    frame.append((0x80 if fin else 0) | opcode)
+    length = len(payload)
+    mbit = 0x80 if mask else 0
+    if length <= 125:
+        frame.append(mbit | length)
+    elif length <= 65535:
+        frame.append(mbit | 126)
+        frame.extend(struct.pack("!H", length))
+    else:
+        frame.append(mbit | 127)
+        frame.extend(struct.pack("!Q", length))
+    if mask:
+        key = bytearray(random.getrandbits(8) for _ in range(4))
+        frame.extend(key)
+        frame.extend(bytearray(b ^ key[i % 4] for i, b in enumerate(payload)))
+    else:
+        frame.extend(payload)
+    return bytes(frame)
+
+class NullServer(object):
+    """Servidor mínimo para instanciar WebSocket sin abrir sockets."""
+    workers = None
+    loopident = None
+    now = 0.0
+    deflate = None
+    webroot = None
+    recvbuffer = bytearray(16384)
+    recvview = memoryview(recvbuffer)
+
+    def _wantWrite(self, client):
+        pass
+
+    def _watchClient(self, client):
+        pass
+
+class StreamSocket(object):
+    """Socket falso que entrega un flujo de bytes en trozos de hasta chunk."""
+    def __init__(self, data, chunk=16384):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.chunk = chunk
+
+    def remaining(self):
+        return len(self.data) - self.pos
+
+    def recv(self, size):
+        size = min(size, self.chunk)
+        out = self.data[self.pos:self.pos + size].tobytes()
+        self.pos += len(out)
+        return out
+
+    def recv_into(self, buff, size=0):
+        size = min(size or len(buff), self.chunk, self.remaining())
+        buff[:size] = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+    def send(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+def timed(func, *args):
+    """Ejecutar func(*args) y devolver (resultado, segundos de pared)."""
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
@@ -0,0 +1,83 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_broadcast.py - Coste de difundir un mensaje a N clientes
+
+Compara el bucle clásico `for client: client.sendMessage(msg)` (un frame
+por cliente) con `server.broadcast(msg)` (un frame compartido) para 1, 10,
+100 y 1000 clientes conectados. Solo se mide el encolado en sendq; la
+escritura al socket es idéntica en ambos casos.
+
+Uso:
+    python2 benchmarks/bench_broadcast.py
+    python2 benchmarks/bench_broadcast.py --clients 10 100 --size 2048
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import socket
+
+from _benchutil import load_sws, timed
+
+def attach_clients(sws, server, n):
+    """Conectar n clientes mediante socketpair, ya con handshake hecho."""
+    peers = []
+    for i in range(n):
+        local, remote = socket.socketpair()
+        local.setblocking(0)
+        ws = server.websocketclass(server, local, ("bench", i))
+        ws.handshaked = True
+        server.connections[local.fileno()] = ws
+        server.poller.register(local.fileno(), sws.EVENT_READ)
+        peers.append(remote)
+    return peers
+
+def clear_queues(server):
+    for client in server.connections.values():
+        client.sendq.clear()
+        server.writers.discard(client.client.fileno())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--size", type=int, default=0,
+                        help="tamaño del payload; 0 = entrada de log típica")
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    sws = load_sws()
+    if args.size:
+        message = u"x" * args.size
+    else:
+        message = json.dumps({"module": "CONTROL", "level": "INFO",
+                              "message": "moveToward(vx=0.42, vy=-0.17, wz=0.05)",
+                              "timestamp": "12:34:56.789"})
+
+    print("%8s %16s %16s %10s" % ("clients", "sendMessage us", "broadcast us", "speedup"))
+    for n in args.clients:
+        server = sws.SimpleWebSocketServer("127.0.0.1", 0, sws.WebSocket)
+        peers = attach_clients(sws, server, n)
+
+        def loop():
+            for _ in range(args.messages):
+                for client in list(server.connections.values()):
+                    client.sendMessage(message)
+
+        def shared():
+            for _ in range(args.messages):
+                server.broadcast(message)
+
+        _, t_loop = timed(loop)
+        clear_queues(server)
+        _, t_shared = timed(shared)
+
+        print("%8d %16.1f %16.1f %9.1fx" % (
+            n, t_loop / args.messages * 1e6, t_shared / args.messages * 1e6, t_loop / t_shared))
+
+        server.close()
+        for peer in peers:
+            peer.close()
+
+if __name__ == "__main__":
+    main()
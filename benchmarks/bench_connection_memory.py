@@ -0,0 +1,113 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_connection_memory.py - Memoria (RSS) por conexión de SimpleWebSocketServer
+
+Arranca el servidor en un proceso aparte y mide su VmRSS antes de conectar,
+con N clientes conectados sin tráfico (idle) y con los mismos N clientes
+activos: cada uno ha intercambiado mensajes de joystick, tiene un mensaje de
+texto fragmentado a medias y medio frame pendiente en el buffer.
+Cada N usa un proceso servidor nuevo, ya que el RSS no baja al liberar.
+
+Uso:
+    python2 benchmarks/bench_connection_memory.py
+    python2 benchmarks/bench_connection_memory.py --module /tmp/SimpleWebSocketServer_old.py
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from _benchutil import load_sws, make_frame, WALK_MSG
+
+def rss_kb(pid):
+    with open("/proc/%d/status" % pid) as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS no disponible")
+
+def serve(module):
+    """Proceso servidor: eco, imprime el puerto y atiende hasta que lo maten."""
+    sws = load_sws(module)
+
+    class Echo(sws.WebSocket):
+        __slots__ = ()
+
+        def handleMessage(self):
+            self.sendMessage(self.data)
+
+    server = sws.SimpleWebSocketServer("127.0.0.1", 0, Echo)
+    print(server.serversocket.getsockname()[1])
+    sys.stdout.flush()
+    server.serveforever()
+
+def settle(pid):
+    """Esperar a que el servidor procese lo enviado y el RSS se estabilice."""
+    last = None
+    while True:
+        time.sleep(0.2)
+        current = rss_kb(pid)
+        if current == last:
+            return current
+        last = current
+
+def measure(module, count):
+    from bench_event_loop import Client
+
+    command = [sys.executable, os.path.abspath(__file__), "--serve"]
+    if module:
+        command += ["--module", module]
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        port = int(proc.stdout.readline())
+        base = settle(proc.pid)
+
+        clients = [Client(port) for _ in range(count)]
+        idle = settle(proc.pid)
+
+        for client in clients:
+            client.send(make_frame(WALK_MSG))
+            client.read()
+        for client in clients:
+            client.send(make_frame(b'{"action":"say","text":"ho', fin=False))
+            frame = make_frame(WALK_MSG)
+            client.send(frame[:len(frame) // 2])
+        active = settle(proc.pid)
+
+        for client in clients:
+            client.close()
+        return base, idle, active
+    finally:
+        proc.kill()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--module", help="ruta a un SimpleWebSocketServer.py alternativo")
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.module)
+        return
+
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError):
+        pass
+
+    print("%8s %10s %14s %16s" % ("clients", "base KB", "idle KB/conn", "active KB/conn"))
+    for count in args.clients:
+        base, idle, active = measure(args.module, count)
+        print("%8d %10d %14.2f %16.2f" % (
+            count, base, float(idle - base) / count, float(active - base) / count))
+
+if __name__ == "__main__":
+    main()
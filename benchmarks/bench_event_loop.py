@@ -0,0 +1,170 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_event_loop.py - Escalado del bucle de eventos de SimpleWebSocketServer
+
+Levanta un servidor eco en un proceso hijo por cada backend de readiness
+(epoll, poll, select, o el motor asyncio en Python 3), conecta 1, 10, 100 y 1000 clientes y mide:
+
+- latencia del bucle: RTT de un cliente sonda mientras el resto está ocioso
+- CPU por mensaje: CPU del servidor (user+sys) / mensajes cuando todos
+  los clientes envían un frame por ronda
+
+Uso:
+    python2 benchmarks/bench_event_loop.py
+    python2 benchmarks/bench_event_loop.py --clients 1 10 100 --backends epoll select
+    python2 benchmarks/bench_event_loop.py --module /tmp/SimpleWebSocketServer_old.py --backends legacy
+    python3 benchmarks/bench_event_loop.py --backends asyncio epoll
+"""
+
+from __future__ import print_function
+import argparse
+import base64
+import json
+import os
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from _benchutil import load_sws, make_frame, WALK_MSG
+
+CPU_QUERY = b"__cpu__"
+
+def serve(port, backend, module):
+    sws = load_sws(module)
+
+    class EchoWS(sws.WebSocket):
+        def handleMessage(self):
+            if self.data == CPU_QUERY.decode("ascii"):
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                self.sendMessage(json.dumps({"cpu": usage.ru_utime + usage.ru_stime}))
+            else:
+                self.sendMessage(self.data)
+
+    if backend == "asyncio":
+        from SimpleWebSocketServer.AsyncWebSocketServer import AsyncWebSocketServer
+        server = AsyncWebSocketServer("127.0.0.1", port, EchoWS)
+    elif backend == "legacy":
+        server = sws.SimpleWebSocketServer("127.0.0.1", port, EchoWS)
+    else:
+        server = sws.SimpleWebSocketServer("127.0.0.1", port, EchoWS, poller=backend)
+    # Avisar al padre de que el puerto está escuchando
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+    server.serveforever()
+
+class Client(object):
+    def __init__(self, port, host="127.0.0.1"):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self.sock.sendall(("GET / HTTP/1.1\r\nHost: bench\r\nUpgrade: websocket\r\n"
+                           "Connection: Upgrade\r\nSec-WebSocket-Key: %s\r\n"
+                           "Sec-WebSocket-Version: 13\r\n\r\n" % key).encode("ascii"))
+        self.buf = bytearray()
+        while b"\r\n\r\n" not in self.buf:
+            self.buf.extend(self.sock.recv(4096))
+        del self.buf[:self.buf.index(b"\r\n\r\n") + 4]
+
+    def _need(self, n):
+        while len(self.buf) < n:
+            data = self.sock.recv(65536)
+            if not data:
+                raise EOFError("servidor cerró la conexión")
+            self.buf.extend(data)
+
+    def read(self):
+        self._need(2)
+        length = self.buf[1] & 0x7F
+        pos = 2
+        if length == 126:
+            self._need(4)
+            length = struct.unpack_from("!H", bytes(self.buf[2:4]))[0]
+            pos = 4
+        elif length == 127:
+            self._need(10)
+            length = struct.unpack_from("!Q", bytes(self.buf[2:10]))[0]
+            pos = 10
+        self._need(pos + length)
+        payload = bytes(self.buf[pos:pos + length])
+        del self.buf[:pos + length]
+        return payload
+
+    def send(self, frame):
+        self.sock.sendall(frame)
+
+    def close(self):
+        self.sock.close()
+
+def server_cpu(client):
+    client.send(make_frame(CPU_QUERY))
+    return json.loads(client.read().decode("utf-8"))["cpu"]
+
+def measure(port, nclients, rounds, probes):
+    clients = [Client(port) for _ in range(nclients)]
+    probe = clients[0]
+    frame = make_frame(WALK_MSG)
+
+    # Latencia con el resto de clientes ociosos
+    rtts = []
+    for _ in range(probes):
+        start = time.time()
+        probe.send(frame)
+        probe.read()
+        rtts.append(time.time() - start)
+    rtts.sort()
+
+    # CPU por mensaje con todos los clientes activos
+    rounds = max(rounds, 20000 // nclients)
+    cpu_start = server_cpu(probe)
+    for _ in range(rounds):
+        for c in clients:
+            c.send(frame)
+        for c in clients:
+            c.read()
+    cpu = server_cpu(probe) - cpu_start
+
+    for c in clients:
+        c.close()
+    return rtts[len(rtts) // 2], rtts[int(len(rtts) * 0.99) - 1], cpu / float(nclients * rounds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--backends", nargs="+", default=["epoll", "poll", "select"])
+    parser.add_argument("--module", help="ruta a un SimpleWebSocketServer.py alternativo")
+    parser.add_argument("--rounds", type=int, default=20,
+                        help="rondas mínimas (se amplían hasta ~20000 mensajes)")
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--port", type=int, default=9871)
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.serve, args.module)
+        return
+
+    print("%-8s %8s %12s %12s %14s" % ("backend", "clients", "rtt p50 ms", "rtt p99 ms", "cpu/msg us"))
+    for backend in args.backends:
+        for n in args.clients:
+            cmd = [sys.executable, os.path.abspath(__file__), "--serve", backend,
+                   "--port", str(args.port)]
+            if args.module:
+                cmd += ["--module", args.module]
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+            try:
+                proc.stdout.readline()
+                p50, p99, cpu = measure(args.port, n, args.rounds, args.probes)
+                print("%-8s %8d %12.3f %12.3f %14.1f" % (backend, n, p50 * 1e3, p99 * 1e3, cpu * 1e6))
+            except Exception as e:
+                print("%-8s %8d %12s   (%s)" % (backend, n, "error", e))
+            finally:
+                proc.kill()
+                proc.wait()
+            args.port += 1
+
+if __name__ == "__main__":
+    main()
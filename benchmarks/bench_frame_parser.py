@@ -0,0 +1,61 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_frame_parser.py - Microbenchmark del parser de frames de SimpleWebSocketServer
+
+Alimenta WebSocket._handleData con un flujo de frames enmascarados (tráfico
+tipo joystick o payloads más grandes) y reporta frames/s y MB/s.
+
+Uso:
+    python2 benchmarks/bench_frame_parser.py
+    python2 benchmarks/bench_frame_parser.py --module /tmp/SimpleWebSocketServer_old.py
+
+Con --module se puede medir otra versión del servidor (p.ej. la extraída con
+`git show <rev>:NaoControlInstaller/.../SimpleWebSocketServer.py`) y comparar.
+"""
+
+from __future__ import print_function
+import argparse
+
+from _benchutil import load_sws, make_frame, NullServer, StreamSocket, timed, WALK_MSG
+
+def run(sws, payload, frames):
+    stream = make_frame(payload) * frames
+    count = [0]
+
+    class CountingWS(sws.WebSocket):
+        def handleMessage(self):
+            count[0] += 1
+
+    sock = StreamSocket(stream)
+    ws = CountingWS(NullServer(), sock, ("bench", 0))
+    ws.handshaked = True
+
+    def drain():
+        while sock.remaining():
+            ws._handleData()
+
+    _, elapsed = timed(drain)
+    assert count[0] == frames, "frames perdidos: %d/%d" % (count[0], frames)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--module", help="ruta a un SimpleWebSocketServer.py alternativo")
+    parser.add_argument("--frames", type=int, default=20000)
+    args = parser.parse_args()
+
+    sws = load_sws(args.module)
+    cases = [
+        ("walk json (%dB)" % len(WALK_MSG), WALK_MSG, args.frames),
+        ("1 KB", b"x" * 1024, max(1, args.frames // 10)),
+        ("64 KB", b"x" * 65536, max(1, args.frames // 200)),
+    ]
+    print("%-18s %10s %12s %10s" % ("payload", "frames", "frames/s", "MB/s"))
+    for name, payload, frames in cases:
+        elapsed = run(sws, payload, frames)
+        print("%-18s %10d %12.0f %10.2f" % (
+            name, frames, frames / elapsed, len(payload) * frames / elapsed / 1e6))
+
+if __name__ == "__main__":
+    main()
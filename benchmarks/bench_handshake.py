@@ -0,0 +1,65 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_handshake.py - Handshakes por segundo de SimpleWebSocketServer
+
+Alimenta WebSocket._handleData con la petición de upgrade que envía Chrome
+(~500 bytes de cabeceras) y cuenta cuántos handshakes completos se procesan
+por segundo: parseo de cabeceras, cálculo de Sec-WebSocket-Accept y
+encolado de la respuesta. La petición se entrega entera o troceada en
+--chunk bytes, como llega por una WiFi lenta.
+
+Uso:
+    python2 benchmarks/bench_handshake.py
+    python2 benchmarks/bench_handshake.py --module /tmp/SimpleWebSocketServer_old.py
+"""
+
+from __future__ import print_function
+import argparse
+
+from _benchutil import load_sws, NullServer, StreamSocket, timed
+
+REQUEST = (
+    b"GET /ws HTTP/1.1\r\n"
+    b"Host: nao.local:8000\r\n"
+    b"Connection: Upgrade\r\n"
+    b"Pragma: no-cache\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"User-Agent: Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 "
+    b"(KHTML, like Gecko) Chrome/118.0.0.0 Mobile Safari/537.36\r\n"
+    b"Upgrade: websocket\r\n"
+    b"Origin: http://nao.local:8080\r\n"
+    b"Sec-WebSocket-Version: 13\r\n"
+    b"Accept-Encoding: gzip, deflate\r\n"
+    b"Accept-Language: es-ES,es;q=0.9,en;q=0.8\r\n"
+    b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    b"Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n"
+    b"\r\n")
+
+def run(sws, count, chunk):
+    def handshakes():
+        for i in range(count):
+            sock = StreamSocket(REQUEST, chunk)
+            ws = sws.WebSocket(NullServer(), sock, ("bench", i))
+            while not ws.handshaked:
+                ws._handleData()
+
+    _, elapsed = timed(handshakes)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--module", help="ruta a un SimpleWebSocketServer.py alternativo")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, nargs="+", default=[2048, 64])
+    args = parser.parse_args()
+
+    sws = load_sws(args.module)
+    print("%-10s %10s %14s %12s" % ("chunk", "handshakes", "handshakes/s", "us/handshake"))
+    for chunk in args.chunk:
+        elapsed = run(sws, args.count, chunk)
+        print("%-10d %10d %14.0f %12.1f" % (
+            chunk, args.count, args.count / elapsed, elapsed / args.count * 1e6))
+
+if __name__ == "__main__":
+    main()
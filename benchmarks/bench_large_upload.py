@@ -0,0 +1,120 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_large_upload.py - Memoria pico y bloqueo del bucle al recibir un binario grande
+
+Simula la subida de un paquete de comportamiento o un clip de audio: un
+mensaje binario de --size MB enviado en un único frame o fragmentado en
+frames de 64 KB. Cada caso corre en un proceso nuevo y reporta:
+  - memoria extra pico (VmHWM - VmRSS antes de recibir), en MB
+  - la llamada a _handleData más lenta (cuánto se bloquea el bucle), en ms
+  - tiempo total y MB/s
+
+Modos: "message" ensambla el mensaje para handleMessage; "stream" activa
+streambinary y recibe los trozos en handleChunk (se escriben a /dev/null).
+
+Uso:
+    python2 benchmarks/bench_large_upload.py
+    python2 benchmarks/bench_large_upload.py --module /tmp/SimpleWebSocketServer_old.py
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _benchutil import load_sws, make_frame, NullServer, StreamSocket
+
+FRAGMENT = 65536
+
+def proc_kb(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise RuntimeError("%s no disponible" % field)
+
+def build_stream(size, fragmented):
+    payload = os.urandom(size)
+    if not fragmented:
+        return make_frame(payload, opcode=0x2)
+    frames = []
+    for start in range(0, size, FRAGMENT):
+        opcode = 0x2 if start == 0 else 0x0
+        frames.append(make_frame(payload[start:start + FRAGMENT], opcode=opcode,
+                                 fin=start + FRAGMENT >= size))
+    return b"".join(frames)
+
+def run_case(module, path, streaming):
+    """Proceso hijo: recibe el mensaje e imprime pico KB, peor llamada y total."""
+    sws = load_sws(module)
+    # leído de un fichero para no dejar basura de la construcción en el heap
+    with open(path, "rb") as source:
+        stream = source.read()
+    size = int(os.path.basename(path).split("-")[1])
+    sink = open(os.devnull, "wb")
+    received = [0]
+
+    class Upload(sws.WebSocket):
+        streambinary = streaming
+
+        def handleMessage(self):
+            received[0] += len(self.data)
+
+        def handleChunk(self, data, first, last):
+            sink.write(data)
+            received[0] += len(data)
+
+    sock = StreamSocket(stream)
+    ws = Upload(NullServer(), sock, ("bench", 0))
+    ws.maxpayload = size + 1
+    ws.handshaked = True
+
+    # reiniciar VmHWM para medir solo la recepción
+    with open("/proc/self/clear_refs", "w") as refs:
+        refs.write("5")
+    base = proc_kb("VmRSS")
+    worst = 0.0
+    start = time.time()
+    while sock.remaining():
+        before = time.time()
+        ws._handleData()
+        worst = max(worst, time.time() - before)
+    total = time.time() - start
+    assert received[0] == size, "recibidos %d de %d" % (received[0], size)
+    print(proc_kb("VmHWM") - base, worst, total)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--module", help="ruta a un SimpleWebSocketServer.py alternativo")
+    parser.add_argument("--size", type=int, default=16, help="tamaño del mensaje en MB")
+    parser.add_argument("--case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = args.size * 1024 * 1024
+
+    if args.case:
+        run_case(args.module, args.case[0], args.case[1] == "stream")
+        return
+
+    print("%-12s %-8s %12s %14s %10s" % ("frames", "mode", "peak MB", "worst call ms", "MB/s"))
+    for framing in ("single", "fragmented"):
+        handle, path = tempfile.mkstemp(prefix="upload-%d-" % size)
+        try:
+            with os.fdopen(handle, "wb") as target:
+                target.write(build_stream(size, framing == "fragmented"))
+            for mode in ("message", "stream"):
+                command = [sys.executable, os.path.abspath(__file__), "--case", path, mode]
+                if args.module:
+                    command += ["--module", args.module]
+                output = subprocess.check_output(command).split()
+                peak, worst, total = int(output[0]), float(output[1]), float(output[2])
+                print("%-12s %-8s %12.1f %14.1f %10.1f" % (
+                    framing, mode, peak / 1024.0, worst * 1e3, args.size / total))
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_load.py - Carga realista contra control_server.py (6671) y logger.py (6672)
+
+Arranca logger.py y control_server.py con el NAOqi simulado de naoqi_stub/
+(o usa unos ya en marcha con --no-start) y abre N clientes de mando y M de
+logs que reproducen el tráfico de la web del mando:
+
+  - joystick a 15 Hz: walk, o un batch con dos move (pitch + roll) en modo
+    brazos (dos frames move sueltos con --no-batch, como la web anterior)
+  - getBattery cada 10 s y getAutonomousLife cada 30 s (y al conectar)
+  - ping WebSocket a 5 Hz por cliente: latencia del bucle tal como la ve
+    el joystick, que no recibe respuesta a walk
+  - clientes de logs suscritos a 6672 y logs inyectados por UDP (6673)
+
+Reporta throughput, latencias p50/p95/p99 de ida y vuelta desde los
+clientes y, del lado del servidor, los tiempos de cola, de handler y del
+bucle que vuelca SimpleWebSocketServer con SIGUSR1 (kill -USR1), más el
+RSS, la CPU y los cambios de contexto de los procesos servidores. Con --inproc el
+logger corre dentro de control_server.py (NAO_LOGGER_INPROC=1). Al final
+pide getMetrics: walk recibidos, RPC a NAOqi enviadas y evitadas por el
+buzón de walk, y latencia de la orden hasta la vuelta de moveToward.
+
+Uso:
+    python2 benchmarks/bench_load.py
+    python2 benchmarks/bench_load.py --clients 8 --log-clients 4 --duration 60
+    python2 benchmarks/bench_load.py --sws /tmp/SimpleWebSocketServer-old --json old.json
+    python2 benchmarks/bench_load.py --inproc
+    python2 benchmarks/bench_load.py --no-start --host 192.168.1.40
+"""
+
+from __future__ import print_function
+import argparse
+import heapq
+import json
+import os
+import random
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from _benchutil import SWS_DIR, make_frame
+from bench_event_loop import Client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROBOT_DIR = os.path.join(HERE, os.pardir, "robot_scripts")
+STUB_DIR = os.path.join(HERE, "naoqi_stub")
+
+CONTROL_PORT = 6671
+LOG_PORT = 6672
+LOG_UDP_PORT = 6673
+
+JOYSTICK_HZ = 15.0
+PING_HZ = 5.0
+# respuestas que esperan las consultas periódicas de la web
+REPLIES = {"getBattery": "battery", "getAutonomousLife": "autonomousLifeEnabled"}
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"n": len(samples), "p50": pick(0.50), "p95": pick(0.95),
+            "p99": pick(0.99), "max": samples[-1]}
+
+class LoadClient(Client):
+    """Cliente no bloqueante: parsea frames de servidor a medida que llegan."""
+
+    def __init__(self, host, port):
+        Client.__init__(self, port, host)
+        self.sock.setblocking(0)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, frame):
+        self.sock.setblocking(1)
+        try:
+            self.sock.sendall(frame)
+        finally:
+            self.sock.setblocking(0)
+
+    def feed(self):
+        """Leer lo disponible y devolver los frames completos (opcode, payload)."""
+        try:
+            data = self.sock.recv(65536)
+        except socket.error:
+            return []
+        if not data:
+            raise EOFError("servidor cerró la conexión")
+        self.buf.extend(data)
+        frames = []
+        while len(self.buf) >= 2:
+            length = self.buf[1] & 0x7F
+            pos = 2
+            if length == 126:
+                if len(self.buf) < 4:
+                    break
+                length = struct.unpack_from("!H", bytes(self.buf[2:4]))[0]
+                pos = 4
+            elif length == 127:
+                if len(self.buf) < 10:
+                    break
+                length = struct.unpack_from("!Q", bytes(self.buf[2:10]))[0]
+                pos = 10
+            if len(self.buf) < pos + length:
+                break
+            frames.append((self.buf[0] & 0x0F, bytes(self.buf[pos:pos + length])))
+            del self.buf[:pos + length]
+        return frames
+
+class Results(object):
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.logs = 0
+        self.errors = 0
+        self.rtt = {"ping": [], "getBattery": [], "getAutonomousLife": [], "log": []}
+
+def control_schedule(index, now, arms):
+    """Eventos iniciales de un cliente de mando: (instante, cliente, tipo)."""
+    phase = random.random()
+    return [(now + phase / JOYSTICK_HZ, index, "arms" if arms else "walk"),
+            (now + phase / PING_HZ, index, "ping"),
+            (now + phase, index, "getBattery"),
+            (now + phase, index, "getAutonomousLife")]
+
+def run_load(args, results):
+    host = args.host
+    controls = [LoadClient(host, CONTROL_PORT) for _ in range(args.clients)]
+    loggers = [LoadClient(host, LOG_PORT) for _ in range(args.log_clients)]
+    narms = int(round(args.clients * args.arms))
+    periods = {"walk": 1.0 / JOYSTICK_HZ, "arms": 1.0 / JOYSTICK_HZ,
+               "ping": 1.0 / PING_HZ, "getBattery": args.battery,
+               "getAutonomousLife": args.life}
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    start = time.time()
+    events = []
+    for index in range(len(controls)):
+        events.extend(control_schedule(index, start, index < narms))
+    # el receptor UDP de logger.py solo escucha en 127.0.0.1
+    if args.log_rate and loggers and host in ("127.0.0.1", "localhost"):
+        events.append((start, -1, "log"))
+    heapq.heapify(events)
+    # envíos pendientes de respuesta por cliente y tipo, en orden
+    waiting = [dict((kind, []) for kind in REPLIES) for _ in controls]
+    logseq = 0
+    sentlogs = {}
+    end = start + args.duration
+    lookup = dict((c.fileno(), (i, c, True)) for i, c in enumerate(controls))
+    lookup.update((c.fileno(), (i, c, False)) for i, c in enumerate(loggers))
+
+    while True:
+        now = time.time()
+        while events and events[0][0] <= now:
+            due, index, kind = heapq.heappop(events)
+            if due >= end:
+                continue
+            if kind == "log":
+                logseq += 1
+                sentlogs[logseq] = time.time()
+                udp.sendto(json.dumps({"module": "BENCH", "level": "INFO",
+                                       "message": "bench %d" % logseq}).encode("utf-8"),
+                           (host, LOG_UDP_PORT))
+                heapq.heappush(events, (due + 1.0 / args.log_rate, index, kind))
+                continue
+            client = controls[index]
+            if kind == "walk":
+                vx, vy = random.uniform(-1, 1), random.uniform(-1, 1)
+                client.send(make_frame(json.dumps({"action": "walk", "vx": vx, "vy": vy,
+                                                   "wz": 0}).encode("utf-8")))
+                results.sent += 1
+            elif kind == "arms":
+                moves = [{"action": "move", "joint": joint, "value": random.uniform(-1, 1)}
+                         for joint in ("LShoulderPitch", "LShoulderRoll")]
+                if not args.no_batch:
+                    moves = [{"action": "batch", "items": moves}]
+                for move in moves:
+                    client.send(make_frame(json.dumps(move).encode("utf-8")))
+                    results.sent += 1
+            elif kind == "ping":
+                client.send(make_frame(struct.pack("!d", time.time()), opcode=0x9))
+            else:
+                waiting[index][kind].append(time.time())
+                client.send(make_frame(json.dumps({"action": kind}).encode("utf-8")))
+                results.sent += 1
+            heapq.heappush(events, (due + periods[kind], index, kind))
+
+        if now >= end and all(not w[k] for w in waiting for k in w):
+            break
+        if now >= end + 2.0:
+            # respuestas que no llegaron (p. ej. conflacionadas por clave)
+            results.errors += sum(len(w[k]) for w in waiting for k in w)
+            break
+
+        timeout = max(0.0, min(events[0][0] if events else end, end + 2.0) - time.time())
+        readable = select.select(list(lookup), [], [], min(timeout, 0.05))[0]
+        for fileno in readable:
+            index, client, control = lookup[fileno]
+            arrived = time.time()
+            for opcode, payload in client.feed():
+                if opcode == 0xA:
+                    results.rtt["ping"].append(arrived - struct.unpack("!d", payload)[0])
+                    continue
+                if opcode != 0x1:
+                    continue
+                results.received += 1
+                try:
+                    message = json.loads(payload.decode("utf-8"))
+                except ValueError:
+                    continue
+                if not control:
+                    text = message.get("message", "")
+                    if message.get("module") == "BENCH" and text.startswith("bench "):
+                        results.logs += 1
+                        sent = sentlogs.get(int(text.split()[1]))
+                        if sent is not None:
+                            results.rtt["log"].append(arrived - sent)
+                    continue
+                for kind, field in REPLIES.items():
+                    if field in message and waiting[index][kind]:
+                        # con QUEUE_CONFLATE varias consultas pueden compartir respuesta
+                        for sent in waiting[index][kind]:
+                            results.rtt[kind].append(arrived - sent)
+                        waiting[index][kind] = []
+
+    for client in controls + loggers:
+        client.close()
+    return time.time() - start
+
+def start_servers(args, logdir):
+    env = dict(os.environ)
+    paths = [STUB_DIR, args.sws or SWS_DIR, ROBOT_DIR]
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(os.path.abspath(p) for p in paths)
+    if args.naoqi_latency is not None:
+        env["NAOQI_STUB_LATENCY"] = args.naoqi_latency
+    scripts = [("logger", "logger.py"), ("control", "control_server.py")]
+    if args.inproc:
+        env["NAO_LOGGER_INPROC"] = "1"
+        scripts = scripts[1:]
+    for port in (CONTROL_PORT, LOG_PORT):
+        probe = socket.socket()
+        try:
+            if probe.connect_ex(("127.0.0.1", port)) == 0:
+                raise SystemExit("el puerto %d ya está en uso (¿servidores en marcha? usar --no-start)" % port)
+        finally:
+            probe.close()
+
+    procs = {}
+    for name, script in scripts:
+        out = open(os.path.join(logdir, name + ".out"), "w")
+        env["NAOQI_STUB_CALLS"] = os.path.join(logdir, name + ".calls.json")
+        procs[name] = subprocess.Popen([args.python, os.path.join(ROBOT_DIR, script)],
+                                       stdout=out, stderr=subprocess.STDOUT, env=dict(env))
+    deadline = time.time() + 20
+    for port in (LOG_PORT, CONTROL_PORT):
+        while True:
+            probe = socket.socket()
+            try:
+                if probe.connect_ex(("127.0.0.1", port)) == 0:
+                    break
+            finally:
+                probe.close()
+            if time.time() > deadline or any(p.poll() is not None for p in procs.values()):
+                stop_servers(procs)
+                raise SystemExit("los servidores no arrancaron, ver %s" % logdir)
+            time.sleep(0.1)
+    return procs
+
+def server_stats(procs, logdir):
+    """Volcado de getStats() de cada servidor (SIGUSR1) o None si no lo soporta."""
+    stats = {}
+    for name, proc in procs.items():
+        path = os.path.join(logdir, name + ".out")
+        offset = os.path.getsize(path)
+        proc.send_signal(signal.SIGUSR1)
+        deadline = time.time() + 2
+        stats[name] = None
+        while time.time() < deadline and stats[name] is None:
+            time.sleep(0.1)
+            with open(path) as out:
+                out.seek(offset)
+                for line in out:
+                    if line.startswith('{"server"'):
+                        stats[name] = json.loads(line)["server"]
+    return stats
+
+def motion_metrics(host):
+    """Sección motion de getMetrics (buzón de walk) o None si no la hay."""
+    client = Client(CONTROL_PORT, host)
+    try:
+        client.sock.settimeout(2)
+        client.send(make_frame(json.dumps({"action": "getMetrics"}).encode("utf-8")))
+        while True:
+            message = json.loads(client.read().decode("utf-8"))
+            if "metrics" in message:
+                return message.get("motion")
+    except (socket.error, ValueError, EOFError):
+        return None
+    finally:
+        client.close()
+
+def process_usage(procs):
+    """RSS (KB), CPU (s) y cambios de contexto voluntarios/involuntarios de cada proceso."""
+    usage = {}
+    hz = os.sysconf("SC_CLK_TCK")
+    for name, proc in procs.items():
+        fields = {}
+        with open("/proc/%d/status" % proc.pid) as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                fields[key] = value.split()[0] if value.split() else ""
+        with open("/proc/%d/stat" % proc.pid) as stat:
+            # utime y stime, tras el nombre del proceso entre paréntesis
+            ticks = stat.read().rsplit(")", 1)[1].split()[11:13]
+        usage[name] = {"rss_kb": int(fields.get("VmRSS", 0)),
+                       "cpu_s": sum(int(t) for t in ticks) / float(hz),
+                       "voluntary": int(fields.get("voluntary_ctxt_switches", 0)),
+                       "nonvoluntary": int(fields.get("nonvoluntary_ctxt_switches", 0))}
+    return usage
+
+def naoqi_calls(procs, logdir):
+    """Llamadas al NAOqi simulado por proceso (volcadas al salir) o {} si no las hay."""
+    calls = {}
+    for name in procs:
+        try:
+            with open(os.path.join(logdir, name + ".calls.json")) as dump:
+                calls[name] = json.load(dump)
+        except (IOError, OSError, ValueError):
+            pass
+    return calls
+
+def stop_servers(procs):
+    for proc in procs.values():
+        if proc.poll() is None:
+            proc.terminate()
+    deadline = time.time() + 5
+    for proc in procs.values():
+        while proc.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+def report(args, results, elapsed, stats, usage, motion, calls):
+    print("%.1f s, %d clientes de mando (%d en modo brazos), %d de logs" % (
+        elapsed, args.clients, int(round(args.clients * args.arms)), args.log_clients))
+    print("  enviados %d msg (%.1f msg/s), recibidos %d, logs bench %d, sin respuesta %d" % (
+        results.sent, results.sent / elapsed, results.received, results.logs, results.errors))
+    print()
+    print("%-30s %7s %9s %9s %9s %9s" % ("latencia cliente (ms)", "n", "p50", "p95", "p99", "max"))
+    for name in ("ping", "getBattery", "getAutonomousLife", "log"):
+        row = percentiles(results.rtt[name])
+        label = {"ping": "ping WS (mando)", "log": "log UDP -> cliente 6672"}.get(name, name)
+        if row is None:
+            print("%-30s %7d" % (label, 0))
+            continue
+        print("%-30s %7d %9.2f %9.2f %9.2f %9.2f" % (label, row["n"], row["p50"] * 1e3,
+              row["p95"] * 1e3, row["p99"] * 1e3, row["max"] * 1e3))
+
+    for name in ("control", "logger"):
+        server = stats.get(name)
+        print()
+        if name == "logger" and args.inproc:
+            print("logger: dentro del proceso de control (contadores sumados arriba)")
+            continue
+        if server is None:
+            print("%s: sin estadísticas (servidor externo o versión sin dumpStats)" % name)
+            continue
+        print("%-30s %7s %9s %9s %9s %9s" % ("servidor " + name + " (ms)", "n", "p50", "p95", "p99", "max"))
+        rows = [("handleMessage", server["transport"]["handler_time"]),
+                ("espera en sendq", server["transport"]["queue_time"]),
+                ("iteración del bucle", server["loop_time"])]
+        if "timer_lateness" in server:
+            rows.append(("retraso de call_every", server["timer_lateness"]))
+        for label, row in rows:
+            if not row["count"]:
+                print("%-30s %7d" % (label, 0))
+                continue
+            print("%-30s %7d %9.2f %9.2f %9.2f %9.2f" % (label, row["count"], row["p50_ms"],
+                  row["p95_ms"], row["p99_ms"], row["max_ms"]))
+        for kind, row in sorted((server.get("workers") or {}).items()):
+            print("%-30s %7d %9s %9s %9s %9.2f  (media %.2f, cola %.2f)" % (
+                "  worker " + kind, row["count"], "", "", "", row["run_max_ms"],
+                row["run_avg_ms"], row["wait_avg_ms"]))
+        transport = server["transport"]
+        print("  frames in/out %d/%d, escrituras parciales %d, pico sendq %d frames / %d bytes" % (
+            transport["frames_in"], transport["frames_out"], transport["partial_writes"],
+            transport["sendq_peak_frames"], transport["sendq_peak_bytes"]))
+
+    if motion:
+        print()
+        print("walk: %d recibidos, %d pisados en el buzón, %d RPC enviadas, %d evitadas (hilo a %.0f Hz)" % (
+            motion["received"], motion["coalesced"], motion["rpcs"], motion["rpcs_avoided"],
+            motion["rate_hz"]))
+        row = motion["latency"]
+        if row["count"]:
+            print("%-30s %7d %9.2f %9.2f %9.2f %9.2f" % ("walk -> moveToward (ms)", row["count"],
+                  row["p50_ms"], row["p95_ms"], row["p99_ms"], row["max_ms"]))
+
+    for name, dump in sorted(calls.items()):
+        total = sum(dump["calls"].values())
+        if not total:
+            continue
+        print()
+        print("%-36s %9s %9s" % ("NAOqi " + name, "llamadas", "por s"))
+        for method, count in sorted(dump["calls"].items(), key=lambda item: -item[1]):
+            print("%-36s %9d %9.1f" % ("  " + method, count, count / dump["elapsed"]))
+        print("%-36s %9d %9.1f" % ("total", total, total / dump["elapsed"]))
+
+    if usage:
+        print()
+        print("%-30s %9s %8s %12s %12s" % ("proceso", "RSS KB", "CPU s", "ctx vol", "ctx invol"))
+        for name, row in sorted(usage.items()):
+            print("%-30s %9d %8.2f %12d %12d" % (name, row["rss_kb"], row["cpu_s"], row["voluntary"],
+                                                 row["nonvoluntary"]))
+        if len(usage) > 1:
+            print("%-30s %9d %8.2f %12d %12d" % ("total", sum(r["rss_kb"] for r in usage.values()),
+                  sum(r["cpu_s"] for r in usage.values()),
+                  sum(r["voluntary"] for r in usage.values()),
+                  sum(r["nonvoluntary"] for r in usage.values())))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clients", type=int, default=4, help="clientes de mando (6671)")
+    parser.add_argument("--log-clients", type=int, default=2, help="clientes de logs (6672)")
+    parser.add_argument("--arms", type=float, default=0.25,
+                        help="fracción de clientes en modo brazos (move) en vez de walk")
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos de carga")
+    parser.add_argument("--battery", type=float, default=10.0, help="periodo de getBattery (s)")
+    parser.add_argument("--life", type=float, default=30.0, help="periodo de getAutonomousLife (s)")
+    parser.add_argument("--log-rate", type=float, default=20.0, help="logs UDP inyectados por segundo")
+    parser.add_argument("--python", default=sys.executable, help="intérprete de los servidores")
+    parser.add_argument("--sws", help="directorio SimpleWebSocketServer-0.1.2 alternativo")
+    parser.add_argument("--naoqi-latency", help="NAOQI_STUB_LATENCY para el NAOqi simulado")
+    parser.add_argument("--no-start", action="store_true", help="usar servidores ya en marcha")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="modo brazos con dos frames move en vez de un batch")
+    parser.add_argument("--inproc", action="store_true",
+                        help="logger dentro de control_server.py en vez de un proceso aparte")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--json", help="guardar los resultados en este fichero")
+    args = parser.parse_args()
+
+    logdir = tempfile.mkdtemp(prefix="bench-load-")
+    procs = {}
+    if not args.no_start:
+        procs = start_servers(args, logdir)
+    try:
+        results = Results()
+        elapsed = run_load(args, results)
+        motion = motion_metrics(args.host)
+        stats = server_stats(procs, logdir) if procs else {}
+        usage = process_usage(procs)
+    finally:
+        stop_servers(procs)
+    calls = naoqi_calls(procs, logdir)
+
+    report(args, results, elapsed, stats, usage, motion, calls)
+    if procs:
+        print()
+        print("salida de los servidores en %s" % logdir)
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump({"args": vars(args), "elapsed": elapsed, "sent": results.sent,
+                       "received": results.received, "unanswered": results.errors,
+                       "latency": dict((k, percentiles(v)) for k, v in results.rtt.items()),
+                       "servers": stats, "processes": usage, "motion": motion,
+                       "naoqi_calls": calls}, out, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
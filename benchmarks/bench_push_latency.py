@@ -0,0 +1,70 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_push_latency.py - Retardo de mensajes enviados desde otro hilo
+
+Un hilo en segundo plano (como el receptor UDP de logger.py o el bucle
+adaptativo de control_server.py) llama a sendMessage/broadcast mientras
+serveforever() corre en otro hilo. Se mide el tiempo desde la llamada hasta
+que el cliente recibe el mensaje.
+
+Sin despertar el bucle, el mensaje espera hasta que select() vence
+(selectInterval, 100 ms); con el eventfd/self-pipe se entrega al instante.
+
+Uso:
+    python2 benchmarks/bench_push_latency.py
+    python2 benchmarks/bench_push_latency.py --module /tmp/SimpleWebSocketServer_old.py
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import random
+import threading
+import time
+
+from _benchutil import load_sws
+from bench_event_loop import Client
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--module", help="ruta a un SimpleWebSocketServer.py alternativo")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--broadcast", action="store_true",
+                        help="usar server.broadcast en lugar de client.sendMessage")
+    parser.add_argument("--port", type=int, default=9881)
+    args = parser.parse_args()
+
+    sws = load_sws(args.module)
+    server = sws.SimpleWebSocketServer("127.0.0.1", args.port, sws.WebSocket)
+    loop = threading.Thread(target=server.serveforever)
+    loop.daemon = True
+    loop.start()
+
+    client = Client(args.port)
+    while not server.connections:
+        time.sleep(0.01)
+    ws = list(server.connections.values())[0]
+
+    delays = []
+    for i in range(args.messages):
+        # llegadas desalineadas respecto al ciclo del select
+        time.sleep(random.uniform(0.005, 0.03))
+        message = json.dumps({"seq": i, "t": time.time()})
+        if args.broadcast:
+            server.broadcast(message)
+        else:
+            ws.sendMessage(message)
+        payload = json.loads(client.read().decode("utf-8"))
+        delays.append(time.time() - payload["t"])
+
+    delays.sort()
+    n = len(delays)
+    print("%-10s %10s %10s %10s %10s" % ("mensajes", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    print("%-10d %10.3f %10.3f %10.3f %10.3f" % (
+        n, delays[n // 2] * 1e3, delays[int(n * 0.9)] * 1e3,
+        delays[int(n * 0.99) - 1] * 1e3, delays[-1] * 1e3))
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_static.py - Carga de la web del mando: SimpleHTTPServer frente al webroot del WS
+
+Sirve ControllerWebServer/ con `python -m SimpleHTTPServer` (http.server en
+Python 3) y con SimpleWebSocketServer(webroot=...), y descarga los ficheros
+que pide el navegador al abrir la página (index.html, main.js, main.css,
+favicon, manifest) por --parallel conexiones keep-alive. Reporta:
+
+  - carga en frío (sin caché) y recarga con If-None-Match / If-Modified-Since
+  - bytes transferidos (con .gz precomprimidos y Accept-Encoding: gzip)
+  - RSS del proceso servidor (el SimpleHTTPServer es un proceso extra)
+
+Uso:
+    python2 benchmarks/bench_static.py
+    python2 benchmarks/bench_static.py --rounds 50 --parallel 6
+"""
+
+from __future__ import print_function
+import argparse
+import gzip
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+from _benchutil import load_sws
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                       "ControllerWebServer")
+PAGE = ["/", "/static/js/main.9b77162c.js", "/static/css/main.ebdb0941.css",
+        "/favicon.ico", "/manifest.json"]
+
+def serve_sws(root, port):
+    sws = load_sws()
+    server = sws.SimpleWebSocketServer("127.0.0.1", port, sws.WebSocket, webroot=root)
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+    server.serveforever()
+
+def start(kind, root, port):
+    if kind == "sws":
+        command = [sys.executable, os.path.abspath(__file__), "--serve", root, str(port)]
+        cwd = None
+    else:
+        module = "http.server" if sys.version_info[0] >= 3 else "SimpleHTTPServer"
+        command = [sys.executable, "-m", module, str(port)]
+        cwd = root
+    devnull = open(os.devnull, "w")
+    proc = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=devnull)
+    if kind == "sws":
+        proc.stdout.readline()
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return proc
+        except socket.error:
+            time.sleep(0.05)
+
+def rss_kb(pid):
+    with open("/proc/%d/status" % pid) as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def load_page(port, parallel, validators, gzip_ok):
+    """Descargar PAGE repartida en conexiones paralelas; devuelve bytes."""
+    total = [0]
+    lock = threading.Lock()
+
+    def worker(paths):
+        conn = HTTPConnection("127.0.0.1", port)
+        for path in paths:
+            headers = {}
+            if gzip_ok:
+                headers["Accept-Encoding"] = "gzip"
+            if path in validators:
+                etag, modified = validators[path]
+                if etag:
+                    headers["If-None-Match"] = etag
+                if modified:
+                    headers["If-Modified-Since"] = modified
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            if response.status == 200:
+                validators[path] = (response.getheader("ETag"),
+                                    response.getheader("Last-Modified"))
+            elif response.status != 304:
+                raise RuntimeError("%s -> %d" % (path, response.status))
+            with lock:
+                total[0] += len(body)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(PAGE[i::parallel],))
+               for i in range(parallel)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return total[0]
+
+def precompressed_copy():
+    root = tempfile.mkdtemp(prefix="webroot-")
+    target = os.path.join(root, "web")
+    shutil.copytree(WEB_DIR, target)
+    for path in PAGE[1:3]:
+        name = os.path.join(target, path.lstrip("/"))
+        with open(name, "rb") as source:
+            data = source.read()
+        with gzip.open(name + ".gz", "wb") as compressed:
+            compressed.write(data)
+    return root, target
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--port", type=int, default=9890)
+    parser.add_argument("--serve", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_sws(args.serve[0], int(args.serve[1]))
+        return
+
+    tmp, root = precompressed_copy()
+    print("%-16s %12s %14s %12s %10s" % ("server", "cold ms", "revalidate ms", "KB/load", "RSS KB"))
+    try:
+        for kind, gzip_ok in (("SimpleHTTPServer", False), ("sws", False), ("sws", True)):
+            port = args.port
+            args.port += 1
+            proc = start(kind, root, port)
+            try:
+                cold = revalidate = 0.0
+                size = 0
+                for _ in range(args.rounds):
+                    validators = {}
+                    start_time = time.time()
+                    size = load_page(port, args.parallel, validators, gzip_ok)
+                    cold += time.time() - start_time
+                    start_time = time.time()
+                    load_page(port, args.parallel, validators, gzip_ok)
+                    revalidate += time.time() - start_time
+                name = kind + (" +gzip" if gzip_ok else "")
+                print("%-16s %12.2f %14.2f %12.1f %10d" % (
+                    name, cold / args.rounds * 1e3, revalidate / args.rounds * 1e3,
+                    size / 1024.0, rss_kb(proc.pid)))
+            finally:
+                proc.kill()
+                proc.wait()
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+bench_timer_wheel.py - Coste de los temporizadores keepalive del servidor
+
+Programa N temporizadores (un keepalive por conexión, vencimientos
+repartidos en 30 s) en la rueda de temporizadores de SimpleWebSocketServer
+y en un heap (heapq) como referencia, y mide:
+
+- programar + cancelar (lo que hace cada check keepalive al reprogramarse)
+- coste medio de un tick de 100 ms del bucle
+
+Uso:
+    python2 benchmarks/bench_timer_wheel.py
+    python2 benchmarks/bench_timer_wheel.py --timers 1000 100000
+"""
+
+from __future__ import print_function
+import argparse
+import heapq
+import random
+
+from _benchutil import load_sws, timed
+
+def noop():
+    pass
+
+def bench_wheel(sws, delays):
+    wheel = sws._TimerWheel(0.0)
+    _, t_sched = timed(lambda: [wheel.schedule(0.0, d, noop) for d in delays])
+    timers = [wheel.schedule(0.0, d, noop) for d in delays]
+    _, t_cancel = timed(lambda: [wheel.cancel(t) for t in timers])
+    ticks = int(30 / sws.TIMER_TICK)
+    _, t_run = timed(lambda: [wheel.advance(i * sws.TIMER_TICK) for i in range(1, ticks + 1)])
+    return t_sched + t_cancel, t_run / ticks
+
+def bench_heap(delays, tick):
+    heap = []
+    def schedule():
+        for i, d in enumerate(delays):
+            heapq.heappush(heap, [d, i, noop])
+    _, t_sched = timed(schedule)
+    # cancelar en un heap = marcar y descartar al vencer
+    entries = []
+    for i, d in enumerate(delays, len(delays)):
+        entry = [d, i, noop]
+        heapq.heappush(heap, entry)
+        entries.append(entry)
+    def cancel():
+        for entry in entries:
+            entry[2] = None
+    _, t_cancel = timed(cancel)
+    ticks = int(30 / tick)
+    def run():
+        for i in range(1, ticks + 1):
+            now = i * tick
+            while heap and heap[0][0] <= now:
+                callback = heapq.heappop(heap)[2]
+                if callback is not None:
+                    callback()
+    _, t_run = timed(run)
+    return t_sched + t_cancel, t_run / ticks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--timers", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    sws = load_sws()
+    print("%8s %22s %22s %16s %16s" % ("timers", "wheel sched+cancel us", "heap sched+cancel us",
+                                       "wheel tick us", "heap tick us"))
+    for n in args.timers:
+        delays = [random.uniform(0.1, 30.0) for _ in range(n)]
+        w_sched, w_tick = bench_wheel(sws, delays)
+        h_sched, h_tick = bench_heap(delays, sws.TIMER_TICK)
+        print("%8d %22.3f %22.3f %16.1f %16.1f" % (
+            n, w_sched / n * 1e6, h_sched / n * 1e6, w_tick * 1e6, h_tick * 1e6))
+
+if __name__ == "__main__":
+    main()
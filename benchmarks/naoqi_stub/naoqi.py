@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+naoqi.py - NAOqi simulado para ejecutar los servidores sin robot
+
+Sustituye al módulo naoqi del SDK (ponerlo delante en PYTHONPATH).
+ALProxy(módulo, ip, puerto) acepta cualquier método: devuelve un valor
+plausible (batería, estado de AutonomousLife, sensores de ALMemory) o None,
+tras una latencia simulada parecida a la de una llamada NAOqi local.
+
+Las latencias se ajustan con NAOQI_STUB_LATENCY, en segundos:
+    NAOQI_STUB_LATENCY="moveToward=0.004,say=0"   (métodos concretos)
+    NAOQI_STUB_LATENCY="0"                         (todas a cero)
+
+Con NAOQI_STUB_CALLS=<fichero> se guardan al salir, en JSON, las llamadas
+hechas por "Módulo.método" y los segundos transcurridos desde la importación.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+# latencia por método; el resto usa DEFAULT_LATENCY
+LATENCY = {
+    "moveToward": 0.002,
+    "setAngles": 0.001,
+    "moveTo": 1.5,
+    "goToPosture": 1.5,
+    "say": 0.8,
+    "runBehavior": 1.0,
+}
+DEFAULT_LATENCY = 0.0005
+
+RESULTS = {
+    "getBatteryCharge": 87,
+    "getState": "disabled",
+    "getInstalledBehaviors": [],
+    "getRunningBehaviors": [],
+    "isBehaviorInstalled": False,
+}
+
+def _configure(spec):
+    global DEFAULT_LATENCY
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "=" not in item:
+            DEFAULT_LATENCY = float(item)
+            for name in LATENCY:
+                LATENCY[name] = DEFAULT_LATENCY
+            continue
+        name, value = item.split("=", 1)
+        LATENCY[name.strip()] = float(value)
+
+_configure(os.environ.get("NAOQI_STUB_LATENCY", ""))
+
+CALLS = {}
+_calls_lock = threading.Lock()
+_started = time.time()
+
+def _dumpCalls(path):
+    with open(path, "w") as out:
+        json.dump({"elapsed": time.time() - _started, "calls": CALLS}, out, indent=2, sort_keys=True)
+
+if os.environ.get("NAOQI_STUB_CALLS"):
+    atexit.register(_dumpCalls, os.environ["NAOQI_STUB_CALLS"])
+
+def _memoryValue(key):
+    # robot de pie y quieto: peso repartido en los FSR, gravedad en Z
+    if "/FSR/" in key:
+        return 0.6
+    if key.endswith("AccelerometerZ/Sensor/Value"):
+        return -9.81
+    return 0.0
+
+class ALProxy(object):
+    def __init__(self, name, ip=None, port=None):
+        self.name = name
+
+    def __getattr__(self, method):
+        if method.startswith("__"):
+            raise AttributeError(method)
+        latency = LATENCY.get(method, DEFAULT_LATENCY)
+        name = "%s.%s" % (self.name, method)
+
+        def call(*args):
+            with _calls_lock:
+                CALLS[name] = CALLS.get(name, 0) + 1
+            if latency:
+                time.sleep(latency)
+            if method == "getData":
+                return _memoryValue(args[0])
+            if method == "getListData":
+                return [_memoryValue(k) for k in args[0]]
+            return RESULTS.get(method)
+        return call
@@ -12,8 +12,8 @@ Compatible con Python 2.7 y recursos limitados del NAO.
 import numpy as np
 import time
 import json
-from collections import deque
 from naoqi import ALProxy
+from sensors import SensorHistory, SENSOR_CHANNELS
 
 # Intentar importar bibliotecas de ML (con fallbacks para NAO)
 try:
@@ -137,8 +137,11 @@ class AdaptiveWalkController:
             self.cnn = None
             print("CNN no disponible - usando parámetros fijos")
         
-        # Historial de sensores para estabilidad
-        self.sensor_history = deque(maxlen=10)
+        # Historial de sensores para estabilidad (SensorHistory de sensors.py).
+        # En el servidor se usa el común, que escribe su bucle adaptativo;
+        # suelto, uno propio con las lecturas de get_sensor_data
+        self.history = SensorHistory(capacity=10) if ML_AVAILABLE else None
+        self.own_history = True
         self.last_params = None
         self.adaptation_enabled = True
         
@@ -146,6 +149,11 @@ class AdaptiveWalkController:
         self.prediction_count = 0
         self.total_prediction_time = 0.0
         
+    def use_history(self, history):
+        """Leer del historial común en vez de ALMemory (sin RPC por walk)"""
+        self.history = history
+        self.own_history = False
+        
     def get_sensor_data(self):
         """Recopilar datos de sensores del NAO"""
         sensor_vector = []
@@ -231,18 +239,16 @@ class AdaptiveWalkController:
         start_time = time.time()
         
         try:
-            # Obtener datos de sensores
-            sensor_data = self.get_sensor_data()
-            sensor_data = self.add_command_velocities(sensor_data, vx, vy, wz)
-            
-            # Agregar al historial para estabilidad
-            self.sensor_history.append(sensor_data)
+            # Sin servidor: leer los sensores y agregarlos al historial propio
+            if self.own_history:
+                sensor_data = self.get_sensor_data()
+                self.history.append(time.time(), sensor_data[:16] + [vx, vy, wz, 0.0, 0.0, 0.0, 0.0])
             
             # Usar promedio de las últimas lecturas para estabilidad
-            if len(self.sensor_history) >= 3:
-                averaged_sensors = np.mean(list(self.sensor_history)[-3:], axis=0)
-            else:
-                averaged_sensors = sensor_data
+            if not len(self.history):
+                return None
+            averaged_sensors = list(self.history.mean(SENSOR_CHANNELS, 3))
+            averaged_sensors = self.add_command_velocities(averaged_sensors + [0.0] * 4, vx, vy, wz)
             
             # Predecir parámetros con CNN
             predicted_params = self.cnn.predict_gait_params(averaged_sensors)
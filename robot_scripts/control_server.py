@@ -11,6 +11,10 @@ control_server.py – WebSocket → NAOqi dispatcher + Head‐Touch Web‐Launch
     adaptiveGait  ← NEW (enable: bool, mode: "auto"|"slippery")
 
 • Watchdog detiene la marcha si no recibe walk en WATCHDOG s
+• walk va a un buzón (gana el último) que un hilo aplica a MOTION_HZ
+• posture, say, walkTo, behaviors: responden accepted y luego completed/failed
+• batch: lista de acciones en un frame (atomic opcional), respuestas en otro
+• logLevel / getLogLevels: nivel y muestreo del log por tag, sin reiniciar
 
 Cambios clave (versión “single-config + adaptive”):
 - Único conjunto de parámetros de marcha (gait) modificable por WS.
@@ -20,14 +24,15 @@ Cambios clave (versión “single-config + adaptive”):
 """
 
 from __future__ import print_function
-import sys, os, time, math, threading, json, socket, errno, subprocess, signal
-from datetime import datetime
+import sys, os, re, time, math, threading, json, socket, errno, subprocess, signal
+from collections import deque
 from naoqi import ALProxy
 
 # ───── Rutas WS local ───────────────────────────────────────────────────────────
 sys.path.insert(0, os.path.dirname(__file__))
 sys.path.insert(0, "/home/nao/SimpleWebSocketServer-0.1.2")
-from SimpleWebSocketServer import WebSocket, SimpleWebSocketServer
+from SimpleWebSocketServer import WebSocket, SimpleWebSocketServer, QUEUE_CONFLATE, Histogram
+from sensors import SensorService, SensorHistory, SENSOR_KEYS, COP_CHANNELS, NUMPY_AVAILABLE
 
 # Importar sistema de logging
 try:
@@ -48,8 +53,24 @@ IP_NAO     = "127.0.0.1"
 PORT_NAO   = 9559
 WS_PORT    = 6671
 WATCHDOG   = 0.6
-WEB_DIR    = "/home/nao/Websx/ControllerWebServer"
-HTTP_PORT  = "8000"
+# La web del mando se sirve por HTTP en el mismo puerto que el WS
+# (http://<IP_NAO>:6671/), sin un SimpleHTTPServer aparte
+WEB_DIR    = "/home/nao/Webs/ControllerWebServer"
+# Motor del servidor WS: "select" (por defecto, Python 2) o "asyncio" (Python 3).
+# El watchdog corre en el bucle del servidor (call_every), sin hilo propio
+WS_ENGINE  = os.environ.get("NAO_WS_ENGINE", "select")
+# Lecturas por segundo de IMU + FSR (una getListData cada vez, ver sensors.py);
+# el bucle adaptativo corre tras cada lectura y la guarda en el historial
+SENSOR_HZ  = float(os.environ.get("NAO_SENSOR_HZ", "20"))
+# Lecturas en el historial común (SensorHistory, NumPy): 64 = 3.2 s a 20 Hz
+HISTORY_LEN = int(os.environ.get("NAO_SENSOR_HISTORY", "64"))
+# Hilos que ejecutan handleMessage: las llamadas NAOqi cortas (getBattery,
+# setAngles, leds...) no paran el bucle. Las largas (say, posture, walkTo)
+# tampoco ocupan un worker: van a los carriles de NaoqiCall
+WS_WORKERS = 4
+# Con NAO_LOGGER_INPROC=1 el servidor de logs (WS 6672 y UDP 6673) corre en
+# este proceso y en el mismo bucle que el WS de control, en lugar de logger.py
+LOGGER_INPROC = os.environ.get("NAO_LOGGER_INPROC", "0") == "1"
 
 # Importar CNN de caminata adaptativa
 try:
@@ -61,42 +82,204 @@ except ImportError as e:
     logger.warning("CNN adaptativa no disponible: {}".format(e))
     adaptive_walker = None
     ADAPTIVE_WALK_ENABLED = False
-WEB_DIR    = "/home/nao/Websx/ControllerWebServer"
-HTTP_PORT  = "8000"
-
-def log(tag, msg):
-    """Función de logging mejorada que usa el sistema centralizado"""
-    ts = datetime.now().strftime("%H:%M:%S")
-    formatted_msg = "{} [{}] {}".format(ts, tag, msg)
-    print(formatted_msg)
-    
-    # Enviar al sistema de logging centralizado
+
+# ───── Logging por tag: niveles, formateo perezoso y muestreo ─────────────────
+# log(tag, msg, *args) solo formatea msg % args si el registro se emite. Cada
+# tag tiene nivel mínimo ("*" para el resto) y puede muestrearse: "10" emite
+# 1 de cada 10 registros de cada mensaje, "1s" uno por segundo; el emitido
+# lleva cuántos se suprimieron. Ajustables en caliente con la acción logLevel
+# o al arrancar con NAO_LOG_LEVELS="SIM=WARNING,*=INFO" y NAO_LOG_SAMPLE="SIM=1s".
+DEBUG, INFO, WARNING, ERROR, CRITICAL = 10, 20, 30, 40, 50
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR",
+               CRITICAL: "CRITICAL"}
+LEVELS = dict((name, level) for level, name in LEVEL_NAMES.items())
+
+LOG_LEVEL = {"*": INFO}
+# SIM traza cada comando NAOqi: el joystick lo llama a 15 Hz por cliente
+LOG_SAMPLE = {"SIM": "1s"}
+
+class LogSampler(object):
+    """Muestreo de un mensaje: 1 de cada every, o uno cada interval s"""
+    __slots__ = ("every", "interval", "count", "last", "suppressed")
+
+    def __init__(self, spec):
+        spec = str(spec).strip()
+        if spec.endswith("s"):
+            self.every, self.interval = 0, float(spec[:-1])
+        else:
+            self.every, self.interval = int(spec), 0.0
+        self.count = 0
+        self.last = 0.0
+        self.suppressed = 0
+
+    def admit(self, now):
+        """Suprimidos desde el último emitido, o None si este no se emite"""
+        self.count += 1
+        if self.every:
+            if self.count % self.every != 1 % self.every:
+                self.suppressed += 1
+                return None
+        elif now - self.last < self.interval:
+            self.suppressed += 1
+            return None
+        self.last = now
+        suppressed, self.suppressed = self.suppressed, 0
+        return suppressed
+
+# (tag, mensaje sin formatear) -> LogSampler; se vacía al cambiar el muestreo
+_samplers = {}
+_samplers_lock = threading.Lock()
+# registros suprimidos por tag (nivel o muestreo), para getLogLevels; se
+# escribe desde los hilos de WS, movimiento, sensores y carriles: con el lock
+LOG_SUPPRESSED = {}
+
+def _suppress(tag):
+    with _samplers_lock:
+        LOG_SUPPRESSED[tag] = LOG_SUPPRESSED.get(tag, 0) + 1
+
+def _log_level(text, tag):
     if tag == "NAO" or tag == "FallEvt":
-        logger.info("[{}] {}".format(tag, msg))
-    elif "error" in msg.lower() or "fail" in msg.lower():
-        logger.error("[{}] {}".format(tag, msg))
-    elif "warn" in msg.lower():
-        logger.warning("[{}] {}".format(tag, msg))
+        return INFO
+    low = text.lower()
+    if "error" in low or "fail" in low:
+        return ERROR
+    if "warn" in low:
+        return WARNING
+    return INFO
+
+def _log(level, tag, msg, args):
+    threshold = LOG_LEVEL.get(tag)
+    if threshold is None:
+        threshold = LOG_LEVEL["*"]
+    if level is not None and level < threshold:
+        _suppress(tag)
+        return
+    suppressed = 0
+    if tag in LOG_SAMPLE:
+        with _samplers_lock:
+            sampler = _samplers.get((tag, msg))
+            if sampler is None:
+                # un log() con el mensaje ya formateado crearía uno por texto
+                if len(_samplers) >= 256:
+                    _samplers.clear()
+                sampler = _samplers[(tag, msg)] = LogSampler(LOG_SAMPLE[tag])
+            suppressed = sampler.admit(time.time())
+            if suppressed is None:
+                LOG_SUPPRESSED[tag] = LOG_SUPPRESSED.get(tag, 0) + 1
+        if suppressed is None:
+            return
+    if args:
+        msg = msg % args
+    if level is None:
+        # nivel deducido del texto, como antes
+        level = _log_level(msg, tag)
+        if level < threshold:
+            _suppress(tag)
+            return
+    if suppressed:
+        msg = "%s (+%d suprimidos)" % (msg, suppressed)
+    print("%s [%s] %s" % (time.strftime("%H:%M:%S"), tag, msg))
+    # Enviar al sistema de logging centralizado
+    text = "[%s] %s" % (tag, msg)
+    if level >= ERROR:
+        logger.error(text)
+    elif level >= WARNING:
+        logger.warning(text)
+    elif level >= INFO:
+        logger.info(text)
     else:
-        logger.info("[{}] {}".format(tag, msg))
+        logger.debug(text)
+
+def log(tag, msg, *args):
+    """Registrar msg % args; nivel ERROR/WARNING si el texto habla de error/warn"""
+    _log(None, tag, msg, args)
+
+def log_debug(tag, msg, *args):
+    """Registrar msg % args con nivel DEBUG (oculto salvo que el tag lo pida)"""
+    _log(DEBUG, tag, msg, args)
+
+def set_log_level(tag, level=None, sample=None):
+    """Cambiar nivel y/o muestreo de tag; sample "" o "0" lo desactiva"""
+    if level is not None:
+        if str(level).upper() not in LEVELS:
+            raise ValueError("nivel desconocido %s (%s)" % (level, ", ".join(sorted(LEVELS))))
+        LOG_LEVEL[tag] = LEVELS[str(level).upper()]
+    if sample is not None:
+        if str(sample).strip() in ("", "0", "0s"):
+            LOG_SAMPLE.pop(tag, None)
+        else:
+            LogSampler(sample)  # validar antes de instalarlo
+            LOG_SAMPLE[tag] = str(sample).strip()
+        with _samplers_lock:
+            for key in [key for key in _samplers if key[0] == tag]:
+                del _samplers[key]
+
+def _parse_log_env(name, apply):
+    for item in os.environ.get(name, "").split(","):
+        if "=" in item:
+            tag, value = item.split("=", 1)
+            try:
+                apply(tag.strip(), value.strip())
+            except ValueError:
+                print("%s: valor no válido en %r" % (name, item))
+
+_parse_log_env("NAO_LOG_LEVELS", lambda tag, value: set_log_level(tag, level=value))
+_parse_log_env("NAO_LOG_SAMPLE", lambda tag, value: set_log_level(tag, sample=value))
 
 # ───── Proxies NAOqi ───────────────────────────────────────────────────────────
+_clock = getattr(time, "perf_counter", time.time)
+
+class _NaoqiTime(threading.local):
+    # segundos dentro de llamadas NAOqi del hilo, desde la última puesta a 0
+    elapsed = 0.0
+
+_naoqi_time = _NaoqiTime()
+
+class TimedProxy(object):
+    """ALProxy que suma la duración de cada llamada a _naoqi_time del hilo"""
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self._methods = {}
+
+    def __getattr__(self, name):
+        method = self._methods.get(name)
+        if method is None:
+            target = getattr(self._proxy, name)
+            def method(*args):
+                start = _clock()
+                try:
+                    return target(*args)
+                finally:
+                    _naoqi_time.elapsed += _clock() - start
+            self._methods[name] = method
+        return method
+
 logger.info("Inicializando proxies NAOqi...")
 try:
-    motion     = ALProxy("ALMotion",         IP_NAO, PORT_NAO)
-    posture    = ALProxy("ALRobotPosture",   IP_NAO, PORT_NAO)
-    life       = ALProxy("ALAutonomousLife", IP_NAO, PORT_NAO)
-    leds       = ALProxy("ALLeds",           IP_NAO, PORT_NAO)
-    tts        = ALProxy("ALTextToSpeech",   IP_NAO, PORT_NAO)
-    battery    = ALProxy("ALBattery",        IP_NAO, PORT_NAO)
-    memory     = ALProxy("ALMemory",         IP_NAO, PORT_NAO)
-    audio      = ALProxy("ALAudioDevice",    IP_NAO, PORT_NAO)
-    behavior   = ALProxy("ALBehaviorManager", IP_NAO, PORT_NAO)
+    motion     = TimedProxy(ALProxy("ALMotion",         IP_NAO, PORT_NAO))
+    posture    = TimedProxy(ALProxy("ALRobotPosture",   IP_NAO, PORT_NAO))
+    life       = TimedProxy(ALProxy("ALAutonomousLife", IP_NAO, PORT_NAO))
+    leds       = TimedProxy(ALProxy("ALLeds",           IP_NAO, PORT_NAO))
+    tts        = TimedProxy(ALProxy("ALTextToSpeech",   IP_NAO, PORT_NAO))
+    battery    = TimedProxy(ALProxy("ALBattery",        IP_NAO, PORT_NAO))
+    memory     = TimedProxy(ALProxy("ALMemory",         IP_NAO, PORT_NAO))
+    audio      = TimedProxy(ALProxy("ALAudioDevice",    IP_NAO, PORT_NAO))
+    behavior   = TimedProxy(ALProxy("ALBehaviorManager", IP_NAO, PORT_NAO))
     logger.info("Todos los proxies NAOqi inicializados correctamente")
 except Exception as e:
     logger.critical("Error inicializando proxies NAOqi: {}".format(e))
     sys.exit(1)
 
+# IMU y FSR en una sola RPC por ciclo, compartida por todos los consumidores
+sensor_service = SensorService(memory, rate=SENSOR_HZ,
+                               log=lambda msg, *args: log("Sensors", msg, *args))
+# Historial de lecturas, velocidad comandada y CoP: lo escribe el bucle
+# adaptativo y lo consultan él y la CNN (que también necesita NumPy). Sin
+# NumPy el bucle adaptativo sigue con sus filtros escalares
+sensor_history = SensorHistory(HISTORY_LEN) if NUMPY_AVAILABLE else None
+if adaptive_walker:
+    adaptive_walker.use_history(sensor_history)
+
 # ─── Setup inicial seguro ──────────────────────────────────────────────────────
 # Fall manager ON → auto-recover
 motion.setFallManagerEnabled(True)
@@ -112,14 +295,14 @@ try:
     motion.setMoveArmsEnabled(True, True)
     log("NAO", "MoveArmsEnabled(True, True)")
 except Exception as e:
-    log("NAO", "Warn setMoveArmsEnabled: %s" % e)
+    log("NAO", "Warn setMoveArmsEnabled: %s", e)
 
 # Mantener protección de contacto de pie activada por defecto
 try:
     motion.setMotionConfig([["ENABLE_FOOT_CONTACT_PROTECTION", True]])
     log("NAO", "FootContactProtection = True")
 except Exception as e:
-    log("NAO", "Warn FootContactProtection: %s" % e)
+    log("NAO", "Warn FootContactProtection: %s", e)
 
 # ─── Callback de caída ─────────────────────────────────────────────────────────
 def onFall(_key, _value, _msg):
@@ -127,13 +310,13 @@ def onFall(_key, _value, _msg):
     try:
         posture.goToPosture("Stand", 0.7)
     except Exception as e:
-        log("FallEvt", "Recover error: %s" % e)
+        log("FallEvt", "Recover error: %s", e)
 
 try:
     memory.subscribeToEvent("RobotHasFallen", __name__, "onFall")
     log("NAO", "Suscrito a evento RobotHasFallen")
 except Exception as e:
-    log("NAO", "Warn subscribe RobotHasFallen: %s" % e)
+    log("NAO", "Warn subscribe RobotHasFallen: %s", e)
 
 # ─── Único Gait + CAPs (por defecto NAOqi) ─────────────────────────────────────
 # CURRENT_GAIT vacío implica que NAOqi usará sus valores internos de marcha.
@@ -170,7 +353,7 @@ def _apply_moveToward(vx, vy, wz, move_cfg_pairs):
     try:
         motion.moveToward(vx, vy, wz, move_cfg_pairs)
     except Exception as e:
-        log("Walk", "moveToward with config failed: %s → retry no-config" % e)
+        log("Walk", "moveToward with config failed: %s → retry no-config", e)
         motion.moveToward(vx, vy, wz)
 
 # ─── Utilidades de suavizado y mezcla ─────────────────────────────────────────
@@ -247,16 +430,10 @@ FSR_KEYS = {
     }
 }
 
-def _memf(key, default=0.0):
-    try:
-        return float(memory.getData(key))
-    except Exception:
-        return default
-
-def read_fsr_kg():
-    """Devuelve lecturas FSR en kg y sumas por pie y total."""
-    L = {sid: _memf(FSR_KEYS["L"][sid]) for sid in ("FL","FR","RL","RR")}
-    R = {sid: _memf(FSR_KEYS["R"][sid]) for sid in ("FL","FR","RL","RR")}
+def read_fsr_kg(snap):
+    """Devuelve lecturas FSR en kg (del snapshot de sensores) y sumas por pie y total."""
+    L = {sid: snap.get(FSR_KEYS["L"][sid]) for sid in ("FL","FR","RL","RR")}
+    R = {sid: snap.get(FSR_KEYS["R"][sid]) for sid in ("FL","FR","RL","RR")}
     sumL = sum(L.values()); sumR = sum(R.values())
     return L, R, sumL, sumR, (sumL + sumR)
 
@@ -272,36 +449,294 @@ def foot_cop(foot, vals):
     return (sx / w, sy / w), w
 
 # ─── Watchdog ──────────────────────────────────────────────────────────────────
+# Lo refresca cada walk recibido, aunque el hilo de movimiento no reenvíe nada;
+# la parada la ejecuta ese hilo, en orden con los moveToward. Solo se envía
+# si hubo walks desde la última o el hilo no sabe si el robot está parado:
+# en reposo no hay nada que parar ni RPC que contar como evitada
 _last_walk = time.time()
-def watchdog():
-    global _last_walk
-    log("Watchdog", "Iniciado (%.1fs)" % WATCHDOG)
+_walked = False
+def watchdog_tick():
+    global _last_walk, _walked
+    if time.time() - _last_walk > WATCHDOG:
+        _last_walk = time.time()
+        if _walked or not walk_mailbox.stopped:
+            _walked = False
+            walk_mailbox.post_stop()
+
+# ─── Llamadas NAOqi largas: carriles por recurso ──────────────────────────────
+# Las acciones blocking (posture, say, walkTo, behaviors...) no ocupan el
+# worker del WS durante segundos: dispatch responde {"accepted"} con el id del
+# mensaje y la llamada corre en el carril de su recurso, que al terminar
+# responde {"completed"} o {"failed"} con la duración. Las de un mismo carril
+# van en orden: "motion" es el hilo de movimiento (ordenadas con walk y el
+# watchdog) y "speech" tiene el suyo, así que say no espera a un goToPosture.
+NAOQI_MAXPENDING = 8    # llamadas en cola por carril; más se rechazan
+
+class NaoqiCall(object):
+    """Acción blocking aceptada, a la espera de su carril"""
+    __slots__ = ("ws", "act", "args", "ident", "parse", "queued")
+
+    def __init__(self, ws, act, args, ident, parse):
+        self.ws = ws
+        self.act = act
+        self.args = args
+        self.ident = ident
+        self.parse = parse
+        self.queued = _clock()
+
+    def reply(self, **fields):
+        fields["id"] = self.ident
+        try:
+            self.ws.sendMessage(json.dumps(fields))
+        except Exception:
+            pass
+
+    def run(self):
+        start = _clock()
+        _naoqi_time.elapsed = 0.0
+        failed = None
+        try:
+            self.act.handler(self.ws, **self.args)
+        except Exception as e:
+            failed = str(e)
+            log("WS", "Excepción en %s: %s", self.act.name, e)
+        run = _clock() - start
+        self.act.record(self.parse, run, _naoqi_time.elapsed, failed is not None)
+        ms = round(run * 1e3, 1)
+        wait_ms = round((start - self.queued) * 1e3, 1)
+        if failed is None:
+            self.reply(completed=self.act.name, ms=ms, wait_ms=wait_ms)
+        else:
+            self.reply(failed=self.act.name, reason=failed, ms=ms, wait_ms=wait_ms)
+        return failed is None
+
+class CallLane(object):
+    """Cola de un recurso NAOqi: sus llamadas se ejecutan de una en una"""
+
+    def __init__(self, name):
+        self.name = name
+        self.cond = threading.Condition()
+        self.queue = deque()    # (tipo, dato); las llamadas son ("call", NaoqiCall)
+        self.pending = 0
+
+    def submit(self, call):
+        """Encolar call y responder accepted, o False si el carril está lleno"""
+        with self.cond:
+            if self.pending >= NAOQI_MAXPENDING:
+                return False
+            # accepted sale antes de que el carril pueda responder completed
+            call.reply(accepted=call.act.name, lane=self.name)
+            self.pending += 1
+            self.queue.append(("call", call))
+            self.cond.notify()
+            return True
+
+    def take(self):
+        """Esperar a la siguiente entrada de la cola"""
+        with self.cond:
+            while not self.queue:
+                self.cond.wait()
+            kind, item = self.queue.popleft()
+            if kind == "call":
+                self.pending -= 1
+            return kind, item
+
+def lane_loop(lane):
     while True:
-        time.sleep(0.05)
-        if time.time() - _last_walk > WATCHDOG:
-            try:
-                motion.stopMove()
-                _last_walk = time.time()
-                log("Watchdog", "stopMove() tras timeout")
-            except Exception as e:
-                log("Watchdog", "stopMove error: %s" % e)
+        _kind, call = lane.take()
+        call.run()
+
+# ─── Buzón de walk e hilo de movimiento ───────────────────────────────────────
+# on_walk solo deja el comando en el buzón (gana el último). El hilo de
+# movimiento lo recoge como mucho MOTION_HZ veces por segundo y solo llama a
+# moveToward / setMotionConfig si la velocidad o el gait cambian más que la
+# banda muerta: los walk que llegan entre dos ciclos no llegan a NAOqi y un
+# comando igual al que ya ejecuta el robot no se reenvía.
+MOTION_HZ     = float(os.environ.get("NAO_MOTION_HZ", "20"))
+WALK_DEADBAND = 0.02    # velocidad normalizada (vx, vy, wz en -1..1)
+GAIT_DEADBAND = 0.002   # valor de cada parámetro de gait
+
+class WalkMailbox(CallLane):
+    """Carril "motion": último walk sin ejecutar, paradas y llamadas blocking
+
+    Un walk pisa al anterior si este sigue al final de la cola; detrás de
+    una llamada se encola, para no adelantarla.
+    """
 
-wd = threading.Thread(target=watchdog)
-wd.setDaemon(True)
-wd.start()
+    def __init__(self):
+        CallLane.__init__(self, "motion")
+        self.received = 0
+        self.coalesced = 0
+        self.rpcs = 0
+        self.rpcs_avoided = 0
+        # llegada del walk -> vuelta de moveToward
+        self.latency = Histogram()
+        # última velocidad enviada a NAOqi (historial de sensores)
+        self.commanded = (0.0, 0.0, 0.0)
+        # el hilo de movimiento sabe que la marcha está parada (watchdog)
+        self.stopped = True
+
+    def _post(self, kind, item):
+        if self.queue and self.queue[-1][0] != "call":
+            if self.queue[-1][0] == "walk":
+                # pisado antes de que el hilo lo leyera: su moveToward no se envía
+                self.coalesced += 1
+                self.rpcs_avoided += 1
+            self.queue[-1] = (kind, item)
+        else:
+            self.queue.append((kind, item))
+        self.cond.notify()
+
+    def post(self, vx, vy, wz):
+        with self.cond:
+            self.received += 1
+            self._post("walk", (vx, vy, wz, _clock()))
+
+    def post_stop(self):
+        with self.cond:
+            self._post("stop", None)
+
+    def count(self, rpcs, avoided):
+        with self.cond:
+            self.rpcs += rpcs
+            self.rpcs_avoided += avoided
+
+    def metrics(self):
+        with self.cond:
+            return {"rate_hz": MOTION_HZ,
+                    "received": self.received,
+                    "coalesced": self.coalesced,
+                    "rpcs": self.rpcs,
+                    "rpcs_avoided": self.rpcs_avoided,
+                    "latency": self.latency.asDict()}
+
+walk_mailbox = WalkMailbox()
+speech_lane = CallLane("speech")
+LANES = {"motion": walk_mailbox, "speech": speech_lane}
+
+def _walk_target(vx, vy, wz):
+    """Velocidad con caps aplicados y gait (pares, dict o None de la CNN)"""
+    # Normaliza magnitud del vector (x,y) si excede 1.0
+    norm = math.hypot(vx, vy)
+    if norm > 1.0:
+        vx, vy = vx/norm, vy/norm
+
+    # Aplicar CAPS suavizados
+    vx = max(-CAPS_APPLIED["vx"], min(CAPS_APPLIED["vx"], vx))
+    vy = max(-CAPS_APPLIED["vy"], min(CAPS_APPLIED["vy"], vy))
+    wz = max(-CAPS_APPLIED["wz"], min(CAPS_APPLIED["wz"], wz))
+
+    # CNN Adaptativa: Predecir parámetros de marcha óptimos
+    adaptive_params = None
+    if ADAPTIVE_WALK_ENABLED and adaptive_walker:
+        try:
+            adaptive_params = adaptive_walker.adapt_gait(vx, vy, wz)
+            if adaptive_params:
+                log_debug("CNN", "adaptativa: %s", adaptive_params)
+        except Exception as e:
+            logger.warning("Error en CNN adaptativa: {}".format(e))
+
+    # Usar configuración adaptativa si está disponible, sino la configuración actual
+    if adaptive_params:
+        return (vx, vy, wz), _config_to_move_list(adaptive_params), adaptive_params
+    return (vx, vy, wz), _config_to_move_list(GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT), None
+
+def _moved(a, b, deadband):
+    return any(abs(x - y) > deadband for x, y in zip(a, b))
+
+def _gait_moved(a, b):
+    a = pairs_to_dict(a)
+    b = pairs_to_dict(b)
+    if set(a) != set(b):
+        return True
+    return any(abs(a[k] - b[k]) > GAIT_DEADBAND for k in a)
+
+def motion_loop():
+    period = 1.0 / MOTION_HZ
+    # lo último que se mandó a NAOqi; None = reenviar el siguiente walk
+    sent_vel = None
+    sent_cfg = None
+    # marcha parada con seguridad: solo tras un stopMove, una velocidad cero
+    # o una llamada que acabaron bien; tras un error el estado es desconocido
+    # y el watchdog manda stopMove igualmente
+    stopped = True
+    log("Motion", "Hilo de movimiento a %.0f Hz", MOTION_HZ)
+    while True:
+        kind, command = walk_mailbox.take()
+        started = time.time()
+        rpcs = 0
+        try:
+            if kind == "call":
+                # posture, walkTo, behaviors: al acabar bien la marcha está parada
+                sent_vel = sent_cfg = None
+                stopped = command.run()
+                walk_mailbox.commanded = (0.0, 0.0, 0.0)
+            elif kind == "stop":
+                # ya parado (watchdog anterior o joystick suelto): nada que enviar
+                sent_vel = None
+                if stopped:
+                    walk_mailbox.count(0, 1)
+                else:
+                    rpcs = 1
+                    motion.stopMove()
+                    stopped = True
+                    walk_mailbox.count(1, 0)
+                    log("Watchdog", "stopMove() tras timeout")
+                walk_mailbox.commanded = (0.0, 0.0, 0.0)
+            else:
+                vel, move_cfg, adaptive_params = _walk_target(*command[:3])
+                cfg_changed = sent_cfg is None or _gait_moved(move_cfg, sent_cfg)
+                avoided = 0
+                if adaptive_params:
+                    if cfg_changed:
+                        # Aplicar parámetros CNN al motion
+                        adaptive_walker.apply_gait_params(adaptive_params)
+                        rpcs += 1
+                    else:
+                        avoided += 1
+                if sent_vel is None or cfg_changed or _moved(vel, sent_vel, WALK_DEADBAND):
+                    stopped = False
+                    _apply_moveToward(vel[0], vel[1], vel[2], move_cfg)
+                    stopped = not _moved(vel, (0.0, 0.0, 0.0), WALK_DEADBAND)
+                    walk_mailbox.latency.add(_clock() - command[3])
+                    sent_vel, sent_cfg = vel, move_cfg
+                    walk_mailbox.commanded = vel
+                    rpcs += 1
+                    log("SIM", "moveToward(vx=%.2f, vy=%.2f, wz=%.2f) cfg=%s caps=%s [%s]",
+                        vel[0], vel[1], vel[2], move_cfg, CAPS_APPLIED,
+                        "CNN" if adaptive_params else "Manual")
+                else:
+                    avoided += 1
+                walk_mailbox.count(rpcs, avoided)
+        except Exception as e:
+            log("Motion", "Error: %s", e)
+            # estado desconocido: el siguiente comando se reenvía y el
+            # watchdog para aunque lo último enviado fuera velocidad cero
+            sent_vel = sent_cfg = None
+            stopped = False
+        walk_mailbox.stopped = stopped
+        # el periodo limita los envíos a NAOqi; tras un ciclo sin RPC el
+        # siguiente comando se atiende en cuanto llega
+        if rpcs:
+            time.sleep(max(0.0, period - (time.time() - started)))
 
 # ─── Bucle adaptativo FSR+IMU con histeresis y suavizado ──────────────────────
-def adaptive_loop():
+def adaptive_steps(history):
+    """Generador: cada send(snapshot) añade la lectura al historial y ejecuta un ciclo
+
+    Sin NumPy (history None) los filtros y el CoP anterior van en escalares.
+    """
     log("Adapt", "Loop adaptativo iniciado")
 
-    # Filtros
+    # Filtros: EMA de las señales IMU sobre la ventana del historial
     alpha_sig = 0.20  # filtro señales IMU
+    EMA_WINDOW = 20   # lecturas; la más antigua pesa 0.8^19 ≈ 1.4%
+
+    # Sin historial: EMA recursiva y CoP de la lectura anterior
     filt_ax = 0.0
     filt_pitch = 0.0
-
-    # CoP anteriores
-    prev_cop = {"L": (0.0, 0.0), "R": (0.0, 0.0)}
-    prev_t = time.time()
+    prev_cop = None
+    prev_t = None
 
     # Umbrales e histeresis
     CONTACT_LOW = 3.0     # kg
@@ -321,26 +756,40 @@ def adaptive_loop():
     CAPS_APPLIED = dict(CAPS_NORMAL_REF)
 
     while True:
-        time.sleep(0.05)
-        now = time.time()
-        dt = max(1e-3, now - prev_t)
+        snap = yield
+        now = snap.t
 
         try:
-            # --- Sensores IMU
-            angle_x = _memf("Device/SubDeviceList/InertialSensor/AngleX/Sensor/Value", 0.0)
-            gyro_x  = _memf("Device/SubDeviceList/InertialSensor/GyroscopeX/Sensor/Value", 0.0)
-            acc_x   = _memf("Device/SubDeviceList/InertialSensor/AccelerometerX/Sensor/Value", 0.0)
-
-            filt_pitch = ema(filt_pitch, angle_x, alpha_sig)
-            filt_ax    = ema(filt_ax,    acc_x,   alpha_sig)
-
             # --- FSR
-            Lvals, Rvals, sumL, sumR, sumTot = read_fsr_kg()
+            Lvals, Rvals, sumL, sumR, sumTot = read_fsr_kg(snap)
             copL, wL = foot_cop("L", Lvals)
             copR, wR = foot_cop("R", Rvals)
-            dcopL = math.hypot(copL[0]-prev_cop["L"][0], copL[1]-prev_cop["L"][1]) / dt
-            dcopR = math.hypot(copR[0]-prev_cop["R"][0], copR[1]-prev_cop["R"][1]) / dt
-            prev_cop["L"] = copL; prev_cop["R"] = copR; prev_t = now
+
+            # --- Sensores IMU
+            gyro_x = snap.get("Device/SubDeviceList/InertialSensor/GyroscopeX/Sensor/Value", 0.0)
+            cop = (copL[0], copL[1], copR[0], copR[1])
+
+            if history is not None:
+                # --- historial: lectura + velocidad comandada + CoP, con el
+                # instante de la lectura (dCoP/dt no depende del retraso del ciclo)
+                history.append(snap.mono, [snap.get(key) for key in SENSOR_KEYS] +
+                               list(walk_mailbox.commanded) + list(cop))
+                filt_pitch, filt_ax = history.ema(("AngleX", "AccX"), alpha_sig, EMA_WINDOW)
+                # --- velocidad del CoP entre las dos últimas lecturas
+                dLx, dLy, dRx, dRy = history.derivative(COP_CHANNELS, 2)
+            else:
+                angle_x = snap.get("Device/SubDeviceList/InertialSensor/AngleX/Sensor/Value", 0.0)
+                acc_x   = snap.get("Device/SubDeviceList/InertialSensor/AccelerometerX/Sensor/Value", 0.0)
+                filt_pitch = ema(filt_pitch, angle_x, alpha_sig)
+                filt_ax    = ema(filt_ax,    acc_x,   alpha_sig)
+                dLx = dLy = dRx = dRy = 0.0
+                if prev_cop is not None and snap.mono > prev_t:
+                    dt = snap.mono - prev_t
+                    dLx, dLy, dRx, dRy = [(a - b) / dt for a, b in zip(cop, prev_cop)]
+                prev_cop, prev_t = cop, snap.mono
+
+            dcopL = math.hypot(dLx, dLy)
+            dcopR = math.hypot(dRx, dRy)
 
             # --- score de slip (0..1)
             comp_contact = 1.0 if sumTot < CONTACT_LOW else 0.0
@@ -418,15 +867,9 @@ def adaptive_loop():
                 CAPS_APPLIED[k] = clamp(a, 0.0, 1.0)
 
         except Exception as e:
-            log("Adapt", "Error adaptive_loop: %s" % e)
-
-# Lanzar el hilo adaptativo
-adap = threading.Thread(target=adaptive_loop)
-adap.setDaemon(True)
-adap.start()
+            log("Adapt", "Error adaptive_loop: %s", e)
 
 # ─── Limpieza de suscripciones y procesos ─────────────────────────────────────
-web_proc = None
 
 def cleanup_all_subscriptions():
     try:
@@ -439,11 +882,10 @@ def cleanup_all_subscriptions():
             except Exception:
                 pass
     except Exception as e:
-        log("Cleanup", "Error limpieza subs: %s" % e)
+        log("Cleanup", "Error limpieza subs: %s", e)
 
 def cleanup(signum, frame):
-    global web_proc
-    log("Server", "Señal {}, limpiando…".format(signum))
+    log("Server", "Señal %s, limpiando…", signum)
     
     # Mensaje TTS de cierre
     try:
@@ -455,420 +897,730 @@ def cleanup(signum, frame):
     try:
         cleanup_all_subscriptions()
     except Exception as e:
-        log("Cleanup", "Error limpieza completa: {}".format(e))
-    if web_proc:
-        try:
-            web_proc.terminate()
-            web_proc.wait()
-            log("Cleanup", "HTTP server detenido (pid {}).".format(web_proc.pid))
-        except Exception as e:
-            log("Cleanup", "Error deteniendo HTTP server: {}".format(e))
+        log("Cleanup", "Error limpieza completa: %s", e)
     try:
         log("Cleanup", "Liberando NAOqi...")
         motion.stopMove()
         motion.waitUntilMoveIsFinished()
         log("Cleanup", "NAOqi OK")
     except Exception as e:
-        log("Cleanup", "Error liberando NAOqi: {}".format(e))
+        log("Cleanup", "Error liberando NAOqi: %s", e)
     log("Cleanup", "Bye")
     sys.exit(0)
 
 signal.signal(signal.SIGINT,  cleanup)
 signal.signal(signal.SIGTERM, cleanup)
 
+# ─── Registro de acciones ──────────────────────────────────────────────────────
+# Cada acción del WS es un handler on_<acción>(ws, **args) registrado con
+# @action: el esquema de argumentos se declara una vez y el despacho es una
+# búsqueda en ACTIONS, sin recorrer una cadena de if/elif.
+ACTIONS = {}
+
+class Action(object):
+    """Acción registrada: handler, esquema, flags y métricas de latencia"""
+    __slots__ = ("name", "handler", "merge", "schema", "blocking", "idempotent", "coalesce",
+                 "lock", "errors", "parse_time", "handler_time", "naoqi_time")
+
+    def __init__(self, name, handler, args, blocking, idempotent, coalesce):
+        self.name = name
+        self.handler = handler
+        # handler(ws, [args, ...]) para varias seguidas dentro de un batch
+        self.merge = None
+        # (argumento, conversor, valor por defecto), fijado al registrar
+        self.schema = tuple((arg, spec[0], spec[1]) for arg, spec in sorted(args.items()))
+        self.blocking = blocking
+        self.idempotent = idempotent
+        self.coalesce = coalesce
+        # los workers registran a la vez
+        self.lock = threading.Lock()
+        self.errors = 0
+        self.parse_time = Histogram()
+        self.handler_time = Histogram()
+        self.naoqi_time = Histogram()
+
+    def parse(self, msg):
+        """Argumentos del handler; el conversor solo se aplica a lo recibido"""
+        args = {}
+        for arg, convert, default in self.schema:
+            if arg in msg:
+                value = msg[arg]
+                args[arg] = convert(value) if convert is not None else value
+            else:
+                args[arg] = default
+        return args
+
+    def record(self, parse, handler, naoqi, failed):
+        with self.lock:
+            self.parse_time.add(parse)
+            self.handler_time.add(handler)
+            self.naoqi_time.add(naoqi)
+            if failed:
+                self.errors += 1
+
+    def metrics(self):
+        flags = [flag for flag in ("blocking", "idempotent", "coalesce") if getattr(self, flag)]
+        with self.lock:
+            return {"flags": flags,
+                    "lane": self.blocking or None,
+                    "errors": self.errors,
+                    "parse": self.parse_time.asDict(),
+                    "handler": self.handler_time.asDict(),
+                    "naoqi": self.naoqi_time.asDict()}
+
+def action(name, args=None, blocking=False, idempotent=False, coalesce=False):
+    """Registrar on_<acción> para la acción name
+
+    args: argumento -> (conversor, valor por defecto). El conversor (float,
+    bool...) se aplica al valor del mensaje; None lo deja tal cual.
+    blocking:   carril ("motion", "speech") de una llamada NAOqi que puede
+                tardar segundos (say, posture, moveTo); se responde accepted
+                al momento y completed/failed al terminar
+    idempotent: repetirla con los mismos argumentos no cambia el resultado
+    coalesce:   un mensaje nuevo de la acción deja obsoleto al anterior; si es
+                el nombre de un argumento, solo cuando ese argumento coincide
+    """
+    def register(handler):
+        ACTIONS[name] = Action(name, handler, args or {}, blocking, idempotent, coalesce)
+        return handler
+    return register
+
+def merged(name):
+    """Registrar handler(ws, [args, ...]): varias name seguidas de un batch en una llamada"""
+    def register(handler):
+        ACTIONS[name].merge = handler
+        return handler
+    return register
+
+def parse_action(msg, start):
+    """(acción, argumentos, None) o (acción o None, None, motivo del rechazo)"""
+    # act.name y no la acción del mensaje: en Python 2 es unicode y al
+    # formatearla con estos literales UTF-8 el error cerraba la conexión
+    act = ACTIONS.get(msg.get("action"))
+    if act is None:
+        log("WS", "⚠ Acción desconocida %s", json.dumps(msg.get("action")))
+        return None, None, "unknown action"
+    try:
+        return act, act.parse(msg), None
+    except Exception as e:
+        log("WS", "Argumentos inválidos en %s: %s", act.name, e)
+        act.record(_clock() - start, 0.0, 0.0, True)
+        return act, None, "invalid arguments: %s" % e
+
+def run_action(ws, act, args, ident, parse):
+    """Ejecutar una acción ya validada; devuelve el motivo del fallo o None"""
+    if act.blocking:
+        call = NaoqiCall(ws, act, args, ident, parse)
+        if not LANES[act.blocking].submit(call):
+            log("WS", "Carril %s lleno, se rechaza %s", act.blocking, act.name)
+            call.reply(failed=act.name, reason="busy")
+            act.record(parse, 0.0, 0.0, True)
+            return "busy"
+        return None
+    failed = None
+    start = _clock()
+    _naoqi_time.elapsed = 0.0
+    try:
+        act.handler(ws, **args)
+    except Exception as e:
+        failed = str(e)
+        log("WS", "Excepción en %s: %s", act.name, e)
+    act.record(parse, _clock() - start, _naoqi_time.elapsed, failed is not None)
+    return failed
+
+def dispatch(ws, msg, start):
+    """Ejecutar la acción de msg (ya decodificado) y registrar sus tiempos"""
+    act, args, error = parse_action(msg, start)
+    if error is None:
+        error = run_action(ws, act, args, msg.get("id"), _clock() - start)
+    return error
+
 # ─── WebSocket handler ─────────────────────────────────────────────────────────
+# Lee la acción sin decodificar el JSON entero (messageKind corre en el bucle)
+_ACTION_RE = re.compile(r'"action"\s*:\s*"([^"]{0,32})"')
+
 class RobotWS(WebSocket):
+    # Sin __dict__ por conexión: todo el estado está en los slots de WebSocket
+    __slots__ = ()
+
+    # Un móvil dormido no debe acumular respuestas sin límite: de los estados
+    # (batería, caps, gait, config) solo interesa el último valor
+    sendqmaxbytes  = 256 * 1024
+    sendqmaxframes = 256
+    sendqpolicy    = QUEUE_CONFLATE
+    # Móviles que pierden el WiFi o cierran la pestaña: ping a los 10 s de
+    # silencio y fuera si no responden en otros 10 s
+    pinginterval     = 10
+    pongtimeout      = 10
+    handshaketimeout = 10
+
     def handleConnected(self):
-        log("WS", "Conectado %s" % (self.address,))
+        log("WS", "Conectado %s", self.address)
         # Al conectar, reporta config actual (aplicada) para no romper clientes
         try:
             self.sendMessage(json.dumps({"gait": GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT,
-                                         "caps": CAPS_APPLIED}))
+                                         "caps": CAPS_APPLIED}), key="config")
         except Exception:
             pass
 
     def handleClose(self):
-        log("WS", "Desconectado %s" % (self.address,))
+        log("WS", "Desconectado %s", self.address)
+
+    def messageKind(self):
+        # Estadísticas del pool de workers por acción; los frames binarios
+        # llegan como bytearray y la regex es de texto
+        if WebSocket.messageKind(self) != "text":
+            return "unknown"
+        match = _ACTION_RE.search(self.data)
+        return str(match.group(1)) if match else "invalid"
 
     def handleMessage(self):
-        global _last_walk, CURRENT_GAIT, CAP_LIMITS, GAIT_APPLIED, CAPS_APPLIED, GAIT_REF, CAPS_REF
+        start = _clock()
         raw = self.data.strip()
-        log("WS", "Recibido RAW: %s" % raw)
         try:
             msg = json.loads(raw)
         except Exception as e:
-            log("WS", "JSON inválido: %s (%s)" % (raw, e))
+            log("WS", "JSON inválido: %s (%s)", raw, e)
             return
-
-        action = msg.get("action")
+        act = ACTIONS.get(msg.get("action"))
+        # El stream del joystick (walk, move) no se registra mensaje a mensaje;
+        # de un batch, on_batch registra sus elementos
+        if act is None or not (act.coalesce or act.name == "batch"):
+            log_debug("WS", "Recibido RAW: %s", raw)
+        dispatch(self, msg, start)
+
+# ── Caminar reactivo con gait actual + caps (suavizados) ──────────────────────
+@action("walk", args={"vx": (float, 0.0), "vy": (float, 0.0), "wz": (float, 0.0)},
+        idempotent=True, coalesce=True)
+def on_walk(ws, vx, vy, wz):
+    global _last_walk, _walked
+    # el hilo de movimiento aplica caps, CNN y moveToward
+    walk_mailbox.post(vx, vy, wz)
+    _last_walk = time.time()
+    _walked = True
+
+# ── Caminar a un objetivo (bloqueante) con mismo gait ─────────────────────────
+@action("walkTo", args={"x": (float, 0.0), "y": (float, 0.0), "theta": (float, 0.0)},
+        blocking="motion")
+def on_walkTo(ws, x, y, theta):
+    move_cfg = _config_to_move_list(GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT)
+    try:
+        motion.moveTo(x, y, theta, move_cfg)
+    except Exception as e:
+        log("WalkTo", "moveTo with cfg failed: %s → retry sin cfg", e)
+        motion.moveTo(x, y, theta)
+    log("SIM", "moveTo(x=%.2f,y=%.2f,th=%.2f)", x, y, theta)
+
+# ── Seteo de Gait (manual por WS) ─────────────────────────────────────────────
+@action("gait", args={"config": (None, {})}, idempotent=True)
+def on_gait(ws, config):
+    global CURRENT_GAIT, GAIT_REF
+    # admite dict {"StepHeight":0.03,...} o lista [["StepHeight",0.03],...]
+    if not isinstance(config, (dict, list)):
+        raise ValueError("config debe ser dict o lista de pares")
+    CURRENT_GAIT = _config_to_move_list(config)
+    # si hay adaptativo encendido, consideramos el CURRENT_GAIT como base
+    GAIT_REF = merge_pairs(CURRENT_GAIT, [])
+    ws.sendMessage(json.dumps({"gaitApplied": CURRENT_GAIT}))
+    log("Gait", "Nuevo gait config (manual) = %s", CURRENT_GAIT)
+
+@action("getGait", idempotent=True)
+def on_getGait(ws):
+    ws.sendMessage(json.dumps({"gait": GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT}), key="gait")
+    log("Gait", "getGait → %s", GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT)
+
+# ── Seteo/consulta de CAPs de velocidad ───────────────────────────────────────
+def clamp01(v):
+    try:
+        v = float(v)
+        if v < 0: v = 0.0
+        if v > 1: v = 1.0
+        return v
+    except Exception:
+        return None
+
+@action("caps", args={"vx": (None, None), "vy": (None, None), "wz": (None, None)},
+        idempotent=True)
+def on_caps(ws, vx, vy, wz):
+    updated = {}
+    if vx is not None:
+        CAP_LIMITS["vx"] = clamp01(vx); updated["vx"] = CAP_LIMITS["vx"]
+        CAPS_REF["vx"] = min(CAPS_REF.get("vx",1.0), CAP_LIMITS["vx"])
+    if vy is not None:
+        CAP_LIMITS["vy"] = clamp01(vy); updated["vy"] = CAP_LIMITS["vy"]
+        CAPS_REF["vy"] = min(CAPS_REF.get("vy",1.0), CAP_LIMITS["vy"])
+    if wz is not None:
+        CAP_LIMITS["wz"] = clamp01(wz); updated["wz"] = CAP_LIMITS["wz"]
+        CAPS_REF["wz"] = min(CAPS_REF.get("wz",1.0), CAP_LIMITS["wz"])
+    ws.sendMessage(json.dumps({"caps": CAPS_APPLIED, "updated": updated}), key="caps")
+    log("Caps", "CAP_LIMITS(user) = %s ; caps_applied=%s", CAP_LIMITS, CAPS_APPLIED)
+
+@action("getCaps", idempotent=True)
+def on_getCaps(ws):
+    ws.sendMessage(json.dumps({"caps": CAPS_APPLIED}), key="caps")
+    log("Caps", "getCaps → %s", CAPS_APPLIED)
+
+# ── Atajo para leer todo de una ───────────────────────────────────────────────
+@action("getConfig", idempotent=True)
+def on_getConfig(ws):
+    ws.sendMessage(json.dumps({"gait": (GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT),
+                               "caps": CAPS_APPLIED,
+                               "adaptive": ADAPTIVE}), key="config")
+    log("Config", "getConfig → gait=%s caps=%s adaptive=%s", (GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT), CAPS_APPLIED, ADAPTIVE)
+
+# ── Protecciones de pie ───────────────────────────────────────────────────────
+@action("footProtection", args={"enable": (bool, True)}, idempotent=True)
+def on_footProtection(ws, enable):
+    motion.setMotionConfig([["ENABLE_FOOT_CONTACT_PROTECTION", enable]])
+    ws.sendMessage(json.dumps({"footProtection": enable}))
+    log("SIM", "FootContactProtection set to %s", enable)
+
+# ── Movimiento articular directo ──────────────────────────────────────────────
+@action("move", args={"joint": (None, ""), "value": (float, 0.0)},
+        idempotent=True, coalesce="joint")
+def on_move(ws, joint, value):
+    motion.setAngles(str(joint), value, 0.1)
+    log("SIM", "setAngles('%s',%.2f)", joint, value)
+
+@merged("move")
+def on_move_merged(ws, items):
+    # un solo setAngles; si una articulación se repite gana el último valor
+    targets = {}
+    for args in items:
+        targets[str(args["joint"])] = args["value"]
+    joints = sorted(targets)
+    motion.setAngles(joints, [targets[j] for j in joints], 0.1)
+    log("SIM", "setAngles(%s, %s)", joints, [round(targets[j], 2) for j in joints])
+
+# ── Postura ───────────────────────────────────────────────────────────────────
+@action("posture", args={"value": (None, "Stand")}, blocking="motion", idempotent=True)
+def on_posture(ws, value):
+    posture.goToPosture(str(value), 0.7)
+    log("SIM", "goToPosture('%s')", value)
+
+# ── LEDs ──────────────────────────────────────────────────────────────────────
+@action("led", args={"group": (None, "ChestLeds"), "r": (float, 0.0), "g": (float, 0.0),
+                     "b": (float, 0.0), "duration": (float, 0.0)}, idempotent=True)
+def on_led(ws, group, r, g, b, duration):
+    grp = group
+    try:
+        unicode_type = unicode
+    except NameError:
+        unicode_type = str
+    if isinstance(grp, unicode_type):
         try:
-            # ── Caminar reactivo con gait actual + caps (suavizados) ──────────
-            if action == "walk":
-                vx, vy, wz = map(float, (msg.get("vx",0), msg.get("vy",0), msg.get("wz",0)))
-                # Normaliza magnitud del vector (x,y) si excede 1.0
-                norm = math.hypot(vx, vy)
-                if norm > 1.0:
-                    vx, vy = vx/norm, vy/norm
-
-                # Aplicar CAPS suavizados
-                vx = max(-CAPS_APPLIED["vx"], min(CAPS_APPLIED["vx"], vx))
-                vy = max(-CAPS_APPLIED["vy"], min(CAPS_APPLIED["vy"], vy))
-                wz = max(-CAPS_APPLIED["wz"], min(CAPS_APPLIED["wz"], wz))
-
-                # CNN Adaptativa: Predecir parámetros de marcha óptimos
-                adaptive_cfg = None
-                if ADAPTIVE_WALK_ENABLED and adaptive_walker:
-                    try:
-                        adaptive_params = adaptive_walker.adapt_gait(vx, vy, wz)
-                        if adaptive_params:
-                            adaptive_cfg = _config_to_move_list(adaptive_params)
-                            logger.debug("CNN adaptativa: {}".format(adaptive_params))
-                            # Aplicar parámetros CNN al motion
-                            adaptive_walker.apply_gait_params(adaptive_params)
-                    except Exception as e:
-                        logger.warning("Error en CNN adaptativa: {}".format(e))
-
-                # Usar configuración adaptativa si está disponible, sino la configuración actual
-                move_cfg = adaptive_cfg if adaptive_cfg else _config_to_move_list(GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT)
-                _apply_moveToward(vx, vy, wz, move_cfg)
-                _last_walk = time.time()
-                
-                cfg_source = "CNN" if adaptive_cfg else "Manual"
-                log("SIM", "moveToward(vx=%.2f, vy=%.2f, wz=%.2f) cfg=%s caps=%s [%s]" %
-                    (vx, vy, wz, move_cfg, CAPS_APPLIED, cfg_source))
-
-            # ── Caminar a un objetivo (bloqueante) con mismo gait ─────────────
-            elif action == "walkTo":
-                x = float(msg.get("x", 0.0))
-                y = float(msg.get("y", 0.0))
-                theta = float(msg.get("theta", 0.0))
-                move_cfg = _config_to_move_list(GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT)
-                try:
-                    motion.moveTo(x, y, theta, move_cfg)
-                except Exception as e:
-                    log("WalkTo", "moveTo with cfg failed: %s → retry sin cfg" % e)
-                    motion.moveTo(x, y, theta)
-                log("SIM", "moveTo(x=%.2f,y=%.2f,th=%.2f)" % (x,y,theta))
-
-            # ── Seteo de Gait (manual por WS) ─────────────────────────────────
-            elif action == "gait":
-                user_cfg = msg.get("config", {})
-                # admite dict {"StepHeight":0.03,...} o lista [["StepHeight",0.03],...]
-                if not isinstance(user_cfg, (dict, list)):
-                    raise ValueError("config debe ser dict o lista de pares")
-                CURRENT_GAIT = _config_to_move_list(user_cfg)
-                # si hay adaptativo encendido, consideramos el CURRENT_GAIT como base
-                GAIT_REF = merge_pairs(CURRENT_GAIT, [])
-                self.sendMessage(json.dumps({"gaitApplied": CURRENT_GAIT}))
-                log("Gait", "Nuevo gait config (manual) = %s" % CURRENT_GAIT)
-
-            elif action == "getGait":
-                self.sendMessage(json.dumps({"gait": GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT}))
-                log("Gait", "getGait → %s" % (GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT))
-
-            # ── Seteo/consulta de CAPs de velocidad ───────────────────────────
-            elif action == "caps":
-                vx = msg.get("vx", None)
-                vy = msg.get("vy", None)
-                wz = msg.get("wz", None)
-                def clamp01(v):
-                    try:
-                        v = float(v)
-                        if v < 0: v = 0.0
-                        if v > 1: v = 1.0
-                        return v
-                    except Exception:
-                        return None
-                updated = {}
-                if vx is not None:
-                    CAP_LIMITS["vx"] = clamp01(vx); updated["vx"] = CAP_LIMITS["vx"]
-                    CAPS_REF["vx"] = min(CAPS_REF.get("vx",1.0), CAP_LIMITS["vx"])
-                if vy is not None:
-                    CAP_LIMITS["vy"] = clamp01(vy); updated["vy"] = CAP_LIMITS["vy"]
-                    CAPS_REF["vy"] = min(CAPS_REF.get("vy",1.0), CAP_LIMITS["vy"])
-                if wz is not None:
-                    CAP_LIMITS["wz"] = clamp01(wz); updated["wz"] = CAP_LIMITS["wz"]
-                    CAPS_REF["wz"] = min(CAPS_REF.get("wz",1.0), CAP_LIMITS["wz"])
-                self.sendMessage(json.dumps({"caps": CAPS_APPLIED, "updated": updated}))
-                log("Caps", "CAP_LIMITS(user) = %s ; caps_applied=%s" % (CAP_LIMITS, CAPS_APPLIED))
-
-            elif action == "getCaps":
-                self.sendMessage(json.dumps({"caps": CAPS_APPLIED}))
-                log("Caps", "getCaps → %s" % CAPS_APPLIED)
-
-            # ── Atajo para leer todo de una ───────────────────────────────────
-            elif action == "getConfig":
-                self.sendMessage(json.dumps({"gait": (GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT),
-                                             "caps": CAPS_APPLIED,
-                                             "adaptive": ADAPTIVE}))
-                log("Config", "getConfig → gait=%s caps=%s adaptive=%s" % ((GAIT_APPLIED if GAIT_APPLIED else CURRENT_GAIT), CAPS_APPLIED, ADAPTIVE))
-
-            # ── Protecciones de pie ───────────────────────────────────────────
-            elif action == "footProtection":
-                enable = bool(msg.get("enable", True))
-                motion.setMotionConfig([["ENABLE_FOOT_CONTACT_PROTECTION", enable]])
-                self.sendMessage(json.dumps({"footProtection": enable}))
-                log("SIM", "FootContactProtection set to %s" % enable)
-
-            # ── Movimiento articular directo ──────────────────────────────────
-            elif action == "move":
-                joint = msg.get("joint","")
-                val   = float(msg.get("value",0))
-                motion.setAngles(str(joint), val, 0.1)
-                log("SIM", "setAngles('%s',%.2f)" % (joint,val))
-
-            # ── Postura ───────────────────────────────────────────────────────
-            elif action == "posture":
-                pst = msg.get("value","Stand")
-                posture.goToPosture(str(pst), 0.7)
-                log("SIM", "goToPosture('%s')" % pst)
-
-            # ── LEDs ──────────────────────────────────────────────────────────
-            elif action == "led":
-                grp = msg.get("group", "ChestLeds")
+            grp = grp.encode('utf-8')
+        except Exception:
+            pass
+    rgb_int = (int(r*255) << 16) | (int(g*255) << 8) | int(b*255)
+    if grp in ("LeftEarLeds", "RightEarLeds"):
+        intensity = (rgb_int & 0xFF) / 255.0
+        leds.fade(grp, intensity, duration)
+        log("SIM", "fade('%s',%.2f,%.2f)", grp, intensity, duration)
+    else:
+        leds.fadeRGB(grp, rgb_int, duration)
+        log("SIM", "fadeRGB('%s',0x%06X,%.2f)", grp, rgb_int, duration)
+
+# ── Hablar ────────────────────────────────────────────────────────────────────
+@action("say", args={"text": (None, "")}, blocking="speech")
+def on_say(ws, text):
+    tts.say(str(text))
+    log("SIM", "say('%s')", text)
+
+# ── Idioma TTS ────────────────────────────────────────────────────────────────
+@action("language", args={"value": (None, "")}, idempotent=True)
+def on_language(ws, value):
+    try:
+        tts.setLanguage(str(value))
+        log("SIM", "setLanguage('%s')", value)
+    except Exception as e:
+        log("WS", "Error setLanguage('%s'): %s", value, e)
+
+# ── Autonomous Life ───────────────────────────────────────────────────────────
+@action("autonomous", args={"enable": (bool, False)}, blocking="motion", idempotent=True)
+def on_autonomous(ws, enable):
+    new_state = "interactive" if enable else "disabled"
+    life.setState(new_state)
+    log("SIM", "AutonomousLife.setState('%s')", new_state)
+
+# ── Kick (ejecuta behavior si existe) ─────────────────────────────────────────
+# Los handlers de carril dejan salir las excepciones de NAOqi: NaoqiCall.run
+# las registra y responde {"failed"} en vez de {"completed"}
+@action("kick", blocking="motion")
+def on_kick(ws):
+    behavior_name = "kicknao-f6eb94/behavior_1"
+    if behavior.isBehaviorInstalled(behavior_name):
+        for bhv in behavior.getRunningBehaviors():
+            behavior.stopBehavior(bhv)
+        behavior.runBehavior(behavior_name)
+        log("SIM", "Ejecutando kick behavior: '%s'", behavior_name)
+    else:
+        log("WS", "⚠ Behavior kick no instalado: '%s'", behavior_name)
+        installed = behavior.getInstalledBehaviors()
+        kicks = [b for b in installed if "kick" in b.lower()]
+        if kicks:
+            behavior.runBehavior(kicks[0])
+            log("SIM", "Ejecutando kick alternativo: '%s'", kicks[0])
+        else:
+            log("WS", "⚠ No se encontró behavior de kick")
+
+# ── Nuevo: ejecutar behavior "siu" (o buscar por substring "siu") ─────────────
+@action("siu", blocking="motion")
+def on_siu(ws):
+    try:
+        behavior_name = "siu-17777b/behavior_1"
+        if behavior.isBehaviorInstalled(behavior_name):
+            for bhv in behavior.getRunningBehaviors():
                 try:
-                    unicode_type = unicode
-                except NameError:
-                    unicode_type = str
-                if isinstance(grp, unicode_type):
+                    behavior.stopBehavior(bhv)
+                except Exception:
+                    pass
+            behavior.runBehavior(behavior_name)
+            log("SIM", "Ejecutando behavior 'siu' -> '%s'", behavior_name)
+            try:
+                ws.sendMessage(json.dumps({"siu": "started", "behavior": behavior_name}))
+            except Exception:
+                pass
+        else:
+            installed = behavior.getInstalledBehaviors()
+            matches = [b for b in installed if "siu" in b.lower()]
+            if matches:
+                target = matches[0]
+                for bhv in behavior.getRunningBehaviors():
                     try:
-                        grp = grp.encode('utf-8')
+                        behavior.stopBehavior(bhv)
                     except Exception:
                         pass
-                r, g, b = map(float, (msg.get("r",0), msg.get("g",0), msg.get("b",0)))
-                duration = float(msg.get("duration", 0.0))
-                rgb_int = (int(r*255) << 16) | (int(g*255) << 8) | int(b*255)
-                if grp in ("LeftEarLeds", "RightEarLeds"):
-                    intensity = (rgb_int & 0xFF) / 255.0
-                    leds.fade(grp, intensity, duration)
-                    log("SIM", "fade('%s',%.2f,%.2f)" % (grp, intensity, duration))
-                else:
-                    leds.fadeRGB(grp, rgb_int, duration)
-                    log("SIM", "fadeRGB('%s',0x%06X,%.2f)" % (grp, rgb_int, duration))
-
-            # ── Hablar ────────────────────────────────────────────────────────
-            elif action == "say":
-                txt = msg.get("text","")
-                tts.say(str(txt))
-                log("SIM", "say('%s')" % txt)
-
-            # ── Idioma TTS ────────────────────────────────────────────────────
-            elif action == "language":
-                lang = msg.get("value","")
+                behavior.runBehavior(target)
+                log("SIM", "Ejecutando behavior 'siu' alternativo: '%s'", target)
                 try:
-                    tts.setLanguage(str(lang))
-                    log("SIM", "setLanguage('%s')" % lang)
-                except Exception as e:
-                    log("WS", "Error setLanguage('%s'): %s" % (lang, e))
-
-            # ── Autonomous Life ───────────────────────────────────────────────
-            elif action == "autonomous":
-                enable = bool(msg.get("enable", False))
-                new_state = "interactive" if enable else "disabled"
-                life.setState(new_state)
-                log("SIM", "AutonomousLife.setState('%s')" % new_state)
-
-            # ── Kick (ejecuta behavior si existe) ─────────────────────────────
-            elif action == "kick":
-                try:
-                    behavior_name = "kicknao-f6eb94/behavior_1"
-                    if behavior.isBehaviorInstalled(behavior_name):
-                        for bhv in behavior.getRunningBehaviors():
-                            behavior.stopBehavior(bhv)
-                        behavior.runBehavior(behavior_name)
-                        log("SIM", "Ejecutando kick behavior: '%s'" % behavior_name)
-                    else:
-                        log("WS", "⚠ Behavior kick no instalado: '%s'" % behavior_name)
-                        installed = behavior.getInstalledBehaviors()
-                        kicks = [b for b in installed if "kick" in b.lower()]
-                        if kicks:
-                            behavior.runBehavior(kicks[0])
-                            log("SIM", "Ejecutando kick alternativo: '%s'" % kicks[0])
-                        else:
-                            log("WS", "⚠ No se encontró behavior de kick")
-                except Exception as e:
-                    log("WS", "Error ejecutando kick: %s" % e)
-
-            # ── Nuevo: ejecutar behavior "siu" (o buscar por substring "siu") ───
-            elif action == "siu":
+                    ws.sendMessage(json.dumps({"siu": "started", "behavior": target}))
+                except Exception:
+                    pass
+            else:
+                log("WS", "⚠ Behavior 'siu' no encontrado entre instalados")
                 try:
-                    behavior_name = "siu-17777b/behavior_1"
-                    if behavior.isBehaviorInstalled(behavior_name):
-                        for bhv in behavior.getRunningBehaviors():
-                            try:
-                                behavior.stopBehavior(bhv)
-                            except Exception:
-                                pass
-                        behavior.runBehavior(behavior_name)
-                        log("SIM", "Ejecutando behavior 'siu' -> '%s'" % behavior_name)
-                        try:
-                            self.sendMessage(json.dumps({"siu": "started", "behavior": behavior_name}))
-                        except Exception:
-                            pass
-                    else:
-                        installed = behavior.getInstalledBehaviors()
-                        matches = [b for b in installed if "siu" in b.lower()]
-                        if matches:
-                            target = matches[0]
-                            for bhv in behavior.getRunningBehaviors():
-                                try:
-                                    behavior.stopBehavior(bhv)
-                                except Exception:
-                                    pass
-                            behavior.runBehavior(target)
-                            log("SIM", "Ejecutando behavior 'siu' alternativo: '%s'" % target)
-                            try:
-                                self.sendMessage(json.dumps({"siu": "started", "behavior": target}))
-                            except Exception:
-                                pass
-                        else:
-                            log("WS", "⚠ Behavior 'siu' no encontrado entre instalados")
-                            try:
-                                self.sendMessage(json.dumps({"siu": "not_found"}))
-                            except Exception:
-                                pass
-                except Exception as e:
-                    log("WS", "Error ejecutando siu: %s" % e)
-                    try:
-                        self.sendMessage(json.dumps({"siu": "error", "reason": str(e)}))
-                    except Exception:
-                        pass
+                    ws.sendMessage(json.dumps({"siu": "not_found"}))
+                except Exception:
+                    pass
+    except Exception as e:
+        try:
+            ws.sendMessage(json.dumps({"siu": "error", "reason": str(e)}))
+        except Exception:
+            pass
+        raise
 
-            # ── Nuevo: ejecutar behavior arbitrario por nombre (runBehavior) ───
-            elif action == "runBehavior":
+# ── Nuevo: ejecutar behavior arbitrario por nombre (runBehavior) ──────────────
+@action("runBehavior", args={"behavior": (None, "")}, blocking="motion")
+def on_runBehavior(ws, **args):
+    # "behavior" es también el nombre del proxy ALBehaviorManager
+    try:
+        bname = args["behavior"]
+        if not bname:
+            raise ValueError("Se esperaba 'behavior' en el mensaje")
+        if behavior.isBehaviorInstalled(bname):
+            target = bname
+        else:
+            installed = behavior.getInstalledBehaviors()
+            matches = [b for b in installed if bname.lower() in b.lower()]
+            if matches:
+                target = matches[0]
+            else:
+                log("WS", "runBehavior: no se encontró behavior para '%s'", bname)
+                ws.sendMessage(json.dumps({"runBehavior": "not_found", "query": bname}))
+                target = None
+        if target:
+            for bhv in behavior.getRunningBehaviors():
                 try:
-                    bname = msg.get("behavior", "")
-                    if not bname:
-                        raise ValueError("Se esperaba 'behavior' en el mensaje")
-                    if behavior.isBehaviorInstalled(bname):
-                        target = bname
-                    else:
-                        installed = behavior.getInstalledBehaviors()
-                        matches = [b for b in installed if bname.lower() in b.lower()]
-                        if matches:
-                            target = matches[0]
-                        else:
-                            log("WS", "runBehavior: no se encontró behavior para '%s'" % bname)
-                            self.sendMessage(json.dumps({"runBehavior": "not_found", "query": bname}))
-                            target = None
-                    if target:
-                        for bhv in behavior.getRunningBehaviors():
-                            try:
-                                behavior.stopBehavior(bhv)
-                            except Exception:
-                                pass
-                        behavior.runBehavior(target)
-                        log("WS", "runBehavior -> Ejecutando '%s'" % target)
-                        self.sendMessage(json.dumps({"runBehavior": "started", "behavior": target}))
-                except Exception as e:
-                    log("WS", "Error runBehavior: %s" % e)
-                    try:
-                        self.sendMessage(json.dumps({"runBehavior": "error", "reason": str(e)}))
-                    except Exception:
-                        pass
+                    behavior.stopBehavior(bhv)
+                except Exception:
+                    pass
+            behavior.runBehavior(target)
+            log("WS", "runBehavior -> Ejecutando '%s'", target)
+            ws.sendMessage(json.dumps({"runBehavior": "started", "behavior": target}))
+    except Exception as e:
+        try:
+            ws.sendMessage(json.dumps({"runBehavior": "error", "reason": str(e)}))
+        except Exception:
+            pass
+        raise
+
+# ── Volumen ───────────────────────────────────────────────────────────────────
+@action("volume", args={"value": (float, 50.0)}, idempotent=True)
+def on_volume(ws, value):
+    audio.setOutputVolume(value)
+    log("SIM", "AudioDevice.setOutputVolume(%.1f)", value)
+
+# ── Estado de batería ─────────────────────────────────────────────────────────
+@action("getBattery", idempotent=True)
+def on_getBattery(ws):
+    level = battery.getBatteryCharge()
+    low   = (level < 20)
+    full  = (level >= 95)
+    payload = json.dumps({"battery": level, "low": low, "full": full})
+    ws.sendMessage(payload, key="battery")
+    log("SIM", "getBattery → %d%% low=%s full=%s", level, low, full)
+
+# ── Estado Autonomous Life ────────────────────────────────────────────────────
+@action("getAutonomousLife", idempotent=True)
+def on_getAutonomousLife(ws):
+    try:
+        current_state = life.getState()
+        is_enabled = current_state != "disabled"
+        ws.sendMessage(json.dumps({"autonomousLifeEnabled": is_enabled}))
+        log("SIM", "getAutonomousLife → enabled=%s", is_enabled)
+    except Exception as e:
+        log("WS", "Error getAutonomousLife: %s", e)
+        ws.sendMessage(json.dumps({"autonomousLifeEnabled": False}))
+
+# ── Activar / configurar modo adaptativo ──────────────────────────────────────
+@action("adaptiveGait", args={"enable": (bool, True), "mode": (str, None)}, idempotent=True)
+def on_adaptiveGait(ws, enable, mode):
+    if mode is None:
+        mode = ADAPTIVE["mode"]
+    ADAPTIVE["enabled"] = enable
+    if mode in ("auto", "slippery"):
+        ADAPTIVE["mode"] = mode
+    ADAPTIVE["last_event"] = 0.0  # reset suave
+    ws.sendMessage(json.dumps({"adaptiveGait": {"enabled": ADAPTIVE["enabled"], "mode": ADAPTIVE["mode"]}}))
+    log("Adapt", "adaptiveGait → enabled=%s mode=%s", ADAPTIVE["enabled"], ADAPTIVE["mode"])
+
+# ── Control CNN Adaptativa ────────────────────────────────────────────────────
+@action("adaptiveCNN", args={"enabled": (None, True)}, idempotent=True)
+def on_adaptiveCNN(ws, enabled):
+    try:
+        if adaptive_walker:
+            adaptive_walker.adaptation_enabled = enabled
+            stats = adaptive_walker.get_stats()
+            ws.sendMessage(json.dumps({
+                "adaptiveCNN": {
+                    "enabled": enabled,
+                    "available": ADAPTIVE_WALK_ENABLED,
+                    "stats": stats
+                }
+            }))
+            logger.info("CNN adaptativa {} - Stats: {}".format(
+                "habilitada" if enabled else "deshabilitada", stats))
+        else:
+            ws.sendMessage(json.dumps({
+                "adaptiveCNN": {
+                    "enabled": False,
+                    "available": False,
+                    "error": "CNN no disponible"
+                }
+            }))
+            logger.warning("CNN adaptativa no disponible")
+    except Exception as e:
+        logger.error("Error controlando CNN: {}".format(e))
+        ws.sendMessage(json.dumps({"adaptiveCNN": {"error": str(e)}}))
 
-            # ── Volumen ─────────────────────────────────────────────────────
-            elif action == "volume":
-                vol = float(msg.get("value", 50))
-                audio.setOutputVolume(vol)
-                log("SIM", "AudioDevice.setOutputVolume(%.1f)" % vol)
-
-            # ── Estado de batería ─────────────────────────────────────────────
-            elif action == "getBattery":
-                level = battery.getBatteryCharge()
-                low   = (level < 20)
-                full  = (level >= 95)
-                payload = json.dumps({"battery": level, "low": low, "full": full})
-                self.sendMessage(payload)
-                log("SIM","getBattery → %d%% low=%s full=%s"%(level,low,full))
-
-            # ── Estado Autonomous Life ────────────────────────────────────────
-            elif action == "getAutonomousLife":
-                try:
-                    current_state = life.getState()
-                    is_enabled = current_state != "disabled"
-                    self.sendMessage(json.dumps({"autonomousLifeEnabled": is_enabled}))
-                    log("SIM","getAutonomousLife → enabled=%s"%(is_enabled))
-                except Exception as e:
-                    log("WS", "Error getAutonomousLife: %s" % e)
-                    self.sendMessage(json.dumps({"autonomousLifeEnabled": False}))
-
-            # ── Activar / configurar modo adaptativo ─────────────────────────
-            elif action == "adaptiveGait":
-                enable = bool(msg.get("enable", True))
-                mode = str(msg.get("mode", ADAPTIVE["mode"]))
-                ADAPTIVE["enabled"] = enable
-                if mode in ("auto", "slippery"):
-                    ADAPTIVE["mode"] = mode
-                ADAPTIVE["last_event"] = 0.0  # reset suave
-                self.sendMessage(json.dumps({"adaptiveGait": {"enabled": ADAPTIVE["enabled"], "mode": ADAPTIVE["mode"]}}))
-                log("Adapt", "adaptiveGait → enabled=%s mode=%s" % (ADAPTIVE["enabled"], ADAPTIVE["mode"]))
-
-            # ── Control CNN Adaptativa ────────────────────────────────────────
-            elif action == "adaptiveCNN":
-                try:
-                    enable = msg.get("enabled", True)
-                    if adaptive_walker:
-                        adaptive_walker.adaptation_enabled = enable
-                        stats = adaptive_walker.get_stats()
-                        self.sendMessage(json.dumps({
-                            "adaptiveCNN": {
-                                "enabled": enable,
-                                "available": ADAPTIVE_WALK_ENABLED,
-                                "stats": stats
-                            }
-                        }))
-                        logger.info("CNN adaptativa {} - Stats: {}".format(
-                            "habilitada" if enable else "deshabilitada", stats))
-                    else:
-                        self.sendMessage(json.dumps({
-                            "adaptiveCNN": {
-                                "enabled": False,
-                                "available": False,
-                                "error": "CNN no disponible"
-                            }
-                        }))
-                        logger.warning("CNN adaptativa no disponible")
-                except Exception as e:
-                    logger.error("Error controlando CNN: {}".format(e))
-                    self.sendMessage(json.dumps({"adaptiveCNN": {"error": str(e)}}))
-
-            # ── Estadísticas CNN Adaptativa ───────────────────────────────────
-            elif action == "getCNNStats":
-                try:
-                    if adaptive_walker:
-                        stats = adaptive_walker.get_stats()
-                        self.sendMessage(json.dumps({"cnnStats": stats}))
-                        logger.debug("Estadísticas CNN enviadas: {}".format(stats))
-                    else:
-                        self.sendMessage(json.dumps({"cnnStats": {"available": False}}))
-                except Exception as e:
-                    logger.error("Error obteniendo estadísticas CNN: {}".format(e))
-                    self.sendMessage(json.dumps({"cnnStats": {"error": str(e)}}))
+# ── Estadísticas CNN Adaptativa ───────────────────────────────────────────────
+@action("getCNNStats", idempotent=True)
+def on_getCNNStats(ws):
+    try:
+        if adaptive_walker:
+            stats = adaptive_walker.get_stats()
+            ws.sendMessage(json.dumps({"cnnStats": stats}))
+            logger.debug("Estadísticas CNN enviadas: {}".format(stats))
+        else:
+            ws.sendMessage(json.dumps({"cnnStats": {"available": False}}))
+    except Exception as e:
+        logger.error("Error obteniendo estadísticas CNN: {}".format(e))
+        ws.sendMessage(json.dumps({"cnnStats": {"error": str(e)}}))
 
-            else:
-                log("WS", "⚠ Acción desconocida '%s'" % action)
+# ── Batch: varias acciones en un frame, respuestas en otro ────────────────────
+BATCH_MAX = 32
 
-        except Exception as e:
-            log("WS", "Excepción en %s: %s" % (action, e))
+class BatchReplies(object):
+    """ws que ven los handlers de un batch: junta sus respuestas por elemento
+
+    Solo las del hilo que ejecuta el batch; lo que llega de otro hilo (el
+    completed de un carril) o después de terminar va directo al cliente.
+    """
+    __slots__ = ("ws", "thread", "replies")
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.thread = threading.current_thread()
+        self.replies = None
+
+    def sendMessage(self, data, key=None):
+        if self.replies is not None and threading.current_thread() is self.thread:
+            self.replies.append(json.loads(data))
+        else:
+            self.ws.sendMessage(data, key)
+
+    def collect(self):
+        replies, self.replies = self.replies, []
+        return replies
+
+@action("batch", args={"items": (None, []), "atomic": (bool, False), "id": (None, None)})
+def on_batch(ws, items, atomic, **args):
+    # "id" como argumento taparía al builtin
+    ident = args["id"]
+    if not isinstance(items, list) or len(items) > BATCH_MAX:
+        log("WS", "Batch rechazado: items no es una lista de hasta %d acciones", BATCH_MAX)
+        ws.sendMessage(json.dumps({"batch": {"id": ident, "ok": False, "rejected": True,
+                                             "error": "items must be a list of up to %d actions" % BATCH_MAX}}))
+        return
+    start = _clock()
+    parsed = []
+    results = []
+    for item in items:
+        if not isinstance(item, dict) or item.get("action") == "batch":
+            act, args, error = None, None, "invalid item"
+        else:
+            act, args, error = parse_action(item, start)
+            if act is not None and not act.coalesce:
+                log_debug("WS", "Recibido RAW (batch): %s", item)
+        result = {"action": act.name if act else None, "ok": error is None}
+        if isinstance(item, dict):
+            if act is None:
+                result["action"] = item.get("action")
+            if "id" in item:
+                result["id"] = item["id"]
+        if error is not None:
+            result["error"] = error
+        parsed.append((item, act, args))
+        results.append(result)
+    parse = (_clock() - start) / max(1, len(items))
+
+    if atomic and not all(r["ok"] for r in results):
+        # nada se ejecuta: el cliente ve qué elementos no validaron
+        for result in results:
+            if result["ok"]:
+                result["ok"] = False
+                result["error"] = "not run"
+        ws.sendMessage(json.dumps({"batch": {"id": ident, "ok": False, "rejected": True,
+                                             "results": results}}))
+        return
+
+    replies = BatchReplies(ws)
+    replies.collect()
+    i = 0
+    while i < len(parsed):
+        item, act, args = parsed[i]
+        if act is None or args is None:
+            i += 1
+            continue
+        # acciones iguales seguidas con merge: una sola llamada NAOqi
+        j = i + 1
+        if act.merge is not None:
+            while j < len(parsed) and parsed[j][1] is act and parsed[j][2] is not None:
+                j += 1
+        if j - i > 1:
+            error = None
+            run_start = _clock()
+            _naoqi_time.elapsed = 0.0
+            try:
+                act.merge(replies, [p[2] for p in parsed[i:j]])
+            except Exception as e:
+                error = str(e)
+                log("WS", "Excepción en %s (batch): %s", act.name, e)
+            act.record(parse, _clock() - run_start, _naoqi_time.elapsed, error is not None)
+        else:
+            error = run_action(replies, act, args, item.get("id"), parse)
+        for k in range(i, j):
+            results[k]["replies"] = replies.collect() if k == i else []
+            if error is not None:
+                results[k]["ok"] = False
+                results[k]["error"] = error
+        i = j
+    replies.replies = None
+    ok = all(r["ok"] for r in results)
+    # como move o walk sueltos, un batch del joystick sin id no tiene respuesta
+    if ident is None and ok and not any(r.get("replies") for r in results):
+        return
+    ws.sendMessage(json.dumps({"batch": {"id": ident, "ok": ok, "results": results}}))
+
+# ── Métricas por acción: tiempos de parseo, handler y llamadas NAOqi ──────────
+@action("getMetrics", idempotent=True)
+def on_getMetrics(ws):
+    metrics = dict((name, act.metrics()) for name, act in ACTIONS.items())
+    ws.sendMessage(json.dumps({"metrics": metrics, "motion": walk_mailbox.metrics()}),
+                   key="metrics")
+
+# ── Niveles de log por tag, en caliente ───────────────────────────────────────
+def _log_levels():
+    with _samplers_lock:
+        suppressed = dict(LOG_SUPPRESSED)
+    return {"levels": dict((tag, LEVEL_NAMES[level]) for tag, level in LOG_LEVEL.items()),
+            "sample": dict(LOG_SAMPLE),
+            "suppressed": suppressed}
+
+@action("logLevel", args={"tag": (str, "*"), "level": (None, None), "sample": (None, None)},
+        idempotent=True)
+def on_logLevel(ws, tag, level, sample):
+    set_log_level(tag, level, sample)
+    log("Config", "Log %s: nivel=%s muestreo=%s", tag, level, sample)
+    ws.sendMessage(json.dumps({"logLevels": _log_levels()}), key="logLevels")
+
+@action("getLogLevels", idempotent=True)
+def on_getLogLevels(ws):
+    ws.sendMessage(json.dumps({"logLevels": _log_levels()}), key="logLevels")
+
+# ── Telemetría: último snapshot de sensores, sin RPC ──────────────────────────
+@action("getSensors", idempotent=True)
+def on_getSensors(ws):
+    data = sensor_service.latest().to_dict()
+    data["service"] = sensor_service.stats()
+    data["history"] = sensor_history.stats() if sensor_history is not None else None
+    ws.sendMessage(json.dumps({"sensors": data}), key="sensors")
 
 # ─── Arranque WS ───────────────────────────────────────────────────────────────
 if __name__ == "__main__":
-    log("Server", "Iniciando WS en ws://0.0.0.0:%d" % WS_PORT)
+    log("Server", "Iniciando WS en ws://0.0.0.0:%d", WS_PORT)
+    webroot = WEB_DIR if os.path.isdir(WEB_DIR) else None
+    if webroot is None:
+        log("Server", "Web no encontrada en %s, solo WebSocket", WEB_DIR)
     srv = None
     try:
         while True:
             try:
-                srv = SimpleWebSocketServer("", WS_PORT, RobotWS)
+                if WS_ENGINE == "asyncio":
+                    from SimpleWebSocketServer.AsyncWebSocketServer import AsyncWebSocketServer
+                    srv = AsyncWebSocketServer("", WS_PORT, RobotWS, webroot=webroot)
+                else:
+                    srv = SimpleWebSocketServer("", WS_PORT, RobotWS, workers=WS_WORKERS,
+                                                webroot=webroot)
                 break
             except socket.error as e:
                 if e.errno == errno.EADDRINUSE:
-                    log("Server", "Puerto %d ocupado, reintentando en 3s…" % WS_PORT)
+                    log("Server", "Puerto %d ocupado, reintentando en 3s…", WS_PORT)
                     time.sleep(3)
                 else:
                     raise
         log("Server", "Servidor WebSocket iniciado")
+        # watchdog cada 50 ms en el bucle del servidor; su retraso sobre el
+        # plazo sale en getStats()['timer_lateness']
+        log("Watchdog", "Iniciado (%.1fs)", WATCHDOG)
+        srv.call_every(0.05, watchdog_tick)
+        # bucle adaptativo tras cada lectura de sensores, en su hilo: ya no
+        # hace RPC, los datos llegan en el snapshot y quedan en el historial
+        if sensor_history is None:
+            log("Adapt", "NumPy no disponible: bucle adaptativo con filtros escalares, sin historial")
+        steps = adaptive_steps(sensor_history)
+        next(steps)
+        sensor_service.subscribe(steps.send)
+        sensor_service.start()
+        log("Sensors", "Lectura de %d claves a %.0f Hz", len(sensor_service.keys), SENSOR_HZ)
+        mover = threading.Thread(target=motion_loop)
+        mover.setDaemon(True)
+        mover.start()
+        speaker = threading.Thread(target=lane_loop, args=(speech_lane,))
+        speaker.setDaemon(True)
+        speaker.start()
+        if LOGGER_INPROC:
+            try:
+                import logger as log_service
+                log_service.attach(srv)
+                log("Server", "Logs servidos desde este proceso (ws://0.0.0.0:%d)", log_service.LOG_WS_PORT)
+            except Exception as e:
+                log("Server", "✖ No se pudo alojar el servidor de logs: %s", e)
         logger.info("Control server WebSocket activo en puerto {}".format(WS_PORT))
+        # kill -USR1 <pid>: contadores de transporte (sendq, tiempos de cola y
+        # de handler, bucle) del servidor y de cada conexión, en JSON por stdout
+        signal.signal(signal.SIGUSR1, lambda signum, frame: srv.dumpStats(sys.stdout))
         
         # Mensaje TTS de confirmación
         try:
@@ -882,7 +1634,7 @@ if __name__ == "__main__":
         log("Server", "Interrupción de teclado detectada")
         cleanup(signal.SIGINT, None)
     except Exception as e:
-        log("Server", "Error fatal: {}".format(e))
+        log("Server", "Error fatal: %s", e)
         cleanup(signal.SIGTERM, None)
     finally:
         if srv:
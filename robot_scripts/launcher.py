@@ -1,7 +1,7 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
 """
-launcher.py – Arranca/Detiene control_server.py + HTTP server
+launcher.py – Arranca/Detiene control_server.py (WS + web del mando)
    con un long-press (>=3 s) del sensor táctil medio de la cabeza.
    Usa modelo basado en eventos con fallback a polling para máxima compatibilidad.
 """
@@ -105,9 +105,12 @@ PRESS_HOLD = 3.0            # segundos mínimos de pulsación (3 o más)
 # Ajusta estas rutas según dónde tengas los scripts
 CONTROL_PY = "/home/nao/scripts/control_server.py"
 LOGGER_PY  = "/home/nao/scripts/logger.py"        # Nuevo: ruta del logger
-WEB_DIR    = "/home/nao/Webs/ControllerWebServer"
 CAMERA_PY  = "/home/nao/scripts/video_stream.py"
-HTTP_PORT  = "8000"
+# La web (/home/nao/Webs/ControllerWebServer) la sirve control_server.py en
+# su propio puerto WS: http://<IP_NAO>:6671/
+# NAO_LOGGER_INPROC=1: los logs los sirve control_server.py en su propio
+# proceso y no se lanza logger.py (la variable la heredan los hijos)
+LOGGER_INPROC = os.environ.get("NAO_LOGGER_INPROC", "0") == "1"
 
 def get_server_ip():
     """Obtiene automáticamente la IP del servidor (gateway de la red local)."""
@@ -145,7 +148,6 @@ class RobustLauncher:
         
         # Procesos
         self.server_proc = None
-        self.http_proc = None
         self.camera_proc = None
         self.logger_proc = None  # Agregar proceso del logger
         
@@ -437,7 +439,7 @@ class RobustLauncher:
             log("INFO", "Paso 3/3: Actualizando estado...", "CONTROL")
             try:
                 # Solo marcar como running si al menos algunos servicios están activos
-                if self.server_proc or self.camera_proc or self.http_proc:
+                if self.server_proc or self.camera_proc:
                     self.services_running = True
                     success_steps += 1
                     log("SUCCESS", "Estado actualizado - servicios activos", "CONTROL")
@@ -513,10 +515,12 @@ class RobustLauncher:
         """Inicia todos los servicios de control."""
         log("INFO", "Iniciando servicios...", "SERVICES")
         services_started = 0
-        total_services = 4  # Incrementado para incluir el logger
+        total_services = 3  # Logger, control server (WS + web) y cámara
+        if LOGGER_INPROC:
+            total_services = 2  # El logger va dentro del control server
         
         # Logger (debe iniciarse primero)
-        if not hasattr(self, 'logger_proc') or not self.logger_proc:
+        if not LOGGER_INPROC and not getattr(self, 'logger_proc', None):
             try:
                 log("INFO", "Iniciando logger centralizado...", "SERVICES")
                 self.logger_proc = subprocess.Popen(["python2", LOGGER_PY])
@@ -575,29 +579,6 @@ class RobustLauncher:
         else:
             services_started += 1
         
-        # HTTP server
-        if not self.http_proc:
-            try:
-                self.http_proc = subprocess.Popen(
-                    ["python2", "-m", "SimpleHTTPServer", HTTP_PORT],
-                    cwd=WEB_DIR,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-                time.sleep(1)
-                
-                if self.http_proc.poll() is None:
-                    services_started += 1
-                    log("SUCCESS", "HTTP server iniciado", "SERVICES")
-                else:
-                    self.http_proc = None
-                    log("ERROR", "HTTP server falló", "SERVICES")
-            except Exception as e:
-                log("ERROR", "Error iniciando HTTP server: " + str(e), "SERVICES")
-                self.http_proc = None
-        else:
-            services_started += 1
-        
         success = (services_started == total_services)
         log("INFO", "Servicios iniciados: {}/{}".format(services_started, total_services), "SERVICES")
         return success
@@ -607,7 +588,6 @@ class RobustLauncher:
         log("INFO", "Deteniendo servicios...", "SERVICES")
         
         processes = [
-            ("HTTP server", self.http_proc),
             ("Cámara", self.camera_proc),
             ("Control server", self.server_proc),
             ("Logger", getattr(self, 'logger_proc', None))  # Agregar logger a la lista
@@ -626,7 +606,6 @@ class RobustLauncher:
                 except Exception as e:
                     log("ERROR", "Error deteniendo {}: {}".format(name, str(e)), "SERVICES")
         
-        self.http_proc = None
         self.camera_proc = None
         self.server_proc = None
         self.logger_proc = None  # Resetear también el logger
@@ -5,6 +5,7 @@ logger.py - Sistema de logging centralizado con WebSocket
 
 Funcionalidades:
 - Servidor WebSocket para streaming de logs en tiempo real (puerto 6672)
+- Proceso propio o dentro del bucle de control_server.py (attach)
 - Cliente de logging para enviar logs desde diferentes módulos
 - Clasificación de logs por módulo [LAUNCHER], [CONTROL], [CAMERA], etc.
 - Almacenamiento en archivo y memoria circular
@@ -15,12 +16,14 @@ import threading
 import time
 import json
 import socket
+import errno
 import logging
 import os
+import signal
 import sys
 from datetime import datetime
 from collections import deque
-from SimpleWebSocketServer import WebSocket, SimpleWebSocketServer
+from SimpleWebSocketServer import WebSocket, SimpleWebSocketServer, QUEUE_DROP_OLDEST
 
 # Configuración
 LOG_WS_PORT = 6672
@@ -55,6 +58,7 @@ class LogManager:
     def __init__(self):
         self.logs = deque(maxlen=MAX_LOG_HISTORY)
         self.websocket_clients = set()
+        self.ws_server = None  # SimpleWebSocketServer que sirve a los clientes
         self.lock = threading.Lock()
         self.running = True
         
@@ -90,21 +94,15 @@ class LogManager:
     
     def broadcast_to_websockets(self, entry):
         """Enviar log a todos los clientes WebSocket conectados"""
-        if not self.websocket_clients:
+        if not self.websocket_clients or self.ws_server is None:
             return
         
+        # El frame se construye una sola vez y se comparte entre clientes.
+        # Desde el hilo UDP el envío se entrega al bucle del servidor, que se
+        # despierta al momento en lugar de esperar al timeout del select
         message = json.dumps(entry.to_dict())
-        disconnected = set()
-        
-        for client in self.websocket_clients:
-            try:
-                client.sendMessage(message)
-            except Exception as e:
-                disconnected.add(client)
-        
-        # Remover clientes desconectados
-        for client in disconnected:
-            self.websocket_clients.discard(client)
+        clients = self.websocket_clients
+        self.ws_server.broadcast(message, lambda client: client in clients)
     
     def get_recent_logs(self, count=50):
         """Obtener logs recientes"""
@@ -132,6 +130,18 @@ class LogManager:
 log_manager = LogManager()
 
 class LogWebSocket(WebSocket):
+    # Sin __dict__ por conexión: todo el estado está en los slots de WebSocket
+    __slots__ = ()
+
+    # Si el cliente deja de leer se descartan los logs más antiguos
+    sendqmaxbytes  = 512 * 1024
+    sendqmaxframes = 1000
+    sendqpolicy    = QUEUE_DROP_OLDEST
+    # Clientes muertos se eliminan (y se libera su estado en LogManager)
+    pinginterval     = 10
+    pongtimeout      = 10
+    handshaketimeout = 10
+
     def handleMessage(self):
         # No necesitamos manejar mensajes entrantes del cliente
         # Solo enviamos logs al cliente
@@ -152,18 +162,22 @@ class UDPLogReceiver:
         self.socket.bind(('127.0.0.1', LOG_UDP_PORT))
         self.running = True
     
-    def start(self):
-        """Iniciar receptor UDP en hilo separado"""
-        thread = threading.Thread(target=self._receive_loop)
-        thread.daemon = True
-        thread.start()
+    def start(self, server):
+        """Recibir logs UDP en el bucle del servidor, sin hilo propio"""
+        self.socket.setblocking(0)
+        server.add_reader(self.socket, self._receive)
         log_manager.add_log("LOGGER", "INFO", "Receptor UDP iniciado en puerto {}".format(LOG_UDP_PORT))
     
-    def _receive_loop(self):
-        """Bucle principal para recibir logs por UDP"""
+    def _receive(self):
+        """Leer todos los logs pendientes (con epoll solo se avisa una vez)"""
         while self.running:
             try:
                 data, addr = self.socket.recvfrom(1024)
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    log_manager.add_log("LOGGER", "ERROR", "Error recibiendo UDP: {}".format(str(e)))
+                return
+            try:
                 log_data = json.loads(data.decode('utf-8'))
                 log_manager.add_log(
                     log_data.get('module', 'UNKNOWN'),
@@ -172,7 +186,6 @@ class UDPLogReceiver:
                 )
             except Exception as e:
                 log_manager.add_log("LOGGER", "ERROR", "Error recibiendo UDP: {}".format(str(e)))
-                time.sleep(0.1)
     
     def stop(self):
         self.running = False
@@ -186,6 +199,10 @@ class NAOLogger:
     
     def _send_log(self, level, message):
         """Enviar log por UDP al servidor"""
+        if log_manager.ws_server is not None:
+            # El servidor de logs corre en este mismo proceso: sin UDP ni JSON
+            log_manager.add_log(self.module_name, level, message)
+            return
         try:
             log_data = {
                 'module': self.module_name,
@@ -222,6 +239,20 @@ def create_logger(module_name):
     """Función helper para crear un logger para un módulo"""
     return NAOLogger(module_name)
 
+def attach(server, port=LOG_WS_PORT):
+    """Servir los logs desde el bucle de otro SimpleWebSocketServer
+
+    El WebSocket de logs escucha en port junto a los del servidor y el
+    receptor UDP se atiende en el mismo bucle: un proceso Python menos en
+    el robot. Devuelve el receptor UDP.
+    """
+    server.addListener('', port, LogWebSocket)
+    log_manager.ws_server = server
+    udp_receiver = UDPLogReceiver()
+    udp_receiver.start(server)
+    log_manager.add_log("LOGGER", "INFO", "Servidor WebSocket de logs en puerto {} (en proceso)".format(port))
+    return udp_receiver
+
 def main():
     """Función principal del servidor de logs"""
     print("=== NAO LOGGING SERVER ===")
@@ -231,15 +262,18 @@ def main():
     print("Para Postman: ws://localhost:{}".format(LOG_WS_PORT))
     print("Presiona Ctrl+C para detener")
     
-    # Iniciar receptor UDP
+    # Receptor UDP (atendido en el bucle del servidor WebSocket)
     udp_receiver = UDPLogReceiver()
-    udp_receiver.start()
     
     # Iniciar servidor WebSocket
     try:
         server = SimpleWebSocketServer('', LOG_WS_PORT, LogWebSocket)
+        log_manager.ws_server = server
+        udp_receiver.start(server)
         log_manager.add_log("LOGGER", "INFO", "Servidor WebSocket iniciado en puerto {}".format(LOG_WS_PORT))
         log_manager.add_log("LOGGER", "INFO", "Listo para conectar desde Postman: ws://localhost:{}".format(LOG_WS_PORT))
+        # kill -USR1 <pid>: contadores de transporte del servidor en JSON por stdout
+        signal.signal(signal.SIGUSR1, lambda signum, frame: server.dumpStats(sys.stdout))
         
         server.serveforever()
     except KeyboardInterrupt:
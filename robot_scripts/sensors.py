@@ -0,0 +1,296 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+sensors.py - Lectura compartida de los sensores de ALMemory
+
+Un hilo lee todas las claves de IMU y FSR con una sola llamada
+ALMemory.getListData a la frecuencia configurada y publica un
+SensorSnapshot con su instante de lectura. El bucle adaptativo, la CNN de
+caminata y la telemetría leen ese snapshot sin hacer más RPC.
+
+SensorHistory guarda las últimas lecturas (más velocidad comandada y CoP)
+en un buffer circular de NumPy para medias, derivadas y EMA por ventana.
+
+Uso:
+    sensors = SensorService(memory, rate=20.0, log=log)   # log(msg, *args)
+    sensors.subscribe(callback)      # callback(snapshot) tras cada lectura
+    sensors.start()
+    sensors.latest().get("Device/SubDeviceList/InertialSensor/AngleX/Sensor/Value")
+
+    history = SensorHistory(64)
+    history.append(snapshot.mono, row)            # fila en el orden de HISTORY_CHANNELS
+    history.mean(("AngleX", "AccX"), 10)          # últimas 10 lecturas
+"""
+
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+def _clock_gettime():
+    """Reloj monótono para Python 2 (el del robot): clock_gettime por ctypes"""
+    import ctypes
+    import ctypes.util
+
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1     # linux/time.h
+    for name in (ctypes.util.find_library("rt"), "librt.so.1", None):
+        try:
+            clock_gettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+            break
+        except (OSError, AttributeError):
+            continue
+    else:
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    ts = timespec()
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    try:
+        monotonic()
+    except OSError:
+        return None
+    return monotonic
+
+# instantes de lectura (SensorSnapshot.mono) en un reloj que no salta con NTP
+# ni con un cambio de hora. Sin perf_counter ni clock_gettime queda time.time
+# y MONOTONIC_CLOCK lo indica: derivative() devuelve 0 si el reloj retrocede
+_clock = getattr(time, "perf_counter", None)
+if _clock is None:
+    try:
+        _clock = _clock_gettime()
+    except ImportError:
+        _clock = None
+MONOTONIC_CLOCK = _clock is not None
+if _clock is None:
+    _clock = time.time
+
+_IMU = "Device/SubDeviceList/InertialSensor/%s/Sensor/Value"
+_FSR = "Device/SubDeviceList/%s/FSR/%s/Sensor/Value"
+
+IMU_KEYS = [_IMU % name for name in ("AccelerometerX", "AccelerometerY", "AccelerometerZ",
+                                     "GyroscopeX", "GyroscopeY", "GyroscopeZ",
+                                     "AngleX", "AngleY")]
+FSR_KEYS = [_FSR % (foot, sensor) for foot in ("LFoot", "RFoot")
+            for sensor in ("FrontLeft", "FrontRight", "RearLeft", "RearRight")]
+SENSOR_KEYS = IMU_KEYS + FSR_KEYS
+
+# Columnas de SensorHistory: instante, SENSOR_KEYS en el mismo orden,
+# velocidad comandada y CoP de cada pie (m, marco del tobillo)
+SENSOR_CHANNELS = ["AccX", "AccY", "AccZ", "GyrX", "GyrY", "GyrZ", "AngleX", "AngleY",
+                   "L_FL", "L_FR", "L_RL", "L_RR", "R_FL", "R_FR", "R_RL", "R_RR"]
+COMMAND_CHANNELS = ["vx", "vy", "wz"]
+COP_CHANNELS = ["copLx", "copLy", "copRx", "copRy"]
+HISTORY_CHANNELS = ["t"] + SENSOR_CHANNELS + COMMAND_CHANNELS + COP_CHANNELS
+
+def _print_log(msg, *args):
+    print(msg % args if args else msg)
+
+def _name(callback):
+    return getattr(callback, "__name__", None) or repr(callback)
+
+class SensorSnapshot(object):
+    """Valores de una lectura: clave de ALMemory -> float"""
+    __slots__ = ("t", "mono", "seq", "values")
+
+    def __init__(self, t, seq, values, mono=0.0):
+        self.t = t            # time.time() de la lectura
+        self.mono = mono      # mismo instante en el reloj monótono (_clock)
+        self.seq = seq        # número de lectura, 0 = aún no hay ninguna
+        self.values = values
+
+    def get(self, key, default=0.0):
+        value = self.values.get(key)
+        return default if value is None else value
+
+    def to_dict(self):
+        return {"t": self.t, "seq": self.seq,
+                "age_ms": round((time.time() - self.t) * 1000, 1) if self.seq else None,
+                "values": dict(self.values)}
+
+class SensorService(object):
+    """Hilo de adquisición: una llamada getListData por ciclo para todos"""
+
+    def __init__(self, memory, rate=20.0, keys=SENSOR_KEYS, log=_print_log):
+        self.memory = memory
+        # log(msg, *args): solo cambios de estado, no un error por ciclo
+        self.log = log
+        self.period = 1.0 / rate
+        self.keys = list(keys)
+        self.snapshot = SensorSnapshot(0.0, 0, {})
+        self.subscribers = []
+        self.running = False
+        self.thread = None
+        # contadores para getSensors
+        self.reads = 0
+        self.errors = 0
+        self.read_time = 0.0
+        self.failing = 0        # lecturas fallidas seguidas
+        self.failing_subs = {}  # índice de suscriptor -> errores seguidos
+
+    def subscribe(self, callback):
+        """callback(snapshot) en el hilo de sensores tras cada lectura"""
+        self.subscribers.append(callback)
+
+    def latest(self):
+        """Último snapshot publicado (sustituido entero en cada lectura)"""
+        return self.snapshot
+
+    def read(self):
+        """Leer todas las claves ahora y publicar el snapshot"""
+        start = _clock()
+        try:
+            data = self.memory.getListData(self.keys)
+        except Exception as e:
+            self.errors += 1
+            self.failing += 1
+            if self.failing == 1:
+                self.log("Error leyendo sensores: %s", e)
+            return None
+        self.read_time += _clock() - start
+        self.reads += 1
+        if self.failing:
+            self.log("Lectura de sensores recuperada tras %d lecturas fallidas", self.failing)
+            self.failing = 0
+        values = {}
+        for key, value in zip(self.keys, data):
+            try:
+                values[key] = float(value)
+            except (TypeError, ValueError):
+                pass
+        snapshot = SensorSnapshot(time.time(), self.snapshot.seq + 1, values, _clock())
+        self.snapshot = snapshot
+        for i, callback in enumerate(self.subscribers):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                failures = self.failing_subs.get(i, 0) + 1
+                self.failing_subs[i] = failures
+                if failures == 1:
+                    self.log("Error en suscriptor de sensores %s: %s", _name(callback), e)
+            else:
+                if i in self.failing_subs:
+                    self.log("Suscriptor de sensores %s recuperado tras %d fallos",
+                             _name(callback), self.failing_subs.pop(i))
+        return snapshot
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="sensors")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        return {"rate_hz": round(1.0 / self.period, 1),
+                "keys": len(self.keys),
+                "reads": self.reads,
+                "errors": self.errors,
+                "read_avg_ms": round(self.read_time / self.reads * 1000, 3) if self.reads else 0.0}
+
+    def _run(self):
+        deadline = time.time()
+        while self.running:
+            self.read()
+            # plazos fijos; si una lectura se retrasa se saltan los perdidos
+            deadline += self.period
+            delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > self.period:
+                deadline = time.time()
+
+class SensorHistory(object):
+    """Buffer circular de lecturas: array NumPy preasignado, una fila por lectura
+
+    Cada fila se escribe dos veces (posición i e i + capacity), así las
+    últimas n filas son siempre un tramo contiguo y window() devuelve una
+    vista sin copiar. Un solo hilo escribe con append(); una vista de n
+    filas sigue intacta durante las capacity - n escrituras siguientes.
+    """
+
+    def __init__(self, capacity=64, channels=HISTORY_CHANNELS):
+        if not NUMPY_AVAILABLE:
+            raise ImportError("SensorHistory necesita NumPy")
+        self.capacity = capacity
+        self.channels = list(channels)
+        self.index = dict((name, i) for i, name in enumerate(self.channels))
+        self.data = np.zeros((2 * capacity, len(self.channels)))
+        self.count = 0        # filas escritas desde el arranque
+        self._weights = {}    # pesos de ema() por (alpha, n)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, t, row):
+        """Añadir una lectura: t (reloj monótono) y los canales tras "t" en orden"""
+        i = self.count % self.capacity
+        self.data[i, 0] = t
+        self.data[i, 1:] = row
+        self.data[i + self.capacity] = self.data[i]
+        # publicar después de escribir: los lectores no ven filas a medias
+        self.count += 1
+
+    def window(self, n=None):
+        """Vista (n, canales) de las últimas n lecturas, la más reciente al final"""
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = (self.count - 1) % self.capacity + self.capacity + 1 if self.count else 0
+        return self.data[end - n:end]
+
+    def columns(self, channels):
+        """Índice de un canal; para varios, slice si son contiguos (vista) o lista"""
+        if isinstance(channels, str):
+            return self.index[channels]
+        cols = [self.index[name] for name in channels]
+        if cols == list(range(cols[0], cols[0] + len(cols))):
+            return slice(cols[0], cols[0] + len(cols))
+        return cols
+
+    def mean(self, channels, n=None):
+        return self.window(n)[:, self.columns(channels)].mean(axis=0)
+
+    def std(self, channels, n=None):
+        return self.window(n)[:, self.columns(channels)].std(axis=0)
+
+    def derivative(self, channels, n=2):
+        """Pendiente (último - primero) / dt sobre las últimas n lecturas; 0 si no hay dos"""
+        win = self.window(n)
+        cols = self.columns(channels)
+        if len(win) < 2 or win[-1, 0] <= win[0, 0]:
+            return np.zeros(len(self.channels))[cols]
+        return (win[-1, cols] - win[0, cols]) / (win[-1, 0] - win[0, 0])
+
+    def ema(self, channels, alpha, n=None):
+        """EMA de las últimas n lecturas, empezando por la más antigua, en un producto"""
+        win = self.window(n)
+        cols = self.columns(channels)
+        if not len(win):
+            return np.zeros(len(self.channels))[cols]
+        key = (alpha, len(win))
+        weights = self._weights.get(key)
+        if weights is None:
+            # peso alpha*(1-alpha)^k para la k-ésima más reciente; la más
+            # antigua hace de valor inicial con el resto, (1-alpha)^(n-1)
+            weights = alpha * (1.0 - alpha) ** np.arange(len(win) - 1, -1, -1)
+            weights[0] = (1.0 - alpha) ** (len(win) - 1)
+            self._weights[key] = weights
+        return weights.dot(win[:, cols])
+
+    def stats(self):
+        return {"capacity": self.capacity, "rows": len(self), "appended": self.count}
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+sws_client.py - Servidor SimpleWebSocketServer y cliente mínimo para los tests
+
+El servidor corre en el mismo hilo que el test: cada espera llama a
+serveonce() hasta que se cumple la condición, así los tests deciden cómo
+llegan los bytes (troceados, juntos) y cuándo se vacía la cola de envío.
+"""
+
+import base64
+import errno
+import os
+import random
+import socket
+import struct
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path = os.path.join(ROOT, "NaoControlInstaller", "payload", "SimpleWebSocketServer-0.1.2")
+if path not in sys.path:
+    sys.path.insert(0, path)
+
+import SimpleWebSocketServer
+sws = sys.modules["SimpleWebSocketServer.SimpleWebSocketServer"]
+
+TEXT, BINARY, CLOSE, PING, PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+CONTINUATION = 0x0
+RSV1 = 0x40
+
+def frame(payload, opcode=TEXT, fin=True, rsv=0):
+    """Frame cliente -> servidor, enmascarado como exige RFC 6455"""
+    payload = bytearray(payload)
+    out = bytearray([(0x80 if fin else 0) | rsv | opcode])
+    length = len(payload)
+    if length <= 125:
+        out.append(0x80 | length)
+    elif length <= 0xFFFF:
+        out.append(0x80 | 126)
+        out.extend(struct.pack("!H", length))
+    else:
+        out.append(0x80 | 127)
+        out.extend(struct.pack("!Q", length))
+    mask = bytearray(random.getrandbits(8) for _ in range(4))
+    out.extend(mask)
+    out.extend(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return bytes(out)
+
+class Recorder(sws.WebSocket):
+    """Guarda cada mensaje recibido como (TEXT o BINARY, datos)"""
+
+    def handleConnected(self):
+        self.received = []
+
+    def handleMessage(self):
+        # el último fragmento de un mensaje llega con opcode 0: se mira el tipo
+        data = self.data
+        if sws._check_unicode(data):
+            self.received.append((TEXT, data))
+        else:
+            self.received.append((BINARY, bytes(data)))
+
+class Loop(object):
+
+    def __init__(self, websocketclass=Recorder, **kwargs):
+        self.server = sws.SimpleWebSocketServer("127.0.0.1", 0, websocketclass,
+                                                selectInterval=0.005, **kwargs)
+        self.port = self.server.serversocket.getsockname()[1]
+
+    def close(self):
+        self.server.close()
+
+    def serve_until(self, done, timeout=5.0):
+        deadline = time.time() + timeout
+        while not done():
+            if time.time() > deadline:
+                raise AssertionError("timeout esperando al servidor")
+            self.server.serveonce()
+
+    def connect(self, extensions=None):
+        return Client(self, extensions)
+
+class Client(object):
+
+    def __init__(self, loop, extensions=None):
+        self.loop = loop
+        self.sock = socket.create_connection(("127.0.0.1", loop.port))
+        self.sock.setblocking(0)
+        self.buffer = bytearray()
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        request = ("GET / HTTP/1.1\r\nHost: nao\r\nUpgrade: websocket\r\n"
+                   "Connection: Upgrade\r\nSec-WebSocket-Key: %s\r\n"
+                   "Sec-WebSocket-Version: 13\r\n" % key)
+        if extensions:
+            request += "Sec-WebSocket-Extensions: %s\r\n" % extensions
+        self.send((request + "\r\n").encode("ascii"))
+        self.loop.serve_until(lambda: self._read() and b"\r\n\r\n" in self.buffer)
+        end = self.buffer.index(b"\r\n\r\n")
+        self.response = bytes(self.buffer[:end]).decode("latin-1")
+        del self.buffer[:end + 4]
+        # el objeto WebSocket del servidor para esta conexión
+        self.ws = [ws for ws in loop.server.connections.values() if ws.handshaked][-1]
+
+    def close(self):
+        self.sock.close()
+
+    def _read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+            return True
+        if not data:
+            raise EOFError("el servidor cerró la conexión")
+        self.buffer.extend(data)
+        return True
+
+    def send(self, data):
+        """Enviar data entera, atendiendo al servidor si el socket se llena"""
+        view = memoryview(data)
+        while len(view):
+            try:
+                view = view[self.sock.send(view):]
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                self.loop.server.serveonce()
+
+    def send_chunks(self, data, sizes):
+        """Enviar data en trozos de los tamaños dados (cíclicos), con una
+        vuelta del servidor entre trozo y trozo"""
+        pos = i = 0
+        while pos < len(data):
+            size = sizes[i % len(sizes)]
+            self.send(data[pos:pos + size])
+            self.loop.server.serveonce()
+            pos += size
+            i += 1
+
+    def wait_messages(self, n):
+        self.loop.serve_until(lambda: len(self.ws.received) >= n)
+        return self.ws.received
+
+    def _frame(self):
+        buf = self.buffer
+        if len(buf) < 2:
+            return None
+        length = buf[1] & 0x7F
+        pos = 2
+        if length == 126:
+            if len(buf) < 4:
+                return None
+            length = struct.unpack("!H", bytes(buf[2:4]))[0]
+            pos = 4
+        elif length == 127:
+            if len(buf) < 10:
+                return None
+            length = struct.unpack("!Q", bytes(buf[2:10]))[0]
+            pos = 10
+        if len(buf) < pos + length:
+            return None
+        head = buf[0]
+        payload = bytes(buf[pos:pos + length])
+        del buf[:pos + length]
+        return bool(head & 0x80), head & 0x70, head & 0x0F, payload
+
+    def frames(self, n):
+        """Los n siguientes frames del servidor como (fin, rsv, opcode, payload)"""
+        out = []
+
+        def done():
+            while len(out) < n:
+                item = self._frame()
+                if item is None:
+                    self._read()
+                    return False
+                out.append(item)
+            return True
+        self.loop.serve_until(done)
+        return out
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+test_adaptive_loop.py - Bucle adaptativo de control_server.py con y sin historial
+
+Sin NumPy solo se prueba la variante de filtros escalares.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, "benchmarks", "naoqi_stub"),
+             os.path.join(ROOT, "NaoControlInstaller", "payload", "SimpleWebSocketServer-0.1.2"),
+             os.path.join(ROOT, "robot_scripts")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+os.environ.setdefault("NAOQI_STUB_LATENCY", "0")
+
+import control_server as cs
+from sensors import SensorSnapshot, SensorHistory, FSR_KEYS, IMU_KEYS, NUMPY_AVAILABLE
+
+ANGLE_X = IMU_KEYS[6]
+
+def snapshot(k, pitch=0.0, toe=None, wall_shift=0.0):
+    values = dict((key, 0.6) for key in FSR_KEYS)
+    values[IMU_KEYS[2]] = -9.81
+    values[ANGLE_X] = pitch
+    if toe is not None:
+        # peso en la punta del pie izquierdo
+        values[FSR_KEYS[0]] = values[FSR_KEYS[1]] = toe
+    return SensorSnapshot(100.0 + k * 0.05 + wall_shift, k + 1, values, k * 0.05)
+
+class AdaptiveLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.adaptive = dict(cs.ADAPTIVE)
+        cs.ADAPTIVE.update(enabled=True, mode="auto", slip=False, last_event=0.0)
+
+    def tearDown(self):
+        cs.ADAPTIVE.clear()
+        cs.ADAPTIVE.update(self.adaptive)
+
+    def run_steps(self, history, snaps):
+        steps = cs.adaptive_steps(history)
+        next(steps)
+        for snap in snaps:
+            steps.send(snap)
+
+    def check_caps_and_gait(self, history):
+        self.run_steps(history, [snapshot(k) for k in range(10)])
+        self.assertEqual(cs.CAPS_APPLIED, cs.CAPS_NORMAL_REF)
+        # peso en la punta: inclinación atrás y paso más alto
+        self.run_steps(history, [snapshot(k, toe=6.0) for k in range(10, 20)])
+        gait = cs.pairs_to_dict(cs.GAIT_REF)
+        self.assertEqual(gait["TorsoWx"], -0.015)
+        self.assertEqual(gait["StepHeight"], 0.036)
+
+    def test_scalar_filters_without_history(self):
+        self.check_caps_and_gait(None)
+
+    def test_scalar_filters_ignore_wall_clock_jump(self):
+        # la hora atrasa una hora a mitad: el CoP y el EMA usan el reloj monótono
+        results = []
+        for shift in (0.0, -3600.0):
+            cs.ADAPTIVE.update(slip=False, last_event=0.0)
+            self.run_steps(None, [snapshot(k, pitch=0.3 if k > 5 else 0.0,
+                                           toe=6.0 if k > 20 else None,
+                                           wall_shift=shift if k > 10 else 0.0)
+                                  for k in range(40)])
+            results.append((cs.ADAPTIVE["slip"], cs.pairs_to_dict(cs.GAIT_REF)))
+        self.assertEqual(results[0], results[1])
+
+    @unittest.skipUnless(NUMPY_AVAILABLE, "NumPy no disponible")
+    def test_with_history(self):
+        history = SensorHistory(16)
+        self.check_caps_and_gait(history)
+        self.assertEqual(len(history), 16)
+
+    @unittest.skipUnless(NUMPY_AVAILABLE, "NumPy no disponible")
+    def test_history_matches_scalar_filters(self):
+        # misma señal por los dos caminos: EMA de pitch y slip iguales
+        snaps = [snapshot(k, pitch=0.3 if k > 5 else 0.0) for k in range(40)]
+        results = []
+        for history in (None, SensorHistory(64)):
+            cs.ADAPTIVE.update(slip=False, last_event=0.0)
+            self.run_steps(history, snaps)
+            results.append((cs.ADAPTIVE["slip"], cs.pairs_to_dict(cs.GAIT_REF)))
+        self.assertEqual(results[0], results[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+test_motion_loop.py - Paradas del hilo de movimiento de control_server.py
+
+Usa el NAOqi simulado de benchmarks/naoqi_stub y sustituye el proxy de
+ALMotion por uno que registra las llamadas y puede fallar a demanda.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, "benchmarks", "naoqi_stub"),
+             os.path.join(ROOT, "NaoControlInstaller", "payload", "SimpleWebSocketServer-0.1.2"),
+             os.path.join(ROOT, "robot_scripts")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+os.environ.setdefault("NAOQI_STUB_LATENCY", "0")
+
+import json
+
+import control_server as cs
+
+class FakeMotion(object):
+    def __init__(self):
+        self.calls = []
+        self.fail_move = False
+
+    def moveToward(self, *args):
+        self.calls.append("moveToward")
+        if self.fail_move:
+            raise RuntimeError("ALMotion no responde")
+
+    def stopMove(self):
+        self.calls.append("stopMove")
+
+class FakeBehavior(object):
+    """ALBehaviorManager con el kick instalado y runBehavior que falla"""
+    def isBehaviorInstalled(self, name):
+        return True
+
+    def getRunningBehaviors(self):
+        return []
+
+    def runBehavior(self, name):
+        raise RuntimeError("behavior %s no arranca" % name)
+
+class FakeWS(object):
+    def __init__(self):
+        self.replies = []
+
+    def sendMessage(self, data, key=None):
+        self.replies.append(json.loads(data))
+
+_mover = []
+
+class MotionLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.motion = FakeMotion()
+        cs.motion = self.motion
+        cs.ADAPTIVE_WALK_ENABLED = False
+        if not _mover:
+            _mover.append(threading.Thread(target=cs.motion_loop))
+            _mover[0].daemon = True
+            _mover[0].start()
+        # punto de partida conocido: parado
+        cs.walk_mailbox.post_stop()
+        self.wait_idle()
+        del self.motion.calls[:]
+
+    def wait_idle(self, timeout=2.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with cs.walk_mailbox.cond:
+                if not cs.walk_mailbox.queue:
+                    break
+            time.sleep(0.01)
+        # el hilo ya sacó el comando; margen para ejecutarlo y dormir el periodo
+        time.sleep(2.5 / cs.MOTION_HZ)
+
+    def test_stop_after_failed_moveToward(self):
+        self.motion.fail_move = True
+        cs.walk_mailbox.post(0.5, 0.0, 0.0)
+        self.wait_idle()
+        cs.walk_mailbox.post_stop()
+        self.wait_idle()
+        self.assertEqual(self.motion.calls[-1], "stopMove")
+
+    def test_stop_after_walk(self):
+        cs.walk_mailbox.post(0.5, 0.0, 0.0)
+        self.wait_idle()
+        cs.walk_mailbox.post_stop()
+        self.wait_idle()
+        cs.walk_mailbox.post_stop()
+        self.wait_idle()
+        self.assertEqual(self.motion.calls, ["moveToward", "stopMove"])
+
+    def test_stop_after_zero_velocity(self):
+        cs.walk_mailbox.post(0.5, 0.0, 0.0)
+        self.wait_idle()
+        cs.walk_mailbox.post(0.0, 0.0, 0.0)
+        self.wait_idle()
+        cs.walk_mailbox.post_stop()
+        self.wait_idle()
+        self.assertEqual(self.motion.calls, ["moveToward", "moveToward"])
+
+    def expire_watchdog(self):
+        cs._last_walk = time.time() - cs.WATCHDOG - 1.0
+        cs.watchdog_tick()
+        self.wait_idle()
+
+    def test_idle_watchdog_avoids_nothing(self):
+        before = cs.walk_mailbox.metrics()
+        for _ in range(5):
+            self.expire_watchdog()
+        after = cs.walk_mailbox.metrics()
+        self.assertEqual(after["rpcs_avoided"], before["rpcs_avoided"])
+        self.assertEqual(after["rpcs"], before["rpcs"])
+        self.assertEqual(self.motion.calls, [])
+
+    def test_watchdog_stops_walk_once(self):
+        cs.on_walk(None, 0.5, 0.0, 0.0)
+        self.wait_idle()
+        for _ in range(3):
+            self.expire_watchdog()
+        self.assertEqual(self.motion.calls, ["moveToward", "stopMove"])
+
+    def test_failed_call_replies_failed(self):
+        cs.behavior = FakeBehavior()
+        ws = FakeWS()
+        cs.walk_mailbox.post(0.5, 0.0, 0.0)
+        self.wait_idle()
+        cs.walk_mailbox.submit(cs.NaoqiCall(ws, cs.ACTIONS["kick"], {}, 7, 0.0))
+        self.wait_idle()
+        self.assertEqual(ws.replies[0]["accepted"], "kick")
+        self.assertEqual(ws.replies[-1]["failed"], "kick")
+        self.assertEqual(ws.replies[-1]["id"], 7)
+        # tras la llamada fallida el robot puede seguir andando: el watchdog para
+        cs.walk_mailbox.post_stop()
+        self.wait_idle()
+        self.assertEqual(self.motion.calls, ["moveToward", "stopMove"])
+
+if __name__ == "__main__":
+    unittest.main()
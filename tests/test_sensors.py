@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+test_sensors.py - SensorService (errores, reloj monótono) y estadísticas de SensorHistory
+
+Las de SensorHistory se comparan con bucles en Python y necesitan NumPy.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path = os.path.join(ROOT, "robot_scripts")
+if path not in sys.path:
+    sys.path.insert(0, path)
+
+import sensors
+from sensors import (SensorService, SensorHistory, SENSOR_KEYS, MONOTONIC_CLOCK,
+                     NUMPY_AVAILABLE)
+
+class FakeMemory(object):
+    def __init__(self):
+        self.fail = False
+
+    def getListData(self, keys):
+        if self.fail:
+            raise RuntimeError("ALMemory no responde")
+        return [0.5] * len(keys)
+
+class SensorServiceErrorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = []
+        self.memory = FakeMemory()
+        self.sensors = SensorService(self.memory,
+                                     log=lambda msg, *args: self.lines.append(msg % args))
+
+    def test_read_errors_logged_on_change(self):
+        self.memory.fail = True
+        for _ in range(20):
+            self.assertIsNone(self.sensors.read())
+        self.memory.fail = False
+        self.assertEqual(self.sensors.read().get(SENSOR_KEYS[0]), 0.5)
+        self.assertEqual(self.sensors.errors, 20)
+        self.assertEqual(self.lines, [
+            "Error leyendo sensores: ALMemory no responde",
+            "Lectura de sensores recuperada tras 20 lecturas fallidas"])
+
+    def test_subscriber_errors_logged_on_change(self):
+        state = {"fail": True}
+        def on_snapshot(snapshot):
+            if state["fail"]:
+                raise ValueError("sin datos")
+        self.sensors.subscribe(on_snapshot)
+        for _ in range(5):
+            self.sensors.read()
+        state["fail"] = False
+        self.sensors.read()
+        self.sensors.read()
+        self.assertEqual(self.lines, [
+            "Error en suscriptor de sensores on_snapshot: sin datos",
+            "Suscriptor de sensores on_snapshot recuperado tras 5 fallos"])
+
+class SensorClockTest(unittest.TestCase):
+
+    def test_mono_ignores_wall_clock_jump(self):
+        self.assertTrue(MONOTONIC_CLOCK)
+        service = SensorService(FakeMemory(), log=lambda msg, *args: None)
+        first = service.read()
+        wall = sensors.time.time
+        # NTP o un cambio manual atrasan la hora una hora
+        sensors.time.time = lambda: wall() - 3600.0
+        try:
+            second = service.read()
+        finally:
+            sensors.time.time = wall
+        self.assertLess(second.t, first.t)
+        self.assertGreater(second.mono, first.mono)
+
+def ema(values, alpha):
+    filt = values[0]
+    for x in values[1:]:
+        filt = alpha * x + (1.0 - alpha) * filt
+    return filt
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "NumPy no disponible")
+class SensorHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history = SensorHistory(8, channels=["t", "a", "b", "c"])
+        self.rows = []
+        # 11 lecturas: el buffer de 8 ya ha dado la vuelta
+        for k in range(11):
+            row = [k * 0.5, (k * 7) % 5 - 1.0, 2.0 * k]
+            self.rows.append((k * 0.05, row))
+            self.history.append(k * 0.05, row)
+
+    def column(self, i, n):
+        return [row[i] for t, row in self.rows[-n:]]
+
+    def test_window_after_wrap(self):
+        self.assertEqual(len(self.history), 8)
+        win = self.history.window(3)
+        self.assertEqual(win.tolist(), [[t] + row for t, row in self.rows[-3:]])
+
+    def test_mean_and_std(self):
+        values = self.column(1, 6)
+        mean = sum(values) / len(values)
+        std = (sum((x - mean) ** 2 for x in values) / len(values)) ** 0.5
+        self.assertAlmostEqual(self.history.mean("b", 6), mean)
+        self.assertAlmostEqual(self.history.std("b", 6), std)
+        # canales contiguos y sueltos dan lo mismo que uno a uno
+        both = self.history.mean(("a", "c"), 6)
+        self.assertAlmostEqual(both[0], sum(self.column(0, 6)) / 6)
+        self.assertAlmostEqual(both[1], sum(self.column(2, 6)) / 6)
+
+    def test_derivative(self):
+        slope = self.history.derivative(("a", "b"), 4)
+        (t0, first), (t1, last) = self.rows[-4], self.rows[-1]
+        self.assertAlmostEqual(slope[0], (last[0] - first[0]) / (t1 - t0))
+        self.assertAlmostEqual(slope[1], (last[1] - first[1]) / (t1 - t0))
+
+    def test_derivative_needs_time_to_advance(self):
+        self.history.append(self.rows[-1][0], [9.0, 9.0, 9.0])
+        self.assertEqual(self.history.derivative("a", 2), 0.0)
+
+    def test_ema(self):
+        for n in (1, 5, 8):
+            self.assertAlmostEqual(self.history.ema("b", 0.3, n), ema(self.column(1, n), 0.3))
+
+if __name__ == "__main__":
+    unittest.main()
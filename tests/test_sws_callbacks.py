@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+test_sws_callbacks.py - Callbacks del bucle de SimpleWebSocketServer que fallan
+
+call_every, los temporizadores de la rueda y los lectores de add_reader
+siguen funcionando y dejan la traza en stderr en vez de morir en silencio.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import socket
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path = os.path.join(ROOT, "NaoControlInstaller", "payload", "SimpleWebSocketServer-0.1.2")
+if path not in sys.path:
+    sys.path.insert(0, path)
+
+import SimpleWebSocketServer
+sws = sys.modules["SimpleWebSocketServer.SimpleWebSocketServer"]
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+class CallbackErrorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = sws.SimpleWebSocketServer("127.0.0.1", 0, sws.WebSocket,
+                                                selectInterval=0.01)
+        self.calls = []
+        self.stderr, sys.stderr = sys.stderr, StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        self.server.close()
+
+    def failing(self, *args):
+        self.calls.append(args)
+        raise RuntimeError("fallo %d" % len(self.calls))
+
+    def serve(self, turns=20):
+        for _ in range(turns):
+            self.server.serveonce()
+
+    def test_call_every_keeps_running_and_reports(self):
+        self.server.call_every(0.001, self.failing)
+        while len(self.calls) < 3:
+            self.serve(1)
+        output = sys.stderr.getvalue()
+        self.assertIn("RuntimeError: fallo 1", output)
+        self.assertIn("RuntimeError: fallo 3", output)
+
+    def test_timer_wheel_reports(self):
+        wheel = self.server.wheel
+        now = sws._monotonic()
+        wheel.schedule(now, 0.0, self.failing, "rueda")
+        wheel.advance(now + 2 * wheel.tick)
+        self.assertEqual(self.calls, [("rueda",)])
+        self.assertIn("RuntimeError: fallo 1", sys.stderr.getvalue())
+
+    def test_reader_reports(self):
+        a, b = socket.socketpair()
+        try:
+            self.server.add_reader(a.fileno(), self.failing, "lector")
+            b.send(b"x")
+            while not self.calls:
+                self.serve(1)
+            self.assertIn("RuntimeError: fallo 1", sys.stderr.getvalue())
+        finally:
+            self.server.remove_reader(a.fileno())
+            a.close()
+            b.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+test_sws_deflate.py - permessage-deflate (RFC 7692) de SimpleWebSocketServer
+
+El cliente comprime e infla con zlib como un navegador: deflate crudo,
+Z_SYNC_FLUSH y sin los cuatro bytes 00 00 ff ff del final.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import unittest
+import zlib
+
+from sws_client import Loop, Recorder, sws, frame, TEXT, BINARY, CONTINUATION, RSV1
+
+TAIL = b"\x00\x00\xff\xff"
+JSON = u'{"action":"walk","vx":0.42,"vy":-0.17,"wz":0.05,"nota":"¡ñandú!"}'
+
+class Echo(Recorder):
+
+    def handleMessage(self):
+        Recorder.handleMessage(self)
+        self.sendMessage(self.data)
+
+class DeflateTest(unittest.TestCase):
+
+    def start(self, offer="permessage-deflate", **options):
+        self.loop = Loop(Echo, deflate=sws.DeflateOptions(**options))
+        self.client = self.loop.connect(offer)
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        self.decompressor = zlib.decompressobj(-15)
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def extensions(self):
+        for line in self.client.response.split("\r\n"):
+            name, _, value = line.partition(":")
+            if name.lower() == "sec-websocket-extensions":
+                return value.strip()
+        return None
+
+    def compress(self, data):
+        out = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.assertTrue(out.endswith(TAIL))
+        return out[:-4]
+
+    def inflate(self, payload, reset=False):
+        if reset:
+            self.decompressor = zlib.decompressobj(-15)
+        return self.decompressor.decompress(payload + TAIL)
+
+    def reply(self):
+        fin, rsv, opcode, payload = self.client.frames(1)[0]
+        self.assertTrue(fin)
+        return rsv, opcode, payload
+
+    def test_round_trip_with_context_takeover(self):
+        self.start()
+        self.assertEqual(self.extensions(), "permessage-deflate")
+        sizes = []
+        for i in range(5):
+            raw = JSON.encode("utf-8")
+            self.client.send(frame(self.compress(raw), TEXT, rsv=RSV1))
+            rsv, opcode, payload = self.reply()
+            self.assertEqual((rsv, opcode), (RSV1, TEXT))
+            self.assertEqual(self.inflate(payload), raw)
+            sizes.append(len(payload))
+        self.assertEqual([text for kind, text in self.client.ws.received], [JSON] * 5)
+        # con la ventana compartida los repetidos salen mucho más pequeños
+        self.assertLess(sizes[-1], sizes[0] // 2)
+
+    def test_binary_and_fragmented_compressed_message(self):
+        self.start()
+        raw = os.urandom(1000) * 80
+        wire = self.compress(raw)
+        third = len(wire) // 3
+        self.client.send_chunks(frame(wire[:third], BINARY, fin=False, rsv=RSV1) +
+                                frame(wire[third:2 * third], CONTINUATION, fin=False) +
+                                frame(wire[2 * third:], CONTINUATION), [4096, 7])
+        self.assertEqual(self.client.wait_messages(1), [(BINARY, raw)])
+        rsv, opcode, payload = self.reply()
+        self.assertEqual((rsv, opcode), (RSV1, BINARY))
+        self.assertEqual(self.inflate(payload), raw)
+
+    def test_uncompressed_frames_still_accepted(self):
+        self.start()
+        self.client.send(frame(JSON.encode("utf-8")))
+        self.assertEqual(self.client.wait_messages(1), [(TEXT, JSON)])
+
+    def test_short_replies_not_compressed(self):
+        self.start(min_size=100)
+        self.client.send(frame(self.compress(b"ok"), TEXT, rsv=RSV1))
+        rsv, opcode, payload = self.reply()
+        self.assertEqual((rsv, opcode, payload), (0, TEXT, b"ok"))
+
+    def test_no_context_takeover(self):
+        self.start("permessage-deflate; server_no_context_takeover; "
+                   "client_no_context_takeover; client_max_window_bits")
+        self.assertEqual(self.extensions(), "permessage-deflate; server_no_context_takeover; "
+                                            "client_no_context_takeover")
+        raw = JSON.encode("utf-8")
+        payloads = []
+        for i in range(3):
+            # el cliente también empieza de cero cada mensaje
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            self.client.send(frame(self.compress(raw), TEXT, rsv=RSV1))
+            rsv, opcode, payload = self.reply()
+            # cada respuesta se infla sola, sin el historial de las anteriores
+            self.assertEqual(self.inflate(payload, reset=True), raw)
+            payloads.append(payload)
+        self.assertEqual(payloads[0], payloads[2])
+
+    def test_server_window_bits(self):
+        self.start("permessage-deflate; server_max_window_bits=10")
+        self.assertEqual(self.extensions(), "permessage-deflate; server_max_window_bits=10")
+        raw = (JSON * 40).encode("utf-8")
+        self.client.send(frame(self.compress(raw), TEXT, rsv=RSV1))
+        rsv, opcode, payload = self.reply()
+        self.decompressor = zlib.decompressobj(-10)
+        self.assertEqual(self.inflate(payload), raw)
+
+    def test_offer_without_deflate_support(self):
+        self.start("x-webkit-deflate-frame")
+        self.assertIsNone(self.extensions())
+        self.client.send(frame(JSON.encode("utf-8")))
+        rsv, opcode, payload = self.reply()
+        self.assertEqual((rsv, payload), (0, JSON.encode("utf-8")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+test_sws_frames.py - Parser de frames de SimpleWebSocketServer
+
+Frames que llegan juntos en una lectura, partidos en cualquier byte
+(cabecera, longitud extendida, máscara, payload) y mensajes fragmentados
+con frames de control intercalados.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import unittest
+
+from sws_client import Loop, frame, TEXT, BINARY, CONTINUATION, PING, PONG
+
+HOLA = u"¡hola, NAO! ñandú"
+
+class FrameParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = Loop()
+        self.client = self.loop.connect()
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def test_many_frames_in_one_read(self):
+        self.client.send(b"".join(frame(("m%d" % i).encode("ascii")) for i in range(200)))
+        received = self.client.wait_messages(200)
+        self.assertEqual([text for opcode, text in received],
+                         [u"m%d" % i for i in range(200)])
+
+    def test_split_at_every_byte_of_the_header(self):
+        # longitud de 7 bits, de 16 y de 64: cabeceras de 6, 8 y 14 bytes
+        payloads = [b"x" * 100, b"y" * 1000, os.urandom(70000)]
+        for payload in payloads:
+            data = frame(payload, BINARY)
+            for cut in range(1, 16):
+                self.client.send(data[:cut])
+                self.loop.server.serveonce()
+                self.client.send(data[cut:])
+        received = self.client.wait_messages(3 * 15)
+        self.assertEqual(received, [(BINARY, payload) for payload in payloads for _ in range(15)])
+
+    def test_stream_in_small_chunks(self):
+        messages = [os.urandom(n) for n in (0, 1, 125, 126, 127, 300, 65535, 65536, 100000)]
+        data = b"".join(frame(m, BINARY) for m in messages)
+        self.client.send_chunks(data, [1, 7, 3, 1000, 2, 65536, 13])
+        self.assertEqual(self.client.wait_messages(len(messages)),
+                         [(BINARY, m) for m in messages])
+
+    def test_fragmented_text_with_ping_in_between(self):
+        # la ñ y la ú quedan partidas entre fragmentos
+        raw = HOLA.encode("utf-8")
+        cut1, cut2 = raw.index(u"ñ".encode("utf-8")) + 1, len(raw) - 1
+        data = (frame(raw[:cut1], TEXT, fin=False) +
+                frame(b"latido", PING) +
+                frame(raw[cut1:cut2], CONTINUATION, fin=False) +
+                frame(raw[cut2:], CONTINUATION))
+        self.client.send_chunks(data, [3])
+        self.assertEqual(self.client.wait_messages(1), [(TEXT, HOLA)])
+        fin, rsv, opcode, payload = self.client.frames(1)[0]
+        self.assertEqual((opcode, payload), (PONG, b"latido"))
+
+    def test_fragmented_binary_over_reads(self):
+        parts = [os.urandom(n) for n in (10, 70000, 1, 5000)]
+        data = frame(parts[0], BINARY, fin=False)
+        data += b"".join(frame(p, CONTINUATION, fin=False) for p in parts[1:-1])
+        data += frame(parts[-1], CONTINUATION)
+        data += frame(b"siguiente")
+        self.client.send_chunks(data, [4096, 5, 17])
+        self.assertEqual(self.client.wait_messages(2),
+                         [(BINARY, b"".join(parts)), (TEXT, u"siguiente")])
+
+    def test_counters(self):
+        self.client.send_chunks(b"".join(frame(b"abc") for _ in range(10)), [5])
+        self.client.wait_messages(10)
+        self.assertEqual(self.client.ws.framesin, 10)
+
+if __name__ == "__main__":
+    unittest.main()
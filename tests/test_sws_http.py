@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+test_sws_http.py - Ficheros estáticos del webroot de SimpleWebSocketServer
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path = os.path.join(ROOT, "NaoControlInstaller", "payload", "SimpleWebSocketServer-0.1.2")
+if path not in sys.path:
+    sys.path.insert(0, path)
+
+import SimpleWebSocketServer
+sws = sys.modules["SimpleWebSocketServer.SimpleWebSocketServer"]
+
+class ShortIdle(sws.WebSocket):
+    httpidletimeout = 0.3
+
+class StaticTest(unittest.TestCase):
+
+    def setUp(self):
+        self.webroot = tempfile.mkdtemp()
+        with open(os.path.join(self.webroot, "index.html"), "wb") as f:
+            f.write(b"<html>nao</html>")
+        self.server = sws.SimpleWebSocketServer("127.0.0.1", 0, ShortIdle,
+                                                selectInterval=0.01, webroot=self.webroot)
+        self.port = self.server.serversocket.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.webroot)
+
+    def serve_until(self, done, timeout=3.0):
+        deadline = time.time() + timeout
+        while not done() and time.time() < deadline:
+            self.server.serveonce()
+        return done()
+
+    def get(self, sock, path="/"):
+        sock.sendall(("GET %s HTTP/1.1\r\nHost: nao\r\n\r\n" % path).encode("ascii"))
+        data = bytearray()
+
+        def received():
+            try:
+                data.extend(sock.recv(65536))
+            except socket.error:
+                pass
+            return data.endswith(b"</html>")
+        self.serve_until(received)
+        return bytes(data)
+
+    def test_keepalive_connection_closed_when_idle(self):
+        sock = socket.create_connection(("127.0.0.1", self.port))
+        sock.setblocking(0)
+        try:
+            response = self.get(sock)
+            self.assertTrue(response.startswith(b"HTTP/1.1 200"))
+            self.assertTrue(response.endswith(b"<html>nao</html>"))
+            # la conexión sigue abierta para la siguiente petición...
+            self.assertEqual(len(self.server.connections), 1)
+            self.assertIn(b"200", self.get(sock))
+            # ...pero no para siempre
+            self.assertTrue(self.serve_until(lambda: not self.server.connections))
+        finally:
+            sock.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+test_sws_send.py - Escritura de la cola de SimpleWebSocketServer
+
+Todos los frames pendientes salen en una escritura scatter-gather; un
+frame escrito a medias sigue desde su offset en la siguiente.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import os
+import socket
+import unittest
+
+from sws_client import Loop, TEXT, BINARY
+
+class SendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = Loop()
+        self.client = self.loop.connect()
+        self.ws = self.client.ws
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def test_partial_writes_keep_frames_whole_and_in_order(self):
+        self.ws.client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        messages = [os.urandom(n) for n in (10, 70000, 0, 125, 126, 65536, 3000)] * 5
+        # la respuesta del handshake ya salió por la misma cola
+        framesout = self.ws.framesout
+        for message in messages:
+            self.ws.sendMessage(bytearray(message))
+        self.ws.sendMessage(u"fin")
+        frames = self.client.frames(len(messages) + 1)
+        self.assertEqual([(opcode, payload) for fin, rsv, opcode, payload in frames],
+                         [(BINARY, m) for m in messages] + [(TEXT, b"fin")])
+        self.assertGreater(self.ws.partialwrites, 0)
+        self.assertEqual(self.ws.framesout - framesout, len(messages) + 1)
+        self.assertFalse(self.ws.sendq)
+        self.assertEqual(self.ws.sendqbytes, 0)
+
+    def test_queue_coalesced_into_few_writes(self):
+        for i in range(100):
+            self.ws.sendMessage(u"m%d" % i)
+        # una vuelta del bucle: un solo sendmsg/send para los 100 frames
+        self.loop.server.serveonce()
+        self.assertFalse(self.ws.sendq)
+        frames = self.client.frames(100)
+        self.assertEqual([payload for fin, rsv, opcode, payload in frames],
+                         [("m%d" % i).encode("ascii") for i in range(100)])
+
+if __name__ == "__main__":
+    unittest.main()
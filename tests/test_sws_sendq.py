@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+test_sws_sendq.py - Políticas de la cola de envío acotada de SimpleWebSocketServer
+
+Los mensajes se encolan desde el test sin dar vueltas al servidor, así la
+cola no se vacía hasta que el test lo decide.
+
+Uso:
+    python2 -m unittest discover tests
+    python3 -m pytest tests
+"""
+
+import socket
+import unittest
+
+from sws_client import Loop, Recorder, sws, frame, TEXT, PING
+
+class DropOldest(Recorder):
+    sendqmaxframes = 3
+    sendqpolicy = sws.QUEUE_DROP_OLDEST
+
+class Conflate(Recorder):
+    sendqpolicy = sws.QUEUE_CONFLATE
+
+class Block(Recorder):
+    sendqmaxframes = 3
+
+class BigReplies(Recorder):
+    sendqmaxframes = 3
+
+    def handleMessage(self):
+        Recorder.handleMessage(self)
+        self.sendMessage(u"z" * 50000)
+
+class SendQueueTest(unittest.TestCase):
+
+    def connect(self, websocketclass):
+        self.loop = Loop(websocketclass)
+        self.client = self.loop.connect()
+        return self.client.ws
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def texts(self, n):
+        return [(opcode, payload.decode("utf-8"))
+                for fin, rsv, opcode, payload in self.client.frames(n)]
+
+    def test_drop_oldest_keeps_newest(self):
+        ws = self.connect(DropOldest)
+        for i in range(10):
+            ws.sendMessage(u"m%d" % i)
+        self.assertEqual(len(ws.sendq), 3)
+        self.assertEqual(ws.sendqdropped, 7)
+        self.assertEqual(self.texts(3), [(TEXT, u"m7"), (TEXT, u"m8"), (TEXT, u"m9")])
+
+    def test_drop_oldest_never_drops_control_frames(self):
+        ws = self.connect(DropOldest)
+        ws.sendMessage(u"a")
+        ws._sendMessage(False, PING, b"")
+        for i in range(5):
+            ws.sendMessage(u"b%d" % i)
+        self.assertEqual(self.texts(3), [(PING, u""), (TEXT, u"b3"), (TEXT, u"b4")])
+
+    def test_conflate_replaces_queued_message_with_same_key(self):
+        ws = self.connect(Conflate)
+        ws.sendMessage(u"pos 1", key="pos")
+        ws.sendMessage(u"bateria", key="battery")
+        ws.sendMessage(u"pos 2", key="pos")
+        ws.sendMessage(u"sin clave")
+        ws.sendMessage(u"pos 3", key="pos")
+        self.assertEqual(ws.sendqconflated, 2)
+        # el último ocupa el sitio del primero: el orden entre claves se mantiene
+        self.assertEqual(self.texts(3), [(TEXT, u"pos 3"), (TEXT, u"bateria"),
+                                         (TEXT, u"sin clave")])
+        # ya enviado, el siguiente con la misma clave se encola sin más
+        ws.sendMessage(u"pos 4", key="pos")
+        self.assertEqual(self.texts(1), [(TEXT, u"pos 4")])
+
+    def test_block_pauses_reading_until_drained(self):
+        ws = self.connect(Block)
+        for i in range(5):
+            ws.sendMessage(u"m%d" % i)
+        self.assertTrue(ws.readpaused)
+        self.assertEqual(ws.sendqdropped, 0)
+        self.assertEqual(len(self.texts(5)), 5)
+        self.loop.serve_until(lambda: not ws.readpaused)
+        # y vuelve a leer
+        self.client.send(frame(b"hola"))
+        self.assertEqual(self.client.wait_messages(1), [(TEXT, u"hola")])
+
+    @unittest.skipUnless(hasattr(socket, "SO_SNDBUF") and hasattr(sws.select, "epoll"),
+                         "sin epoll")
+    def test_block_stops_edge_triggered_reads(self):
+        self.loop = Loop(BigReplies, poller=sws.EpollPoller())
+        self.client = self.loop.connect()
+        ws = self.client.ws
+        ws.client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        # el cliente escribe de golpe todo lo que cabe y no lee las respuestas
+        data = b"".join(frame(b"x" * 1000) for _ in range(2000))
+        handshake = ws.bytesin
+        self.client.sock.setblocking(1)
+        self.client.sock.settimeout(0.5)
+        try:
+            self.client.sock.sendall(data)
+        except socket.timeout:
+            pass
+        for _ in range(20):
+            self.loop.server.serveonce()
+        # parado tras la lectura en la que se llenó la cola, no al vaciar el socket
+        self.assertTrue(ws.readpaused)
+        self.assertLessEqual(ws.bytesin - handshake, sws.RECVSIZE)
+
+if __name__ == "__main__":
+    unittest.main()